@@ -0,0 +1,85 @@
+# Copyright (c) 2012 Spotify AB
+#
+# Licensed under the Apache License, Version 2.0 (the "License"); you may not
+# use this file except in compliance with the License. You may obtain a copy of
+# the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+# WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+# License for the specific language governing permissions and limitations under
+# the License.
+
+""" Tasks for backfilling a task over a date interval
+
+E.g. ``python my_tasks.py RangeDaily --of MyDailyTask --interval 2014-01``, where
+``my_tasks.py`` imports this module and calls ``luigi.run()``, runs ``MyDailyTask`` for
+each day in January 2014 that doesn't have its output yet.
+The task has to take the date (or datetime for :py:class:`RangeHourly`) as its first parameter.
+"""
+
+import task
+import parameter
+
+
+class RangeBase(task.WrapperTask):
+    """Requires the instances of a task over an interval whose outputs are missing.
+
+    Instances using the default ``complete()`` are checked with :py:func:`~luigi.task.bulk_complete`,
+    i.e. with one :py:meth:`~luigi.target.FileSystem.exists_many` call per file system, which e.g. HDFS
+    answers with one command instead of one per instance.
+    """
+    of = parameter.Parameter(description="Task family of the task to backfill")
+    interval = parameter.DateIntervalParameter()
+
+    def __init__(self, *args, **kwargs):
+        super(RangeBase, self).__init__(*args, **kwargs)
+        self._missing = None
+
+    def of_cls(self):
+        cls = task.Register.get_reg().get(self.of)
+        if cls is None:
+            raise Exception('No task %s' % self.of)
+        if cls == task.Register.AMBIGUOUS_CLASS:
+            raise Exception('%s is ambiguous' % self.of)
+        return cls
+
+    def values(self):
+        """Returns the dates or datetimes in the interval, one per task instance."""
+        raise NotImplementedError
+
+    def instances(self):
+        cls = self.of_cls()
+        return [cls(value) for value in self.values()]
+
+    def missing(self):
+        """Returns the instances that aren't complete, in order."""
+        instances = self.instances()
+        complete = task.bulk_complete(instances)
+        return [t for t in instances if not (complete[t.task_id] if t.task_id in complete else t.complete())]
+
+    def requires(self):
+        if self._missing is None:
+            self._missing = self.missing()
+        return self._missing
+
+    def complete(self):
+        # Always check again, the missing instances might have been run by now
+        self._missing = self.missing()
+        return not self._missing
+
+
+class RangeDaily(RangeBase):
+    """Backfills a task taking a date, for each day in the interval."""
+
+    def values(self):
+        return self.interval.dates()
+
+
+class RangeHourly(RangeBase):
+    """Backfills a task taking a datetime, for each hour in the interval."""
+
+    def values(self):
+        return list(self.interval.hours())
@@ -5,8 +5,15 @@ from ConfigParser import ConfigParser, NoOptionError, NoSectionError
 
 
 class LuigiConfigParser(ConfigParser):
+    """ Config parser that caches typed lookups until the config changes.
+
+    Functions registered with :py:meth:`add_change_listener` are called as
+    ``f(section, option)`` whenever a value is set, and as ``f(None, None)`` when
+    config files are (re)read.
+    """
     NO_DEFAULT = object()
     _instance = None
+    _change_listeners = []
     _config_paths = ['/etc/luigi/client.cfg', 'client.cfg']
     if 'LUIGI_CONFIG_PATH' in os.environ:
         _config_paths.append(os.environ['LUIGI_CONFIG_PATH'])
@@ -16,6 +23,14 @@ class LuigiConfigParser(ConfigParser):
         cls._config_paths.append(path)
         cls._instance.reload()
 
+    @classmethod
+    def add_change_listener(cls, f):
+        cls._change_listeners.append(f)
+
+    @classmethod
+    def remove_change_listener(cls, f):
+        cls._change_listeners.remove(f)
+
     @classmethod
     def instance(cls, *args, **kwargs):
         """ Singleton getter """
@@ -26,23 +41,54 @@ class LuigiConfigParser(ConfigParser):
 
         return cls._instance
 
+    def __init__(self, *args, **kwargs):
+        ConfigParser.__init__(self, *args, **kwargs)
+        self._cache = {}
+
     def reload(self):
         return self._instance.read(self._config_paths)
 
+    def _changed(self, section=None, option=None):
+        self._cache.clear()
+        for f in self._change_listeners:
+            f(section, option)
+
+    def read(self, filenames):
+        try:
+            return ConfigParser.read(self, filenames)
+        finally:
+            self._changed()
+
+    def readfp(self, fp, filename=None):
+        try:
+            return ConfigParser.readfp(self, fp, filename)
+        finally:
+            self._changed()
+
     def _get_with_default(self, method, section, option, default, expected_type=None):
         """ Gets the value of the section/option using method. Returns default if value
         is not found. Raises an exception if the default value is not None and doesn't match
         the expected_type.
+
+        Values, and the fact that a value is missing, are cached per method until the config changes.
         """
+        key = (method, section, option)
         try:
-            return method(self, section, option)
-        except (NoOptionError, NoSectionError):
+            value = self._cache[key]
+        except KeyError:
+            try:
+                value = method(self, section, option)
+            except (NoOptionError, NoSectionError), e:
+                value = e
+            self._cache[key] = value
+        if isinstance(value, (NoOptionError, NoSectionError)):
             if default is LuigiConfigParser.NO_DEFAULT:
-                raise
+                raise value
             if expected_type is not None and default is not None and \
                not isinstance(default, expected_type):
-                raise
+                raise value
             return default
+        return value
 
     def get(self, section, option, default=NO_DEFAULT):
         return self._get_with_default(ConfigParser.get, section, option, default)
@@ -60,7 +106,22 @@ class LuigiConfigParser(ConfigParser):
         if not ConfigParser.has_section(self, section):
             ConfigParser.add_section(self, section)
 
-        return ConfigParser.set(self, section, option, value)
+        try:
+            return ConfigParser.set(self, section, option, value)
+        finally:
+            self._changed(section, option)
+
+    def remove_option(self, section, option):
+        try:
+            return ConfigParser.remove_option(self, section, option)
+        finally:
+            self._changed(section, option)
+
+    def remove_section(self, section):
+        try:
+            return ConfigParser.remove_section(self, section)
+        finally:
+            self._changed(section)
 
 def get_config():
     """ Convenience method (for backwards compatibility) for accessing config singleton """
@@ -17,10 +17,26 @@ import datetime
 
 
 class DateInterval(object):
+    # Intervals are often created in bulk, so keep them small. They are immutable, since parsed
+    # intervals are shared (see DateIntervalParameter.parse)
+    __slots__ = ('date_a', 'date_b')
+
     def __init__(self, date_a, date_b):
         # Represents all date d such that date_a <= d < date_b
-        self.date_a = date_a
-        self.date_b = date_b
+        object.__setattr__(self, 'date_a', date_a)
+        object.__setattr__(self, 'date_b', date_b)
+
+    def __setattr__(self, name, value):
+        if name in DateInterval.__slots__:
+            raise AttributeError('DateInterval is immutable, can not set %s' % name)
+        object.__setattr__(self, name, value)
+
+    def __getstate__(self):
+        # Objects with __slots__ can't be pickled by the default protocol (tasks are pickled for Hadoop)
+        return (self.date_a, self.date_b)
+
+    def __setstate__(self, state):
+        DateInterval.__init__(self, *state)
 
     def dates(self):
         dates = []
@@ -67,7 +83,7 @@ class DateInterval(object):
             yield d
 
     def __hash__(self):
-        return hash(repr(self))
+        return hash((type(self), self.date_a, self.date_b))
 
     def __cmp__(self, other):
         if type(self) != type(other):
@@ -86,6 +102,8 @@ class DateInterval(object):
 
 
 class Date(DateInterval):
+    __slots__ = ()
+
     def __init__(self, y, m, d):
         a = datetime.date(y, m, d)
         b = datetime.date(y, m, d) + datetime.timedelta(1)
@@ -105,6 +123,8 @@ class Date(DateInterval):
 
 
 class Week(DateInterval):
+    __slots__ = ()
+
     def __init__(self, y, w):
         # Python datetime does not have a method to convert from ISO weeks!
         for d in xrange(-10, 370):
@@ -132,6 +152,8 @@ class Week(DateInterval):
 
 
 class Month(DateInterval):
+    __slots__ = ()
+
     def __init__(self, y, m):
         date_a = datetime.date(y, m, 1)
         date_b = datetime.date(y + m / 12, 1 + m % 12, 1)
@@ -152,6 +174,8 @@ class Month(DateInterval):
 
 
 class Year(DateInterval):
+    __slots__ = ()
+
     def __init__(self, y):
         date_a = datetime.date(y, 1, 1)
         date_b = datetime.date(y + 1, 1, 1)
@@ -171,6 +195,8 @@ class Year(DateInterval):
 
 
 class Custom(DateInterval):
+    __slots__ = ()
+
     def to_string(self):
         return '-'.join([d.strftime('%Y-%m-%d') for d in (self.date_a, self.date_b)])
 
@@ -12,8 +12,12 @@
 # License for the specific language governing permissions and limitations under
 # the License.
 
+import ctypes
+import errno
+import mmap
 import os
 import random
+import sys
 import tempfile
 import shutil
 from target import FileSystem, FileSystemTarget
@@ -47,6 +51,99 @@ class atomic_file(file):
         return file.__exit__(self, exc_type, exc, traceback)
 
 
+class MappedFile(mmap.mmap):
+    """ Read-only memory map of a local file, as returned by File.open('r', use_mmap=True)
+
+    Supports slicing, find() and the buffer interface (e.g. re, struct.unpack_from) without
+    reading the file into memory.
+    """
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, traceback):
+        self.close()
+
+
+def map_file(path):
+    """ Maps a non-empty file read-only into memory """
+    with open(path, 'rb') as f:
+        if os.fstat(f.fileno()).st_size == 0:
+            raise ValueError('Can not memory map empty file: %s' % path)
+        return MappedFile(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+
+COPY_CHUNK_SIZE = 1024 * 1024
+_KERNEL_COPY_CHUNK_SIZE = 1 << 30
+_kernel_copy = None
+
+
+def _kernel_copy_functions():
+    """ Returns copy_file_range and sendfile as functions of (in_fd, out_fd, count), as available
+
+    Python 2 has neither os.sendfile nor os.copy_file_range, so they are called in libc directly.
+    Only on Linux, other platforms have different signatures (or lack them).
+    """
+    global _kernel_copy
+    if _kernel_copy is None:
+        _kernel_copy = []
+        if sys.platform.startswith('linux'):
+            try:
+                libc = ctypes.CDLL(None, use_errno=True)
+            except OSError:
+                libc = None
+            if hasattr(libc, 'copy_file_range'):
+                copy_file_range = libc.copy_file_range
+                copy_file_range.argtypes = [ctypes.c_int, ctypes.c_void_p, ctypes.c_int, ctypes.c_void_p, ctypes.c_size_t, ctypes.c_uint]
+                copy_file_range.restype = ctypes.c_ssize_t
+                _kernel_copy.append(lambda in_fd, out_fd, count: copy_file_range(in_fd, None, out_fd, None, count, 0))
+            if hasattr(libc, 'sendfile'):
+                sendfile = libc.sendfile
+                sendfile.argtypes = [ctypes.c_int, ctypes.c_int, ctypes.c_void_p, ctypes.c_size_t]
+                sendfile.restype = ctypes.c_ssize_t
+                _kernel_copy.append(lambda in_fd, out_fd, count: sendfile(out_fd, in_fd, None, count))
+    return _kernel_copy
+
+
+def _copy_fd(in_fd, out_fd):
+    for kernel_copy in _kernel_copy_functions():
+        while True:
+            copied = kernel_copy(in_fd, out_fd, _KERNEL_COPY_CHUNK_SIZE)
+            if copied == 0:
+                return
+            if copied < 0:
+                err = ctypes.get_errno()
+                if err == errno.EINTR:
+                    continue
+                if err in (errno.ENOSYS, errno.EXDEV, errno.EINVAL, errno.EOPNOTSUPP):
+                    break  # not supported for these files, try the next way from the current offsets
+                raise OSError(err, os.strerror(err))
+    while True:
+        data = os.read(in_fd, COPY_CHUNK_SIZE)
+        if not data:
+            return
+        written = 0
+        while written < len(data):
+            written += os.write(out_fd, buffer(data, written))
+
+
+def copy_file(src, dst):
+    """ Copies the contents and permission bits of src to dst
+
+    The data is copied within the kernel using copy_file_range or sendfile where possible (which
+    also allows reflinks and server side copies), falling back to reading and writing chunks.
+    """
+    in_fd = os.open(src, os.O_RDONLY)
+    try:
+        out_fd = os.open(dst, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0666)
+        try:
+            _copy_fd(in_fd, out_fd)
+        finally:
+            os.close(out_fd)
+    finally:
+        os.close(in_fd)
+    shutil.copymode(src, dst)
+
+
 class LocalFileSystem(FileSystem):
     """ Wrapper for access to file system operations
 
@@ -80,7 +177,12 @@ class File(FileSystemTarget):
         self.format = format
         self.is_tmp = is_tmp
 
-    def open(self, mode='r'):
+    def open(self, mode='r', use_mmap=False):
+        """ Opens the file for reading or (atomic) writing
+
+        With use_mmap=True the file is instead mapped read-only into memory and returned as a
+        MappedFile, which only works for non-empty files without a format.
+        """
         if mode == 'w':
             # Create folder if it does not exist
             normpath = os.path.normpath(self.path)
@@ -94,6 +196,10 @@ class File(FileSystemTarget):
                 return atomic_file(self.path)
 
         elif mode == 'r':
+            if use_mmap:
+                if self.format:
+                    raise ValueError('Can not memory map a file with a format')
+                return map_file(self.path)
             fileobj = FileWrapper(open(self.path, 'r'))
             if self.format:
                 return self.format.pipe_reader(fileobj)
@@ -107,7 +213,25 @@ class File(FileSystemTarget):
         d = os.path.dirname(new_path)
         if d and not os.path.exists(d):
             self.fs.mkdir(d)
-        os.rename(self.path, new_path)
+        try:
+            os.rename(self.path, new_path)
+        except OSError, e:
+            if e.errno != errno.EXDEV:
+                raise
+            # Another file system, copy to a temporary file next to new_path and rename it in place
+            if os.path.isdir(self.path):
+                shutil.move(self.path, new_path)
+                return
+            tmp_path = new_path + '-luigi-tmp-%09d' % random.randrange(0, 1e10)
+            try:
+                copy_file(self.path, tmp_path)
+                os.rename(tmp_path, new_path)
+            except:
+                exc_info = sys.exc_info()
+                if os.path.exists(tmp_path):
+                    os.remove(tmp_path)
+                raise exc_info[0], exc_info[1], exc_info[2]
+            os.remove(self.path)
 
     def move_dir(self, new_path):
         self.move(new_path)
@@ -120,7 +244,7 @@ class File(FileSystemTarget):
             raise RuntimeError('Destination exists: %s' % new_path)
         tmp = File(new_path + '-luigi-tmp-%09d' % random.randrange(0, 1e10), is_tmp=True)
         tmp.open('w')
-        shutil.copy(self.path, tmp.fn)
+        copy_file(self.path, tmp.fn)
         tmp.move(new_path)
 
     @property
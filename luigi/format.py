@@ -12,8 +12,16 @@
 # License for the specific language governing permissions and limitations under
 # the License.
 
+import bz2
+import collections
+import multiprocessing
+import multiprocessing.pool
+import os
+import struct
 import subprocess
 import signal
+import threading
+import zlib
 
 
 class FileWrapper(object):
@@ -41,13 +49,32 @@ class FileWrapper(object):
         return iter(self._subpipe)
 
 
+def _record_batches(read, size):
+    """Yields lists of the lines, without line breaks, of the data ``read(size)`` returns"""
+    pending = ''
+    while True:
+        chunk = read(size)
+        if not chunk:
+            break
+        records = (pending + chunk).split('\n')
+        pending = records.pop()
+        if records:
+            yield records
+    if pending:
+        yield [pending]
+
+
 class InputPipeProcessWrapper(object):
-    def __init__(self, command, input_pipe=None):
+    buffer_size = 1024 * 1024  # bytes buffered from the subprocess
+
+    def __init__(self, command, input_pipe=None, buffer_size=None):
         '''
         @param command a subprocess.Popen instance with stdin=input_pipe and
         stdout=subprocess.PIPE. Alternatively, just its args argument as a
         convenience.
         '''
+        if buffer_size is not None:
+            self.buffer_size = buffer_size
         self._command = command
         self._input_pipe = input_pipe
         self._process = command if isinstance(command, subprocess.Popen) else self.create_subprocess(command)
@@ -68,6 +95,7 @@ class InputPipeProcessWrapper(object):
         return subprocess.Popen(command,
                                 stdin=self._input_pipe,
                                 stdout=subprocess.PIPE,
+                                bufsize=self.buffer_size,
                                 preexec_fn=subprocess_setup,
                                 close_fds=True)
 
@@ -118,26 +146,45 @@ class InputPipeProcessWrapper(object):
             yield line
         self._finish()
 
+    def read(self, *args):
+        return self._process.stdout.read(*args)
+
+    def readline(self, *args):
+        return self._process.stdout.readline(*args)
+
+    def readinto(self, b):
+        return self._process.stdout.readinto(b)
+
+    def iter_batches(self, size=None):
+        """Yields lists of records, the lines without their line breaks, reading ``size`` bytes at a time.
+
+        Much faster than iterating line by line for small records.
+        """
+        for batch in _record_batches(self._process.stdout.read, size or self.buffer_size):
+            yield batch
+        self._finish()
+
 
 class OutputPipeProcessWrapper(object):
-    WRITES_BEFORE_FLUSH = 10000
+    buffer_size = 1024 * 1024  # bytes buffered before writing to the subprocess
 
-    def __init__(self, command, output_pipe=None):
+    def __init__(self, command, output_pipe=None, buffer_size=None):
+        if buffer_size is not None:
+            self.buffer_size = buffer_size
         self.closed = False
         self._command = command
         self._output_pipe = output_pipe
         self._process = subprocess.Popen(command,
                                          stdin=subprocess.PIPE,
                                          stdout=output_pipe,
+                                         bufsize=self.buffer_size,
                                          close_fds=True)
-        self._flushcount = 0
 
     def write(self, *args, **kwargs):
         self._process.stdin.write(*args, **kwargs)
-        self._flushcount += 1
-        if self._flushcount == self.WRITES_BEFORE_FLUSH:
-            self._process.stdin.flush()
-            self._flushcount = 0
+
+    def writelines(self, lines):
+        self._process.stdin.writelines(lines)
 
     def writeLine(self, line):
         assert '\n' not in line
@@ -181,6 +228,137 @@ class OutputPipeProcessWrapper(object):
         return getattr(self._process.stdin, name)
 
 
+class Pump(threading.Thread):
+    """Copies data between a file like object and one end of an OS pipe, so subprocesses can use it.
+
+    ``pipe_file`` is the pipe's end on this side, closed when done.
+    """
+
+    def __init__(self, read, write, pipe_file):
+        super(Pump, self).__init__()
+        self.daemon = True
+        self._read = read
+        self._write = write
+        self._pipe_file = pipe_file
+        self.error = None
+
+    def run(self):
+        try:
+            while True:
+                data = self._read()
+                if not data:
+                    break
+                self._write(data)
+        except (IOError, OSError), e:
+            self.error = e
+        finally:
+            try:
+                self._pipe_file.close()
+            except (IOError, OSError):
+                pass  # the other side is gone
+
+
+class ChunkedReader(object):
+    """Base for file like objects reading the chunks returned by ``_read_chunk()``, which returns '' at the end.
+
+    ``fileno()`` copies the chunks to a pipe from a separate thread, so they can be
+    fed to the subprocesses of :py:meth:`Format.pipe_reader`.
+    """
+
+    def __init__(self):
+        self._buffer = ''
+        self._pos = 0
+        self._fd = None
+        self.closed = False
+
+    def _read_chunk(self):
+        raise NotImplementedError()
+
+    def _close_source(self):
+        """Releases whatever the chunks come from. Not called while a pipe is being fed."""
+        pass
+
+    def read(self, size=-1):
+        chunks = [self._buffer[self._pos:]]
+        length = len(chunks[0])
+        while size < 0 or length < size:
+            chunk = self._read_chunk()
+            if not chunk:
+                break
+            chunks.append(chunk)
+            length += len(chunk)
+        data = ''.join(chunks)
+        if size < 0 or len(data) <= size:
+            self._buffer, self._pos = '', 0
+            return data
+        self._buffer, self._pos = data, size
+        return data[:size]
+
+    def readline(self):
+        while True:
+            i = self._buffer.find('\n', self._pos)
+            if i >= 0:
+                line = self._buffer[self._pos:i + 1]
+                self._pos = i + 1
+                return line
+            chunk = self._read_chunk()
+            if not chunk:
+                line = self._buffer[self._pos:]
+                self._buffer, self._pos = '', 0
+                return line
+            self._buffer = self._buffer[self._pos:] + chunk
+            self._pos = 0
+
+    def __iter__(self):
+        pending = self._buffer[self._pos:]
+        self._buffer, self._pos = '', 0
+        while True:
+            chunk = self._read_chunk()
+            if not chunk:
+                break
+            lines = (pending + chunk).split('\n')
+            pending = lines.pop()
+            for line in lines:
+                yield line + '\n'
+        if pending:
+            yield pending
+        self.close()
+
+    def readinto(self, b):
+        data = self.read(len(b))
+        b[:len(data)] = data
+        return len(data)
+
+    def iter_batches(self, size=1024 * 1024):
+        """Yields lists of records, the lines without their line breaks, reading ``size`` bytes at a time"""
+        for batch in _record_batches(self.read, size):
+            yield batch
+        self.close()
+
+    def fileno(self):
+        """Returns the read end of a pipe the chunks are copied to, e.g. for a decompressing subprocess"""
+        if self._fd is None:
+            self._fd, write_fd = os.pipe()
+            write_file = os.fdopen(write_fd, 'wb')
+            Pump(self._read_chunk, write_file.write, write_file).start()
+        return self._fd
+
+    def close(self):
+        self.closed = True
+        if self._fd is not None:
+            # the pump thread is reading, it stops once the pipe is closed
+            os.close(self._fd)
+            self._fd = None
+        else:
+            self._close_source()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, type, value, traceback):
+        self.close()
+
+
 class Format(object):
     """ Interface for format specifications """
 
@@ -203,7 +381,634 @@ class Format(object):
         raise NotImplementedError()
 
 
+class _Prefixed(ChunkedReader):
+    """Reads ``prefix`` and then the rest of ``input_pipe``, for when the start of it has been peeked at"""
+    chunk_size = 1024 * 1024
+
+    def __init__(self, prefix, input_pipe):
+        super(_Prefixed, self).__init__()
+        self._prefix = prefix
+        self._input_pipe = input_pipe
+
+    def _read_chunk(self):
+        if self._prefix:
+            data, self._prefix = self._prefix, ''
+            return data
+        return self._input_pipe.read(self.chunk_size)
+
+    def _close_source(self):
+        self._input_pipe.close()
+
+
+def _stream_finished(decompressor):
+    """Whether ``decompressor`` has reached the end of its stream, probing a copy with an extra byte if it can't tell
+
+    After the end, more input is left in ``unused_data`` (or raises EOFError, for bz2) instead of being consumed.
+    """
+    eof = getattr(decompressor, 'eof', None)
+    if eof is not None:
+        return eof
+    probe = decompressor.copy() if hasattr(decompressor, 'copy') else decompressor
+    try:
+        probe.decompress('x')
+    except EOFError:
+        return True
+    except Exception:
+        return False
+    return probe.unused_data == 'x'
+
+
+class CodecReader(ChunkedReader):
+    """Decompresses what's read from ``input_pipe``, in-process.
+
+    ``decompressor`` creates a decompression object like :py:func:`zlib.decompressobj`. A new one
+    is created for each stream in the input, so concatenated files are read like gunzip does.
+    Raises IOError if the input ends within a stream.
+    """
+    chunk_size = 1024 * 1024
+
+    def __init__(self, input_pipe, decompressor):
+        super(CodecReader, self).__init__()
+        self._input_pipe = input_pipe
+        self._new_decompressor = decompressor
+        self._decompressor = decompressor()
+        self._pending = ''
+        self._started = False
+
+    def _read_chunk(self):
+        while not self.closed:
+            data = self._pending or self._input_pipe.read(self.chunk_size)
+            self._pending = ''
+            if not data:
+                return self._finish()
+            self._started = True
+            try:
+                decompressed = self._decompressor.decompress(data)
+                unused = self._decompressor.unused_data
+            except EOFError:
+                decompressed, unused = '', data  # bz2, after the end of a stream: the next one starts here
+            if unused or getattr(self._decompressor, 'eof', False):
+                self._pending = unused or ''
+                self._decompressor = self._new_decompressor()
+                self._started = False
+            if decompressed:
+                return decompressed
+        return ''
+
+    def _finish(self):
+        if not self._started:
+            return ''
+        if not _stream_finished(self._decompressor):
+            raise IOError('Truncated compressed stream')
+        self._started = False
+        return self._decompressor.flush() if hasattr(self._decompressor, 'flush') else ''
+
+    def _close_source(self):
+        self._input_pipe.close()
+
+
+class CodecWriter(object):
+    """Compresses what's written to it with ``compressor``, in-process, and writes it to ``output_pipe``.
+
+    Writes are buffered up to ``buffer_size`` bytes before being compressed. ``fileno()`` returns
+    the write end of a pipe that is copied into the writer from a separate thread, so that
+    subprocesses can write to it as they could to the compressing subprocess it replaces.
+    Data written to the pipe only comes after that of write() calls made before fileno().
+    """
+    buffer_size = 1024 * 1024
+    pipe_chunk_size = 64 * 1024  # bytes read from the fileno() pipe at a time
+
+    def __init__(self, output_pipe, compressor):
+        self._output_pipe = output_pipe
+        self._compressor = compressor
+        self._buffer = []
+        self._buffered = 0
+        self._fd = None
+        self._pump = None
+        self.closed = False
+
+    @property
+    def name(self):
+        return getattr(self._output_pipe, 'name', '<%s>' % type(self).__name__)
+
+    def fileno(self):
+        if self._fd is None:
+            read_fd, self._fd = os.pipe()
+            read_file = os.fdopen(read_fd, 'rb')
+            self._pump = Pump(lambda: os.read(read_fd, self.pipe_chunk_size), self.write, read_file)
+            self._pump.start()
+        return self._fd
+
+    def _close_pipe(self):
+        """Waits for everything written to the fileno() pipe, once the writers have closed it as well"""
+        if self._fd is not None:
+            os.close(self._fd)
+            self._fd = None
+            self._pump.join()
+            if self._pump.error is not None:
+                raise self._pump.error
+
+    def write(self, data):
+        self._buffer.append(data)
+        self._buffered += len(data)
+        if self._buffered >= self.buffer_size:
+            self._compress()
+
+    def writeLine(self, line):
+        assert '\n' not in line
+        self.write(line + '\n')
+
+    def writelines(self, lines):
+        self.write(''.join(lines))
+
+    def _compress(self):
+        compressed = self._compressor.compress(''.join(self._buffer))
+        self._buffer = []
+        self._buffered = 0
+        if compressed:
+            self._output_pipe.write(compressed)
+
+    def flush(self):
+        self._compress()
+        self._output_pipe.flush()
+
+    def close(self):
+        if not self.closed:
+            self._close_pipe()
+            self._compress()
+            self._output_pipe.write(self._compressor.flush())
+            self.closed = True
+            self._output_pipe.close()
+
+    def abort(self):
+        # Like OutputPipeProcessWrapper, leaves output_pipe unclosed, so that it isn't committed
+        self.closed = True
+        try:
+            self._close_pipe()
+        except (IOError, OSError):
+            pass
+        self._buffer = []
+
+    def __del__(self):
+        if not self.closed:
+            self.abort()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, type, value, traceback):
+        if type is None:
+            self.close()
+        else:
+            self.abort()
+
+
 class Gzip(Format):
+    """Gzip compression, done in-process with :py:mod:`zlib`"""
+    compression_level = 6  # same as the gzip command
+
+    @classmethod
+    def pipe_reader(cls, input_pipe):
+        return CodecReader(input_pipe, lambda: zlib.decompressobj(16 + zlib.MAX_WBITS))
+
+    @classmethod
+    def pipe_writer(cls, output_pipe):
+        return CodecWriter(output_pipe, zlib.compressobj(cls.compression_level, zlib.DEFLATED, 16 + zlib.MAX_WBITS))
+
+
+class Bzip2(Format):
+    """Bzip2 compression, done in-process with :py:mod:`bz2`"""
+    compression_level = 9  # same as the bzip2 command
+
+    @classmethod
+    def pipe_reader(cls, input_pipe):
+        return CodecReader(input_pipe, bz2.BZ2Decompressor)
+
+    @classmethod
+    def pipe_writer(cls, output_pipe):
+        return CodecWriter(output_pipe, bz2.BZ2Compressor(cls.compression_level))
+
+
+# BGZF (as in samtools) is gzip made of independent members of at most 64 KB, each with its
+# compressed size in a "BC" extra field. Members can be found and decompressed separately.
+BGZF_BLOCK_SIZE = 0xff00  # uncompressed, leaves room for incompressible data
+BGZF_EOF = ('\x1f\x8b\x08\x04\x00\x00\x00\x00\x00\xff\x06\x00BC\x02\x00\x1b\x00'
+            '\x03\x00\x00\x00\x00\x00\x00\x00\x00\x00')
+
+
+_thread_pools = {}
+_thread_pools_lock = threading.Lock()
+
+
+def _thread_pool(workers):
+    """Returns a pool of ``workers`` threads, shared by everything in this process that asks for as many"""
+    key = (os.getpid(), workers)
+    with _thread_pools_lock:
+        if key not in _thread_pools:
+            _thread_pools[key] = multiprocessing.pool.ThreadPool(workers)
+        return _thread_pools[key]
+
+
+def _bgzf_compress(data, level):
+    """Returns ``data`` as BGZF blocks, and the compressed size of each block"""
+    blocks = []
+    for start in xrange(0, len(data), BGZF_BLOCK_SIZE):
+        chunk = data[start:start + BGZF_BLOCK_SIZE]
+        compressor = zlib.compressobj(level, zlib.DEFLATED, -zlib.MAX_WBITS)
+        deflated = compressor.compress(chunk) + compressor.flush()
+        blocks.append(struct.pack('<4BI2BH2sHH', 0x1f, 0x8b, 8, 4, 0, 0, 0xff, 6, 'BC', 2, len(deflated) + 25))
+        blocks.append(deflated)
+        blocks.append(struct.pack('<II', zlib.crc32(chunk) & 0xffffffff, len(chunk)))
+    return ''.join(blocks), [len(blocks[i]) + len(blocks[i + 1]) + 8 for i in xrange(0, len(blocks), 3)]
+
+
+def _bgzf_block_size(data, offset):
+    """Returns the size of the BGZF block at ``offset``, None if it's incomplete, or -1 if it's not BGZF"""
+    if len(data) < offset + 12:
+        return None
+    if data[offset:offset + 4] != '\x1f\x8b\x08\x04':
+        return -1
+    xlen, = struct.unpack('<H', data[offset + 10:offset + 12])
+    extra = data[offset + 12:offset + 12 + xlen]
+    if len(extra) < xlen:
+        return None
+    i = 0
+    while i + 4 <= xlen:
+        subfield, length = struct.unpack('<2sH', extra[i:i + 4])
+        if subfield == 'BC' and length == 2:
+            size, = struct.unpack('<H', extra[i + 4:i + 6])
+            return size + 1 if len(data) >= offset + size + 1 else None
+        i += 4 + length
+    return -1
+
+
+def _bgzf_decompress(blocks):
+    return ''.join(zlib.decompress(block, 16 + zlib.MAX_WBITS) for block in blocks)
+
+
+class BlockGzipWriter(CodecWriter):
+    """Writes BGZF to ``output_pipe``, compressing ``buffer_size`` bytes at a time on a pool of ``workers`` threads.
+
+    zlib releases the GIL while it works, so the threads use multiple cores. After close(),
+    ``index`` has the compressed and uncompressed offset of each block.
+    """
+    buffer_size = 16 * BGZF_BLOCK_SIZE
+
+    def __init__(self, output_pipe, workers, compression_level=6):
+        super(BlockGzipWriter, self).__init__(output_pipe, None)
+        self._workers = workers
+        self._level = compression_level
+        self._pool = _thread_pool(workers)
+        self._compressing = collections.deque()
+        self._offsets = [0, 0]
+        self.index = []
+
+    def _compress(self, final=False):
+        # Only full blocks, unless it's the end, so that blocks don't get smaller than they need to be
+        data = ''.join(self._buffer)
+        end = len(data) if final else len(data) - len(data) % BGZF_BLOCK_SIZE
+        self._buffer = [data[end:]] if end < len(data) else []
+        self._buffered = len(data) - end
+        if end:
+            self._compressing.append((self._pool.apply_async(_bgzf_compress, (data[:end], self._level)), end))
+        while len(self._compressing) > 2 * self._workers:
+            self._write_next()
+
+    def _write_next(self):
+        result, length = self._compressing.popleft()
+        compressed, sizes = result.get()
+        for size in sizes:
+            self.index.append(tuple(self._offsets))
+            self._offsets[0] += size
+            self._offsets[1] += min(length, BGZF_BLOCK_SIZE)
+            length -= BGZF_BLOCK_SIZE
+        self._output_pipe.write(compressed)
+
+    def flush(self):
+        self._compress(final=True)
+        while self._compressing:
+            self._write_next()
+        self._output_pipe.flush()
+
+    def close(self):
+        if not self.closed:
+            self._close_pipe()
+            self._compress(final=True)
+            while self._compressing:
+                self._write_next()
+            self._output_pipe.write(BGZF_EOF)
+            self.closed = True
+            self._output_pipe.close()
+
+    def abort(self):
+        super(BlockGzipWriter, self).abort()
+        self._compressing.clear()
+
+    def write_gzi(self, index_file):
+        """Writes ``index`` in the .gzi format of bgzip, for random access to the data"""
+        index_file.write(struct.pack('<Q', len(self.index) - 1))
+        for compressed_offset, offset in self.index[1:]:
+            index_file.write(struct.pack('<QQ', compressed_offset, offset))
+
+
+class BlockGzipReader(ChunkedReader):
+    """Decompresses the BGZF read from ``input_pipe`` on a pool of ``workers`` threads.
+
+    Falls back to reading serially from the first gzip member that isn't a BGZF block. Raises
+    IOError if the input is truncated, including BGZF without its end of file block.
+    """
+    chunk_size = 1024 * 1024
+
+    def __init__(self, input_pipe, workers):
+        super(BlockGzipReader, self).__init__()
+        self._input_pipe = input_pipe
+        self._workers = workers
+        self._pool = _thread_pool(workers)
+        self._decompressing = collections.deque()
+        self._data = ''
+        self._serial = None
+        self._last_block = None
+
+    def _submit(self):
+        """Starts decompressing blocks until enough are underway or there's no more input"""
+        while len(self._decompressing) < 2 * self._workers and self._serial is None:
+            data = self._input_pipe.read(self.chunk_size)
+            self._data += data
+            blocks, offset = [], 0
+            while True:
+                size = _bgzf_block_size(self._data, offset)
+                if size is None:
+                    break
+                if size < 0:
+                    self._serial = CodecReader(_Prefixed(self._data[offset:], self._input_pipe),
+                                               lambda: zlib.decompressobj(16 + zlib.MAX_WBITS))
+                    break
+                blocks.append(self._data[offset:offset + size])
+                offset += size
+            self._data = self._data[offset:]
+            if blocks:
+                self._last_block = blocks[-1]
+                self._decompressing.append(self._pool.apply_async(_bgzf_decompress, (blocks,)))
+            if not data:
+                if self._serial is None:
+                    if self._data:
+                        raise IOError('Truncated BGZF block at the end of the input')
+                    if self._last_block not in (None, BGZF_EOF):
+                        raise IOError('Truncated BGZF input, its end of file block is missing')
+                break
+
+    def _read_chunk(self):
+        while not self.closed:
+            self._submit()
+            if self._decompressing:
+                data = self._decompressing.popleft().get()
+            elif self._serial is not None:
+                data = self._serial._read_chunk()
+                if not data:
+                    return ''
+            else:
+                return ''
+            if data:
+                return data
+        return ''
+
+    def _close_source(self):
+        self._decompressing.clear()
+        self._input_pipe.close()
+
+
+class BlockGzip(Format):
+    """Gzip compression in independent blocks (BGZF), compressed and decompressed on all cores.
+
+    Any gzip reader can read the output. Reading other gzip files works too, but only uses one core.
+    """
+    workers = multiprocessing.cpu_count()
+    compression_level = 6
+
+    @classmethod
+    def pipe_reader(cls, input_pipe):
+        return BlockGzipReader(input_pipe, cls.workers)
+
+    @classmethod
+    def pipe_writer(cls, output_pipe):
+        return BlockGzipWriter(output_pipe, cls.workers, cls.compression_level)
+
+
+class LZ4(Format):
+    """LZ4 frame compression, fast enough for intermediate data. Requires the ``lz4`` package."""
+
+    @classmethod
+    def pipe_reader(cls, input_pipe):
+        import lz4.frame
+        return CodecReader(input_pipe, lz4.frame.LZ4FrameDecompressor)
+
+    @classmethod
+    def pipe_writer(cls, output_pipe):
+        import lz4.frame
+        compressor = lz4.frame.LZ4FrameCompressor()
+        output_pipe.write(compressor.begin())
+        return CodecWriter(output_pipe, compressor)
+
+
+ZSTD_MAGIC = 0xfd2fb528
+ZSTD_SKIPPABLE_MAGIC = 0x184d2a50  # to 0x184d2a5f
+
+
+class _ZstdFrames(object):
+    """Reads ``input_pipe``, following the zstd frame and block headers in it to tell if it ends within a frame.
+
+    The decompressor of the zstandard package for Python 2 reads truncated frames as if they ended there.
+    """
+
+    def __init__(self, input_pipe):
+        self._input_pipe = input_pipe
+        self._data = ''
+        self._skip = 0
+        self._next = self._frame_header
+        self._checksum = False
+
+    def read(self, size):
+        data = self._input_pipe.read(size)
+        self._data += data
+        offset = 0
+        while True:
+            skipped = min(self._skip, len(self._data) - offset)
+            self._skip -= skipped
+            offset += skipped
+            if self._skip:
+                break
+            header_size = self._next(self._data, offset)
+            if header_size is None:
+                break
+            offset += header_size
+        self._data = self._data[offset:]
+        return data
+
+    @property
+    def finished(self):
+        return self._next == self._frame_header and not self._skip and not self._data
+
+    def _frame_header(self, data, offset):
+        if len(data) < offset + 5:
+            return None
+        magic, descriptor = struct.unpack('<IB', data[offset:offset + 5])
+        if magic & 0xfffffff0 == ZSTD_SKIPPABLE_MAGIC:
+            if len(data) < offset + 8:
+                return None
+            self._skip, = struct.unpack('<I', data[offset + 4:offset + 8])
+            return 8
+        if magic != ZSTD_MAGIC:
+            raise IOError('Not a zstd frame')
+        single_segment = descriptor >> 5 & 1
+        self._checksum = bool(descriptor & 4)
+        self._next = self._block_header
+        return (5 + (not single_segment) + (0, 1, 2, 4)[descriptor & 3] +
+                (single_segment, 2, 4, 8)[descriptor >> 6])
+
+    def _block_header(self, data, offset):
+        if len(data) < offset + 3:
+            return None
+        low, high = struct.unpack('<HB', data[offset:offset + 3])
+        header = low | high << 16
+        block_type = header >> 1 & 3
+        if block_type == 3:
+            raise IOError('Corrupt zstd block')
+        self._skip = 1 if block_type == 1 else header >> 3  # RLE blocks are one byte
+        if header & 1:
+            self._next = self._frame_header
+            self._skip += 4 if self._checksum else 0
+        return 3
+
+
+class _ZstdReader(ChunkedReader):
+    chunk_size = 1024 * 1024
+
+    def __init__(self, input_pipe):
+        import zstandard
+        super(_ZstdReader, self).__init__()
+        self._input_pipe = input_pipe
+        self._frames = _ZstdFrames(input_pipe)
+        self._stream = zstandard.ZstdDecompressor().stream_reader(self._frames, read_across_frames=True)
+
+    def _read_chunk(self):
+        data = self._stream.read(self.chunk_size)
+        if not data and not self._frames.finished:
+            raise IOError('Truncated compressed stream')
+        return data
+
+    def _close_source(self):
+        self._input_pipe.close()
+
+
+class Zstd(Format):
+    """Zstandard compression. Requires the ``zstandard`` package.
+
+    Compresses about as well as gzip, several times faster.
+    """
+    compression_level = 3
+
+    @classmethod
+    def pipe_reader(cls, input_pipe):
+        return _ZstdReader(input_pipe)
+
+    @classmethod
+    def pipe_writer(cls, output_pipe):
+        import zstandard
+        return CodecWriter(output_pipe, zstandard.ZstdCompressor(level=cls.compression_level).compressobj())
+
+
+class _SnappyCompressor(object):
+    """Gives snappy's framing format compressor the interface of zlib's"""
+
+    def __init__(self):
+        import snappy
+        self._compressor = snappy.StreamCompressor()
+
+    def compress(self, data):
+        return self._compressor.add_chunk(data)
+
+    def flush(self):
+        return ''
+
+
+class _SnappyDecompressor(object):
+    """Gives snappy's framing format decompressor the interface of zlib's. Concatenated streams are one stream to it."""
+    unused_data = ''
+
+    def __init__(self):
+        import snappy
+        self._decompressor = snappy.StreamDecompressor()
+
+    def decompress(self, data):
+        return self._decompressor.decompress(data)
+
+    @property
+    def eof(self):
+        # The framing format has no end marker, but a stream can't end within a chunk
+        import snappy
+        try:
+            self._decompressor.copy().flush()
+        except snappy.UncompressError:
+            return False
+        return True
+
+    def flush(self):
+        return self._decompressor.flush()
+
+
+class Snappy(Format):
+    """Snappy compression, in its framing format. Requires the ``python-snappy`` package."""
+
+    @classmethod
+    def pipe_reader(cls, input_pipe):
+        return CodecReader(input_pipe, _SnappyDecompressor)
+
+    @classmethod
+    def pipe_writer(cls, output_pipe):
+        return CodecWriter(output_pipe, _SnappyCompressor())
+
+
+# The bytes each format's files start with
+MAGIC_BYTES = [
+    ('\x1f\x8b', BlockGzip),  # reads any gzip, using more cores for BGZF
+    ('BZh', Bzip2),
+    ('\x04\x22\x4d\x18', LZ4),
+    ('\x28\xb5\x2f\xfd', Zstd),
+    ('\xff\x06\x00\x00sNaPpY', Snappy),
+]
+
+
+def detect_format(data):
+    """Returns the compressed format whose files start like ``data``, or None"""
+    for magic, format in MAGIC_BYTES:
+        if data.startswith(magic):
+            return format
+    return None
+
+
+class AutoDetect(Format):
+    """Reads any of the compressed formats in :py:data:`MAGIC_BYTES`, recognized by their first bytes.
+
+    Anything else is read as is. Writes with the ``writer`` format, uncompressed by default,
+    so e.g. ``class Intermediate(AutoDetect): writer = LZ4`` reads anything and writes LZ4.
+    """
+    writer = None
+
+    @classmethod
+    def pipe_reader(cls, input_pipe):
+        prefix = input_pipe.read(max(len(magic) for magic, format in MAGIC_BYTES))
+        input_pipe = _Prefixed(prefix, input_pipe)
+        format = detect_format(prefix)
+        return format.pipe_reader(input_pipe) if format else input_pipe
+
+    @classmethod
+    def pipe_writer(cls, output_pipe):
+        return cls.writer.pipe_writer(output_pipe) if cls.writer else output_pipe
+
+
+class GzipSubprocess(Format):
+    """Gzip compression done by gzip and gunzip subprocesses"""
+
     @classmethod
     def pipe_reader(cls, input_pipe):
         return InputPipeProcessWrapper(['gunzip'], input_pipe)
@@ -213,7 +1018,9 @@ class Gzip(Format):
         return OutputPipeProcessWrapper(['gzip'], output_pipe)
 
 
-class Bzip2(Format):
+class Bzip2Subprocess(Format):
+    """Bzip2 compression done by bzip2 and bzcat subprocesses"""
+
     @classmethod
     def pipe_reader(cls, input_pipe):
         return InputPipeProcessWrapper(['bzcat'], input_pipe)
@@ -221,4 +1028,3 @@ class Bzip2(Format):
     @classmethod
     def pipe_writer(cls, output_pipe):
         return OutputPipeProcessWrapper(['bzip2'], output_pipe)
-
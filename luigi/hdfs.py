@@ -14,8 +14,17 @@
 
 import subprocess
 import os
+import posixpath
+import sys
+import collections
+import Queue
+import errno
+import select
+import shlex
+import threading
 import random
 import tempfile
+import time
 import urlparse
 import luigi.format
 import datetime
@@ -25,6 +34,11 @@ import configuration
 import logging
 logger = logging.getLogger('luigi-interface')
 
+try:
+    import simplejson as json
+except ImportError:
+    import json
+
 
 class HDFSCliError(Exception):
     def __init__(self, command, returncode, stdout, stderr):
@@ -48,6 +62,106 @@ def call_check(command):
     return stdout
 
 
+class HdfsCommandDaemon(object):
+    """Runs hadoop commands through one long-lived helper process, to avoid starting a JVM per command.
+
+    The helper is started with ``command`` and reads one request per line on stdin: a JSON list
+    of the arguments to ``hadoop``, e.g. ``["fs", "-stat", "/tmp"]``. For each request it writes
+    one line to stdout: a JSON object with the ``returncode``, ``stdout`` and ``stderr`` of
+    running them, e.g. by calling ``FsShell`` in a loop. A forked process starts its own helper.
+    See the configuration docs for such a helper.
+
+    If the helper breaks, it's stopped and all commands go through the command line instead.
+    """
+
+    def __init__(self, command, timeout=600):
+        if isinstance(command, basestring):
+            command = shlex.split(command)
+        self.command = command
+        self.timeout = timeout  # seconds to wait for the response to a command
+        self.failed = False  # set when the helper broke, all commands then go through the command line
+        self._process = None
+        self._pid = None
+        self._buffer = ''
+        self._lock = threading.Lock()
+
+    def _start(self):
+        logger.debug('Starting HDFS command daemon %r', self.command)
+        self._process = subprocess.Popen(self.command, stdin=subprocess.PIPE, stdout=subprocess.PIPE, close_fds=True)
+        self._pid = os.getpid()
+        self._buffer = ''
+
+    def call(self, args):
+        """Returns ``(returncode, stdout, stderr)`` of running hadoop with ``args``,
+        or None if the helper isn't usable and the command should go through the command line.
+
+        Raises HDFSCliError if the helper fails after being sent the command, since it might have
+        run it already, or if it doesn't respond within ``timeout`` seconds.
+        """
+        with self._lock:
+            if self.failed:
+                return None
+            try:
+                if self._process is None or self._pid != os.getpid() or self._process.poll() is not None:
+                    self._start()
+                self._process.stdin.write(json.dumps(list(args)) + '\n')
+                self._process.stdin.flush()
+            except (OSError, IOError), e:
+                self._fail(e)
+                return None
+            try:
+                response = json.loads(self._read_line())
+                return (response['returncode'],
+                        response['stdout'].encode('utf-8'),
+                        response['stderr'].encode('utf-8'))
+            except (OSError, IOError, ValueError, KeyError, TypeError, AttributeError), e:
+                self._fail(e)
+                raise HDFSCliError([load_hadoop_cmd()] + list(args), -1, '', 'HDFS command daemon failed: %s' % e)
+
+    def _read_line(self):
+        deadline = time.time() + self.timeout
+        fd = self._process.stdout.fileno()
+        while '\n' not in self._buffer:
+            remaining = deadline - time.time()
+            try:
+                readable = remaining > 0 and select.select([fd], [], [], remaining)[0]
+            except select.error, e:
+                if e.args[0] == errno.EINTR:
+                    continue
+                raise IOError(*e.args)
+            if not readable:
+                raise IOError('No response within %s seconds' % self.timeout)
+            data = os.read(fd, 65536)
+            if not data:
+                raise IOError('HDFS command daemon exited')
+            self._buffer += data
+        line, self._buffer = self._buffer.split('\n', 1)
+        return line
+
+    def _fail(self, error):
+        logger.warning('HDFS command daemon %r failed, using the command line instead: %s', self.command, error)
+        self.failed = True
+        self._close(kill=True)
+
+    def _close(self, kill=False):
+        if self._process is not None and self._pid == os.getpid():
+            if kill and self._process.poll() is None:
+                try:
+                    self._process.kill()
+                except OSError:
+                    pass  # just exited
+            try:
+                self._process.stdin.close()
+                self._process.wait()
+            except (OSError, IOError):
+                pass
+        self._process = None
+
+    def close(self):
+        with self._lock:
+            self._close()
+
+
 def get_hdfs_syntax():
     """
     CDH4 (hadoop 2+) has a slightly different syntax for interacting with
@@ -58,6 +172,8 @@ def get_hdfs_syntax():
     config = configuration.get_config()
     if config.getboolean("hdfs", "use_snakebite", False):
         return "snakebite"
+    if config.getboolean("hdfs", "use_webhdfs", False):
+        return "webhdfs"
     return config.get("hadoop", "version", "cdh4").lower()
 
 
@@ -80,6 +196,24 @@ def tmppath(path=None):
         sep = '/'
     return base + sep + (path + "-" if path else "") + "luigitemp-%08d" % random.randrange(1e9)
 
+def _batches(paths, max_length):
+    """Splits ``paths`` into lists whose total length stays below ``max_length`` characters"""
+    batch, length = [], 0
+    for path in paths:
+        if batch and length + len(path) > max_length:
+            yield batch
+            batch, length = [], 0
+        batch.append(path)
+        length += len(path) + 1
+    if batch:
+        yield batch
+
+
+# Lines of "hadoop fs -ls" are permissions, replication, owner, group, size, date, time and path.
+# The columns are padded with spaces, and the path can contain spaces too
+_LS_LINE = re.compile(r'^(\S)\S*\s.*?\s(\d+)\s+(\d{4}-\d\d-\d\d)\s+(\d\d:\d\d)\s(.*)$')
+
+
 def list_path(path):
     if isinstance(path, list) or isinstance(path, tuple):
         return path
@@ -88,18 +222,49 @@ def list_path(path):
     return [str(path), ]
 
 class HdfsClient(FileSystem):
-    """This client uses Apache 2.x syntax for file system commands, which also matched CDH4"""
+    """This client uses Apache 2.x syntax for file system commands, which also matched CDH4
+
+    If ``daemon_command`` (by default ``daemon_command`` in the ``[hdfs]`` section of the config)
+    is set, commands are sent to a :py:class:`HdfsCommandDaemon` instead of running ``hadoop``
+    for each of them. Commands go through the command line once the daemon has failed.
+    """
 
     recursive_listdir_cmd = ['-ls', '-R']
+    max_batch_length = 100000  # total length of the paths passed to a single batched command
+
+    def __init__(self, daemon_command=None):
+        if daemon_command is None:
+            daemon_command = configuration.get_config().get('hdfs', 'daemon_command', None)
+        self.daemon = None
+        if daemon_command:
+            timeout = configuration.get_config().getint('hdfs', 'daemon_timeout', 600)
+            self.daemon = HdfsCommandDaemon(daemon_command, timeout)
+
+    def _call(self, cmd):
+        """Returns ``(returncode, stdout, stderr)`` of running the hadoop command"""
+        if self.daemon is not None and cmd[0] == load_hadoop_cmd():
+            result = self.daemon.call(cmd[1:])
+            if result is not None:
+                return result
+        p = subprocess.Popen(cmd, stdout=subprocess.PIPE, stderr=subprocess.PIPE, close_fds=True)
+        stdout, stderr = p.communicate()
+        return p.returncode, stdout, stderr
+
+    def _call_check(self, cmd):
+        if self.daemon is None:
+            return call_check(cmd)
+        returncode, stdout, stderr = self._call(cmd)
+        if returncode != 0:
+            raise HDFSCliError(cmd, returncode, stdout, stderr)
+        return stdout
 
     def exists(self, path):
         """ Use ``hadoop fs -stat`` to check file existence
         """
 
         cmd = [load_hadoop_cmd(), 'fs', '-stat', path]
-        p = subprocess.Popen(cmd, stdout=subprocess.PIPE, stderr=subprocess.PIPE, close_fds=True)
-        stdout, stderr = p.communicate()
-        if p.returncode == 0:
+        returncode, stdout, stderr = self._call(cmd)
+        if returncode == 0:
             return True
         else:
             not_found_pattern = "^.*No such file or directory$"
@@ -107,7 +272,37 @@ class HdfsClient(FileSystem):
             for line in stderr.split('\n'):
                 if not_found_re.match(line):
                     return False
-            raise HDFSCliError(cmd, p.returncode, stdout, stderr)
+            raise HDFSCliError(cmd, returncode, stdout, stderr)
+
+    def exists_many(self, paths):
+        """ Check existence of many paths with a single ``hadoop fs -stat`` per batch of paths
+
+        Missing paths are told apart by their "No such file or directory" errors. If the
+        errors can't be attributed to paths, the batch is checked one path at a time.
+        """
+        result = []
+        for batch in _batches(paths, self.max_batch_length):
+            result.extend(self._exists_batch(batch))
+        return result
+
+    def _exists_batch(self, paths):
+        if len(paths) == 1:
+            return [self.exists(paths[0])]
+
+        returncode, stdout, stderr = self._call([load_hadoop_cmd(), 'fs', '-stat'] + paths)
+        if returncode == 0:
+            return [True] * len(paths)
+        missing = set()
+        for line in stderr.split('\n'):
+            match = re.match(r"^.*`(.*)': No such file or directory$", line)
+            if match:
+                missing.add(match.group(1))
+            elif line.startswith('stat:'):
+                missing = None  # some other error, let exists() deal with it
+                break
+        if not missing or not missing.issubset(paths):
+            return [self.exists(path) for path in paths]
+        return [path not in missing for path in paths]
 
     def rename(self, path, dest):
         parent_dir = os.path.dirname(dest)
@@ -118,26 +313,32 @@ class HdfsClient(FileSystem):
         else:
             import warnings
             warnings.warn("Renaming multiple files at once is not atomic.")
-        call_check([load_hadoop_cmd(), 'fs', '-mv'] + path + [dest])
+        self._call_check([load_hadoop_cmd(), 'fs', '-mv'] + path + [dest])
 
-    def remove(self, path, recursive=True, skip_trash=False):
+    def _remove_cmd(self, recursive):
         if recursive:
-            cmd = [load_hadoop_cmd(), 'fs', '-rm', '-r']
+            return [load_hadoop_cmd(), 'fs', '-rm', '-r']
         else:
-            cmd = [load_hadoop_cmd(), 'fs', '-rm']
+            return [load_hadoop_cmd(), 'fs', '-rm']
 
+    def remove(self, path, recursive=True, skip_trash=False):
+        self.remove_many([path], recursive, skip_trash)
+
+    def remove_many(self, paths, recursive=True, skip_trash=False):
+        """ Remove many paths with a single ``hadoop fs -rm`` per batch of paths
+        """
+        cmd = self._remove_cmd(recursive)
         if skip_trash:
             cmd = cmd + ['-skipTrash']
-
-        cmd = cmd + [path]
-        call_check(cmd)
+        for batch in _batches(paths, self.max_batch_length):
+            self._call_check(cmd + batch)
 
     def chmod(self, path, permissions, recursive=False):
         if recursive:
             cmd = [load_hadoop_cmd(), 'fs', '-chmod', '-R', permissions, path]
         else:
             cmd = [load_hadoop_cmd(), 'fs', '-chmod', permissions, path]
-        call_check(cmd)
+        self._call_check(cmd)
 
     def chown(self, path, owner, group, recursive=False):
         if owner is None:
@@ -149,39 +350,65 @@ class HdfsClient(FileSystem):
             cmd = [load_hadoop_cmd(), 'fs', '-chown', '-R', ownership, path]
         else:
             cmd = [load_hadoop_cmd(), 'fs', '-chown', ownership, path]
-        call_check(cmd)
+        self._call_check(cmd)
 
     def count(self, path):
         cmd = [load_hadoop_cmd(), 'fs', '-count', path]
-        stdout = call_check(cmd)
+        stdout = self._call_check(cmd)
         (dir_count, file_count, content_size, ppath) = stdout.split()
         results = {'content_size': content_size, 'dir_count': dir_count, 'file_count': file_count}
         return results
 
     def copy(self, path, destination):
-        call_check([load_hadoop_cmd(), 'fs', '-cp', path, destination])
+        self._call_check([load_hadoop_cmd(), 'fs', '-cp', path, destination])
 
     def put(self, local_path, destination):
-        call_check([load_hadoop_cmd(), 'fs', '-put', local_path, destination])
+        self._call_check([load_hadoop_cmd(), 'fs', '-put', local_path, destination])
 
     def get(self, path, local_destination):
-        call_check([load_hadoop_cmd(), 'fs', '-get', path, local_destination])
+        self._call_check([load_hadoop_cmd(), 'fs', '-get', path, local_destination])
 
     def getmerge(self, path, local_destination, new_line=False):
         if new_line:
             cmd = [load_hadoop_cmd(), 'fs', '-getmerge', '-nl', path, local_destination]
         else:
             cmd = [load_hadoop_cmd(), 'fs', '-getmerge', path, local_destination]
-        call_check(cmd)
+        self._call_check(cmd)
+
+    def _mkdir_cmd(self):
+        return [load_hadoop_cmd(), 'fs', '-mkdir', '-p']
 
     def mkdir(self, path):
-        try:
-            call_check([load_hadoop_cmd(), 'fs', '-mkdir', '-p', path])
-        except HDFSCliError, ex:
-            if "File exists" in ex.stderr:
-                raise FileAlreadyExists(ex.stderr)
-            else:
-                raise
+        self.mkdir_many([path])
+
+    def mkdir_many(self, paths):
+        """ Create many directories with a single ``hadoop fs -mkdir`` per batch of paths
+        """
+        for batch in _batches(paths, self.max_batch_length):
+            try:
+                self._call_check(self._mkdir_cmd() + batch)
+            except HDFSCliError, ex:
+                if "File exists" in ex.stderr:
+                    raise FileAlreadyExists(ex.stderr)
+                else:
+                    raise
+
+    def touchz(self, path):
+        self._call_check([load_hadoop_cmd(), 'fs', '-touchz', path])
+
+    def open_read(self, path):
+        return HdfsReadPipe(path)
+
+    def open_read_many(self, paths):
+        """ Reads the concatenation of ``paths`` with a single ``hadoop fs -cat``
+        """
+        return HdfsReadPipe(paths)
+
+    def open_write(self, path):
+        return HdfsAtomicWritePipe(path)
+
+    def open_write_dir(self, path, data_extension=""):
+        return HdfsAtomicWriteDirPipe(path, data_extension)
 
     def listdir(self, path, ignore_directories=False, ignore_files=False,
                 include_size=False, include_type=False, include_time=False, recursive=False):
@@ -192,7 +419,7 @@ class HdfsClient(FileSystem):
             cmd = [load_hadoop_cmd(), 'fs'] + self.recursive_listdir_cmd + [path]
         else:
             cmd = [load_hadoop_cmd(), 'fs', '-ls', path]
-        lines = call_check(cmd).split('\n')
+        lines = self._call_check(cmd).split('\n')
 
         for line in lines:
             if not line:
@@ -203,11 +430,12 @@ class HdfsClient(FileSystem):
                 continue
             elif ignore_files and line[0] == '-':
                 continue
-            data = line.split(' ')
-
-            file = data[-1]
-            size = int(data[-4])
-            line_type = line[0]
+            match = _LS_LINE.match(line)
+            if not match:
+                logger.warning('Could not parse hadoop fs -ls output: %s', line)
+                continue
+            line_type, size, date, time, file = match.groups()
+            size = int(size)
             extra_data = ()
 
             if include_size:
@@ -215,7 +443,7 @@ class HdfsClient(FileSystem):
             if include_type:
                 extra_data += (line_type,)
             if include_time:
-                time_str = '%sT%s' % (data[-3], data[-2])
+                time_str = '%sT%s' % (date, time)
                 modification_time = datetime.datetime.strptime(time_str,
                                                                '%Y-%m-%dT%H:%M')
                 extra_data += (modification_time,)
@@ -235,8 +463,7 @@ class SnakebiteHdfsClient(HdfsClient):
         try:
             from snakebite.client import Client
             self.config = configuration.get_config()
-            self._bite = None
-            self.pid = -1
+            self._local = threading.local()
         except Exception as err:    # IGNORE:broad-except
             raise RuntimeError("You must specify namenode_host and namenode_port "
                                "in the [hdfs] section of your luigi config in "
@@ -254,8 +481,11 @@ class SnakebiteHdfsClient(HdfsClient):
     def get_bite(self):
         """
         If Luigi has forked, we have a different PID, and need to reconnect.
+        Each thread gets a connection of its own, as they can't be shared.
         """
-        if self.pid != os.getpid() or not self._bite:
+        local = self._local
+        if getattr(local, 'pid', None) != os.getpid() or not getattr(local, 'bite', None):
+            local.pid = os.getpid()
             autoconfig_enabled = self.config.getboolean("hdfs", "snakebite_autoconfig", False)
             if autoconfig_enabled is True:
                 """
@@ -264,20 +494,20 @@ class SnakebiteHdfsClient(HdfsClient):
                 The behaviour is the same as Client.
                 """
                 from snakebite.client import AutoConfigClient
-                self._bite = AutoConfigClient()
+                local.bite = AutoConfigClient()
             else:
                 from snakebite.client import Client
                 try:
                     ver = self.config.getint("hdfs", "client_version")
                     if ver is None:
                         raise RuntimeError()
-                    self._bite = Client(self.config.get("hdfs", "namenode_host"),
-                                       self.config.getint("hdfs", "namenode_port"),
-                                       hadoop_version=ver)
+                    local.bite = Client(self.config.get("hdfs", "namenode_host"),
+                                        self.config.getint("hdfs", "namenode_port"),
+                                        hadoop_version=ver)
                 except:
-                    self._bite = Client(self.config.get("hdfs", "namenode_host"),
-                                       self.config.getint("hdfs", "namenode_port"))
-        return self._bite
+                    local.bite = Client(self.config.get("hdfs", "namenode_host"),
+                                        self.config.getint("hdfs", "namenode_port"))
+        return local.bite
 
     def exists(self, path):
         """
@@ -292,6 +522,9 @@ class SnakebiteHdfsClient(HdfsClient):
         except Exception as err:    # IGNORE:broad-except
             raise HDFSCliError("snakebite.test", -1, str(err), repr(err))
 
+    def exists_many(self, paths):
+        return [self.exists(path) for path in paths]
+
     def rename(self, path, dest):
         """
         Use snakebite.rename, if available.
@@ -323,6 +556,9 @@ class SnakebiteHdfsClient(HdfsClient):
         """
         return list(self.get_bite().delete(list_path(path), recurse=recursive))
 
+    def remove_many(self, paths, recursive=True, skip_trash=False):
+        return self.remove(list(paths), recursive, skip_trash)
+
     def chmod(self, path, permissions, recursive=False):
         """
         Use snakebite.chmod, if available.
@@ -410,6 +646,9 @@ class SnakebiteHdfsClient(HdfsClient):
         return list(bite.mkdir(list_path(path), create_parent=parents,
                                mode=mode))
 
+    def mkdir_many(self, paths, parents=True, mode=0755):
+        return list(self.get_bite().mkdir(list(paths), create_parent=parents, mode=mode))
+
     def listdir(self, path, ignore_directories=False, ignore_files=False,
                 include_size=False, include_type=False, include_time=False,
                 recursive=False):
@@ -453,29 +692,21 @@ class SnakebiteHdfsClient(HdfsClient):
 
 class HdfsClientCdh3(HdfsClient):
     """This client uses CDH3 syntax for file system commands"""
-    def mkdir(self, path):
+    def _mkdir_cmd(self):
         '''
         No -p switch, so this will fail creating ancestors
         '''
-        try:
-            call_check([load_hadoop_cmd(), 'fs', '-mkdir', path])
-        except HDFSCliError, ex:
-            if "File exists" in ex.stderr:
-                raise FileAlreadyExists(ex.stderr)
-            else:
-                raise
+        return [load_hadoop_cmd(), 'fs', '-mkdir']
 
-    def remove(self, path, recursive=True, skip_trash=False):
+    def _remove_cmd(self, recursive):
         if recursive:
-            cmd = [load_hadoop_cmd(), 'fs', '-rmr']
+            return [load_hadoop_cmd(), 'fs', '-rmr']
         else:
-            cmd = [load_hadoop_cmd(), 'fs', '-rm']
-
-        if skip_trash:
-            cmd = cmd + ['-skipTrash']
+            return [load_hadoop_cmd(), 'fs', '-rm']
 
-        cmd = cmd + [path]
-        call_check(cmd)
+    def exists_many(self, paths):
+        """ Checks one path at a time, since ``-stat`` takes a format as its first argument here """
+        return [self.exists(path) for path in paths]
 
 class HdfsClientApache1(HdfsClientCdh3):
     """This client uses Apache 1.x syntax for file system commands,
@@ -485,36 +716,236 @@ class HdfsClientApache1(HdfsClientCdh3):
 
     def exists(self, path):
         cmd = [load_hadoop_cmd(), 'fs', '-test', '-e', path]
-        p = subprocess.Popen(cmd, stdout=subprocess.PIPE, stderr=subprocess.PIPE, close_fds=True)
-        stdout, stderr = p.communicate()
-        if p.returncode == 0:
+        returncode, stdout, stderr = self._call(cmd)
+        if returncode == 0:
             return True
-        elif p.returncode == 1:
+        elif returncode == 1:
             return False
         else:
-            raise HDFSCliError(cmd, p.returncode, stdout, stderr)
-
-if get_hdfs_syntax() == "cdh4":
-    client = HdfsClient()
-elif get_hdfs_syntax() == "snakebite":
-    client = SnakebiteHdfsClient()
-elif get_hdfs_syntax() == "cdh3":
-    client = HdfsClientCdh3()
-elif get_hdfs_syntax() == "apache1":
-    client = HdfsClientApache1()
-else:
-    raise Exception("Error: Unknown version specified in Hadoop version configuration parameter")
-
-exists = client.exists
-rename = client.rename
-remove = client.remove
-mkdir = client.mkdir
-listdir = client.listdir
+            raise HDFSCliError(cmd, returncode, stdout, stderr)
+
+_autoconfig_client = None
+
+
+def get_autoconfig_client():
+    """Returns the client for the configured hadoop version, creating it on first use"""
+    global _autoconfig_client
+    if _autoconfig_client is None:
+        syntax = get_hdfs_syntax()
+        if syntax == "cdh4":
+            _autoconfig_client = HdfsClient()
+        elif syntax == "snakebite":
+            _autoconfig_client = SnakebiteHdfsClient()
+        elif syntax == "webhdfs":
+            import webhdfs
+            _autoconfig_client = webhdfs.WebHdfsClient()
+        elif syntax == "cdh3":
+            _autoconfig_client = HdfsClientCdh3()
+        elif syntax == "apache1":
+            _autoconfig_client = HdfsClientApache1()
+        else:
+            raise Exception("Error: Unknown version specified in Hadoop version configuration parameter")
+    return _autoconfig_client
+
+
+def _reset_autoconfig_client(section, option):
+    global _autoconfig_client
+    if section in (None, 'hadoop', 'hdfs'):
+        old_client, _autoconfig_client = _autoconfig_client, None
+        if getattr(old_client, 'daemon', None) is not None:
+            old_client.daemon.close()
+
+configuration.LuigiConfigParser.add_change_listener(_reset_autoconfig_client)
+
+
+class AutoconfigClient(object):
+    """Forwards everything to :py:func:`get_autoconfig_client`.
+
+    Lets the module expose a client without reading the config or importing
+    snakebite when luigi is imported.
+    """
+    def __getattr__(self, name):
+        return getattr(get_autoconfig_client(), name)
+
+
+def _client_method(name):
+    def method(*args, **kwargs):
+        return getattr(get_autoconfig_client(), name)(*args, **kwargs)
+    method.__name__ = name
+    return method
+
+client = AutoconfigClient()
+exists = _client_method('exists')
+exists_many = _client_method('exists_many')
+rename = _client_method('rename')
+remove = _client_method('remove')
+remove_many = _client_method('remove_many')
+mkdir = _client_method('mkdir')
+mkdir_many = _client_method('mkdir_many')
+listdir = _client_method('listdir')
+
+
+class HdfsEntry(collections.namedtuple('HdfsEntry', ['path', 'size', 'type', 'mtime'])):
+    """A file or directory found by :py:func:`walk`. ``type`` is ``'d'`` for directories and ``'f'`` for files"""
+    __slots__ = ()
+
+
+class ContentSummary(collections.namedtuple('ContentSummary', ['size', 'file_count', 'directory_count'])):
+    """Total size in bytes and number of files and directories of a tree, as computed by :py:func:`summarize`"""
+    __slots__ = ()
+
+
+def _walk_worker(client, directories, listings):
+    for directory in iter(directories.get, None):
+        try:
+            entries = [HdfsEntry(path, size, 'd' if type == 'd' else 'f', mtime)
+                       for path, size, type, mtime in client.listdir(directory, include_size=True,
+                                                                     include_type=True, include_time=True)]
+            listings.put((entries, None))
+        except Exception:
+            listings.put((None, sys.exc_info()))
+
+
+def walk(path, max_workers=8, client=None):
+    """Yields an :py:class:`HdfsEntry` for each file and directory below ``path``.
+
+    Up to ``max_workers`` directories are listed at once, each by a separate call to
+    ``client.listdir``, using the configured client by default. Entries are yielded as the
+    listings come in, so a directory comes before its contents but the order is otherwise
+    unspecified. Only the listings in progress and the paths of the directories still to be
+    listed are kept in memory.
+    """
+    client = client or get_autoconfig_client()
+    todo = [path]
+    directories = Queue.Queue()
+    listings = Queue.Queue()
+    workers = 0
+    in_progress = 0
+    try:
+        while todo or in_progress:
+            while todo and in_progress < max_workers:
+                if workers == in_progress:
+                    worker = threading.Thread(target=_walk_worker, args=(client, directories, listings))
+                    worker.daemon = True
+                    worker.start()
+                    workers += 1
+                directories.put(todo.pop())
+                in_progress += 1
+            entries, exc_info = listings.get()
+            in_progress -= 1
+            if exc_info:
+                raise exc_info[0], exc_info[1], exc_info[2]
+            for entry in entries:
+                if entry.type == 'd':
+                    todo.append(entry.path)
+                yield entry
+    finally:
+        # Workers finish the listings they're on, but nothing waits for those
+        for i in xrange(workers):
+            directories.put(None)
+
+
+def summarize(entries, root, depth=1):
+    """Sums up sizes and counts of ``entries`` for each path ``depth`` levels below ``root``.
+
+    E.g. ``summarize(walk('/logs'), '/logs')`` gives the size of each partition of ``/logs``.
+    Returns a dict from paths to a :py:class:`ContentSummary`, which counts the path itself
+    too. A depth of 0 sums up everything under ``root``. Paths are compared without their
+    scheme and namenode, e.g. ``hdfs://namenode/logs/x`` is below ``/logs``, and the paths
+    in the result start like ``root``.
+    """
+    root = root.rstrip('/')
+    root_path = urlparse.urlsplit(root).path
+    summaries = collections.defaultdict(lambda: [0, 0, 0])
+    for entry in entries:
+        path = urlparse.urlsplit(entry.path).path
+        if not path.startswith(root_path + '/'):
+            raise ValueError('%s is not below %s' % (entry.path, root))
+        parts = path[len(root_path) + 1:].split('/')
+        summary = summaries['/'.join([root] + parts[:depth]) or '/']
+        summary[0] += entry.size
+        summary[1 if entry.type == 'f' else 2] += 1
+    return dict((path, ContentSummary(*summary)) for path, summary in summaries.iteritems())
 
 
 class HdfsReadPipe(luigi.format.InputPipeProcessWrapper):
     def __init__(self, path):
-        super(HdfsReadPipe, self).__init__([load_hadoop_cmd(), 'fs', '-cat', path])
+        paths = [path] if isinstance(path, basestring) else list(path)
+        super(HdfsReadPipe, self).__init__([load_hadoop_cmd(), 'fs', '-cat'] + paths)
+
+
+def _read_groups(paths, workers, max_length):
+    """Splits ``paths`` into about ``workers`` consecutive groups, each short enough for one command"""
+    size = max(1, -(-len(paths) // workers))
+    groups = []
+    for i in xrange(0, len(paths), size):
+        groups.extend(_batches(paths[i:i + size], max_length))
+    return groups
+
+
+class HdfsMultiReadPipe(luigi.format.ChunkedReader):
+    """File like object reading the concatenation of ``paths``, up to ``workers`` streams at a time.
+
+    Each file is read through a ``client.open_read`` stream of its own, by a separate thread.
+    Clients with an ``open_read_many`` method start a process per stream instead, like
+    :py:class:`HdfsClient`, so the files are split into ``workers`` consecutive groups that are
+    read with one stream each. The streams after the current one are read ahead by up to
+    ``read_ahead`` chunks of ``chunk_size`` bytes each.
+    """
+    chunk_size = 64 * 1024
+
+    def __init__(self, paths, workers=4, read_ahead=16, client=None):
+        super(HdfsMultiReadPipe, self).__init__()
+        self._client = client or get_autoconfig_client()
+        if hasattr(self._client, 'open_read_many'):
+            max_length = getattr(self._client, 'max_batch_length', HdfsClient.max_batch_length)
+            streams = [(self._client.open_read_many, group) for group in _read_groups(paths, workers, max_length)]
+        else:
+            streams = [(self._client.open_read, path) for path in paths]
+        self._chunks = [Queue.Queue(read_ahead) for stream in streams]
+        self._current = 0
+        todo = Queue.Queue()
+        for item in enumerate(streams):
+            todo.put(item)
+        for i in xrange(min(workers, len(streams))):
+            todo.put(None)
+            worker = threading.Thread(target=self._fetch, args=(todo,))
+            worker.daemon = True
+            worker.start()
+
+    def _put(self, chunks, item):
+        """Waits for room for ``item``, returns False if closed in the meantime"""
+        while not self.closed:
+            try:
+                chunks.put(item, timeout=0.1)
+                return True
+            except Queue.Full:
+                pass
+        return False
+
+    def _fetch(self, todo):
+        for i, (open_read, path) in iter(todo.get, None):
+            try:
+                with open_read(path) as stream:
+                    while True:
+                        data = stream.read(self.chunk_size)
+                        if not self._put(self._chunks[i], data):
+                            return
+                        if not data:
+                            break
+            except Exception:
+                self._put(self._chunks[i], sys.exc_info())
+
+    def _read_chunk(self):
+        """Returns the next chunk of data, or '' after the end of the last file"""
+        while not self.closed and self._current < len(self._chunks):
+            data = self._chunks[self._current].get()
+            if isinstance(data, tuple):
+                raise data[0], data[1], data[2]
+            if data:
+                return data
+            self._current += 1
+        return ''
 
 
 class HdfsAtomicWritePipe(luigi.format.OutputPipeProcessWrapper):
@@ -572,7 +1003,7 @@ class HdfsAtomicWriteDirPipe(luigi.format.OutputPipeProcessWrapper):
 class Plain(luigi.format.Format):
     @classmethod
     def hdfs_reader(cls, path):
-        return HdfsReadPipe(path)
+        return client.open_read(path)
 
     @classmethod
     def pipe_writer(cls, output_pipe):
@@ -583,11 +1014,14 @@ class PlainDir(luigi.format.Format):
     @classmethod
     def hdfs_reader(cls, path):
         # exclude underscore-prefixedfiles/folders (created by MapReduce)
-        return HdfsReadPipe("%s/[^_]*" % path)
+        parts = [part for part in listdir(path, ignore_directories=True)
+                 if not posixpath.basename(part).startswith('_')]
+        workers = configuration.get_config().getint('hdfs', 'read_workers', 4)
+        return HdfsMultiReadPipe(parts, workers=workers)
 
     @classmethod
     def hdfs_writer(cls, path):
-        return HdfsAtomicWriteDirPipe(path)
+        return client.open_write_dir(path)
 
 
 class HdfsTarget(FileSystemTarget):
@@ -637,12 +1071,12 @@ in luigi. Use target.path instead", stacklevel=2)
             try:
                 return self.format.hdfs_reader(self.path)
             except NotImplementedError:
-                return self.format.pipe_reader(HdfsReadPipe(self.path))
+                return self.format.pipe_reader(client.open_read(self.path))
         else:
             try:
                 return self.format.hdfs_writer(self.path)
             except NotImplementedError:
-                return self.format.pipe_writer(HdfsAtomicWritePipe(self.path))
+                return self.format.pipe_writer(client.open_write(self.path))
 
     def remove(self, skip_trash=False):
         remove(self.path, skip_trash=skip_trash)
@@ -670,11 +1104,12 @@ in luigi. Use target.path instead", stacklevel=2)
         if "/" in self.path:
             # example path: /log/ap/2013-01-17/00
             parts = self.path.split("/")
-            # start with the full path and then up the tree until we can check
+            # start with the full path and then up the tree until we can check,
+            # checking all the candidates with a single command
             length = len(parts)
-            for part in xrange(length):
-                path = "/".join(parts[0:length - part]) + "/"
-                if exists(path):
+            paths = ["/".join(parts[0:length - part]) + "/" for part in xrange(length)]
+            for path, path_exists in zip(paths, exists_many(paths)):
+                if path_exists:
                     # if the path exists and we can write there, great!
                     if self._is_writable(path):
                         return True
@@ -687,8 +1122,9 @@ in luigi. Use target.path instead", stacklevel=2)
 
     def _is_writable(self, path):
         test_path = path + '.test_write_access-%09d' % random.randrange(1e10)
-        return_value = subprocess.call([load_hadoop_cmd(), 'fs', '-touchz', test_path])
-        if return_value != 0:
+        try:
+            client.touchz(test_path)
+        except Exception:    # IGNORE:broad-except
             return False
         else:
             remove(test_path, recursive=False)
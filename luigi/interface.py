@@ -78,6 +78,10 @@ class EnvironmentParamsContainer(task.Task):
                                      description='Maximum number of parallel tasks to run')
     logging_conf_file = parameter.Parameter(is_global=True, default=None,
                                      description='Configuration file for logging')
+    pipeline = parameter.BooleanParameter(is_global=True, default=False,
+                                          description='Start running tasks while the dependency graph is still being discovered')
+    profile_tasks = parameter.Parameter(is_global=True, default=None,
+                                        description='Directory to write a cProfile dump of each task run to')
 
     @classmethod
     def env_params(cls, override_defaults):
@@ -144,11 +148,16 @@ class Interface(object):
             sch = worker_scheduler_factory.create_remote_scheduler(host=env_params.scheduler_host, port=env_params.scheduler_port)
 
         w = worker_scheduler_factory.create_worker(scheduler=sch, worker_processes=env_params.workers)
+        if env_params.profile_tasks:
+            w.profile_dir = env_params.profile_tasks
 
-        for task in tasks:
-            w.add(task)
-        logger = logging.getLogger('luigi-interface')
-        logger.info('Done scheduling tasks')
+        if env_params.pipeline:
+            w.add_in_background(tasks)
+        else:
+            for task in tasks:
+                w.add(task)
+            logger = logging.getLogger('luigi-interface')
+            logger.info('Done scheduling tasks')
         w.run()
         w.stop()
 
@@ -219,20 +228,30 @@ class ArgParseInterface(Interface):
             for param_name, param in cls.get_nonglobal_params():
                 _add_parameter(parser, param_name, param, cls.task_family)
 
+        global_params = list(Register.get_global_params())
+
         def _add_global_parameters(parser):
-            for param_name, param in Register.get_global_params():
+            for param_name, param in global_params:
                 _add_parameter(parser, param_name, param)
 
         _add_global_parameters(parser)
 
+        if cmdline_args is None:
+            cmdline_args = sys.argv[1:]
+
         if main_task_cls:
             _add_task_parameters(parser, main_task_cls)
 
         else:
-            orderedtasks = '{%s}' % ','.join(sorted(Register.get_reg().keys()))
+            reg = Register.get_reg()
+            orderedtasks = '{%s}' % ','.join(sorted(reg.keys()))
             subparsers = parser.add_subparsers(dest='command', metavar=orderedtasks)
 
-            for name, cls in Register.get_reg().iteritems():
+            # Only build parsers for tasks named on the command line, doing it for every
+            # registered task makes startup slow with large registries. Unknown task names
+            # still fail as an invalid choice.
+            for name in set(arg for arg in cmdline_args if arg in reg):
+                cls = reg[name]
                 subparser = subparsers.add_parser(name)
                 if cls == Register.AMBIGUOUS_CLASS:
                     continue
@@ -255,7 +274,7 @@ class ArgParseInterface(Interface):
             raise Exception('%s is ambigiuous' % args.command)
 
         # Notice that this is not side effect free because it might set global params
-        task = task_cls.from_input(params, Register.get_global_params())
+        task = task_cls.from_input(params, global_params)
 
         return [task]
 
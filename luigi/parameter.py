@@ -18,6 +18,38 @@ from ConfigParser import NoSectionError, NoOptionError
 
 _no_default = object()
 
+# Upper bound on the number of entries in each parse/serialize memo, see _memoize
+_MEMO_SIZE = 10000
+
+
+def _memoize(f):
+    """Caches ``f(self, x)`` per Parameter class and input for immutable parameter values.
+
+    The same strings (dates, intervals, ...) are parsed over and over again when building
+    tasks from the command line or from ids, so this is worth a dict lookup.
+    Exceptions aren't cached and the memo is simply cleared when it gets full.
+    Equal inputs return the same object, so only use it for functions returning immutable values.
+    """
+    memo = {}
+
+    def wrapper(self, x):
+        key = (type(self), x)
+        try:
+            return memo[key]
+        except KeyError:
+            pass
+        except TypeError:  # unhashable input
+            return f(self, x)
+        value = f(self, x)
+        if len(memo) >= _MEMO_SIZE:
+            memo.clear()
+        memo[key] = value
+        return value
+    wrapper.__name__ = f.__name__
+    wrapper.__doc__ = f.__doc__
+    wrapper.memo = memo
+    return wrapper
+
 
 class ParameterException(Exception):
     """Base exception."""
@@ -198,6 +230,7 @@ class DateHourParameter(Parameter):
     19:00.
     """
 
+    @_memoize
     def parse(self, s):
         """
         Parses a string to a :py:class:`~datetime.datetime` using the format string ``%Y-%m-%dT%H``.
@@ -206,6 +239,7 @@ class DateHourParameter(Parameter):
         # time intervals (similar to date_interval). Or what do you think?
         return datetime.datetime.strptime(s, "%Y-%m-%dT%H")  # ISO 8601 is to use 'T'
 
+    @_memoize
     def serialize(self, dt):
         """
         Converts the datetime to a string usnig the format string ``%Y-%m-%dT%H``.
@@ -220,6 +254,7 @@ class DateParameter(Parameter):
     A DateParameter is a Date string formatted ``YYYY-MM-DD``. For example, ``2013-07-10`` specifies
     July 10, 2013.
     """
+    @_memoize
     def parse(self, s):
         """Parses a date string formatted as ``YYYY-MM-DD``."""
         return datetime.date(*map(int, s.split('-')))
@@ -262,6 +297,7 @@ class DateIntervalParameter(Parameter):
     # Class that maps to/from dates using ISO 8601 standard
     # Also gives some helpful interval algebra
 
+    @_memoize
     def parse(self, s):
         """Parses a `:py:class:`~luigi.date_interval.DateInterval` from the input.
 
@@ -279,6 +315,10 @@ class DateIntervalParameter(Parameter):
         else:
             raise ValueError('Invalid date interval - could not be parsed')
 
+    @_memoize
+    def serialize(self, x):
+        return str(x)
+
 
 class TimeDeltaParameter(Parameter):
     """Class that maps to timedelta using strings in any of the following forms:
@@ -321,6 +361,7 @@ class TimeDeltaParameter(Parameter):
         regex = "".join(["((?P<%s>\d+) ?%s(%s)?(%s)? ?)?" % (k, k[0], k[1:-1], k[-1]) for k in keys])
         return self._apply_regex(regex, input)
 
+    @_memoize
     def parse(self, input):
         """Parses a time delta from the input.
 
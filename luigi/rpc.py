@@ -71,9 +71,9 @@ class RemoteScheduler(Scheduler):
 
     def ping(self, worker):
         # just one attemtps, keep-alive thread will keep trying anyway
-        self._request('/api/ping', {'worker': worker}, attempts=1)
+        return self._request('/api/ping', {'worker': worker}, attempts=1)
 
-    def add_task(self, worker, task_id, status=PENDING, runnable=False, deps=None, expl=None):
+    def add_task(self, worker, task_id, status=PENDING, runnable=False, deps=None, expl=None, resources=None):
         self._request('/api/add_task', {
             'task_id': task_id,
             'worker': worker,
@@ -81,16 +81,19 @@ class RemoteScheduler(Scheduler):
             'runnable': runnable,
             'deps': deps,
             'expl': expl,
+            'resources': resources,
         })
 
-    def get_work(self, worker, host=None):
+    def get_work(self, worker, host=None, max_tasks=1):
         ''' Ugly work around for an older scheduler version, where get_work doesn't have a host argument. Try once passing
             host to it, falling back to the old version. Should be removed once people have had time to update everything
+
+            Older schedulers ignore max_tasks and return a single task without the task_ids list.
         '''
         try:
             return self._request(
                 '/api/get_work',
-                {'worker': worker, 'host': host},
+                {'worker': worker, 'host': host, 'max_tasks': max_tasks},
                 log_exceptions=False,
                 attempts=1
             )
@@ -98,6 +101,12 @@ class RemoteScheduler(Scheduler):
             logger.info("get_work RPC call failed, is it possible that you need to update your scheduler?")
             raise
 
+    def release_tasks(self, worker, task_ids):
+        self._request('/api/release_tasks', {'worker': worker, 'task_ids': task_ids})
+
+    def start_task(self, worker, task_id):
+        self._request('/api/start_task', {'worker': worker, 'task_id': task_id})
+
     def graph(self):
         return self._request('/api/graph', {})
 
@@ -128,11 +137,17 @@ class RemoteSchedulerResponder(object):
     def __init__(self, scheduler):
         self._scheduler = scheduler
 
-    def add_task(self, worker, task_id, status, runnable, deps, expl, **kwargs):
-        return self._scheduler.add_task(worker, task_id, status, runnable, deps, expl)
+    def add_task(self, worker, task_id, status, runnable, deps, expl, resources=None, **kwargs):
+        return self._scheduler.add_task(worker, task_id, status, runnable, deps, expl, resources)
+
+    def get_work(self, worker, host=None, max_tasks=1, **kwargs):
+        return self._scheduler.get_work(worker, host, max_tasks)
+
+    def release_tasks(self, worker, task_ids, **kwargs):
+        return self._scheduler.release_tasks(worker, task_ids)
 
-    def get_work(self, worker, host=None, **kwargs):
-        return self._scheduler.get_work(worker, host)
+    def start_task(self, worker, task_id, **kwargs):
+        return self._scheduler.start_task(worker, task_id)
 
     def ping(self, worker, **kwargs):
         return self._scheduler.ping(worker)
@@ -28,6 +28,7 @@ from luigi.parameter import Parameter
 from luigi.target import FileSystem
 from luigi.target import FileSystemTarget
 from luigi.target import FileSystemException
+from luigi.target import group_by_parent
 from luigi.task import ExternalTask
 
 # two different ways of marking a directory
@@ -81,6 +82,34 @@ class S3Client(FileSystem):
         
         logger.debug('Path %s does not exist', path)
         return False
+
+    def exists_many(self, paths):
+        """
+        Do provided paths exist on S3?
+
+        Paths sharing a parent "directory" are checked with a single
+        delimited listing of that prefix.
+        """
+        result = [False] * len(paths)
+        for parent, entries in group_by_parent(paths).iteritems():
+            (bucket, key) = self._path_to_bucket_and_key(parent)
+            if len(entries) == 1 or not bucket:
+                for i, name in entries:
+                    result[i] = self.exists(paths[i])
+                continue
+
+            # grab and validate the bucket
+            s3_bucket = self.s3.get_bucket(bucket, validate=True)
+
+            prefix = '' if self._is_root(key) else self._add_path_delimiter(key)
+            names = set(item.name[len(prefix):]
+                        for item in s3_bucket.list(prefix=prefix, delimiter='/'))
+            for i, name in entries:
+                # files, "directories" with keys below them and directory markers
+                result[i] = (name in names or
+                             name + S3_DIRECTORY_MARKER_SUFFIX_1 in names or
+                             name + S3_DIRECTORY_MARKER_SUFFIX_0 in names)
+        return result
     
     def remove(self, path, recursive=True):
         """
@@ -342,11 +371,14 @@ class S3Target(FileSystemTarget):
 
         if mode == 'r':
             s3_key = self.fs.get_key(self.path)
-            if s3_key:
-                return ReadableS3File(s3_key)
-            else:
+            if not s3_key:
                 raise FileNotFoundException("Could not find file at %s" % self.path)
+            if self.format:
+                return self.format.pipe_reader(ReadableS3File(s3_key))
+            return ReadableS3File(s3_key)
         else:
+            if self.format:
+                return self.format.pipe_writer(AtomicS3File(self.path, self.fs))
             return AtomicS3File(self.path, self.fs)
 
 class S3PathTask(ExternalTask):
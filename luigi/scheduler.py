@@ -13,10 +13,12 @@
 # the License.
 
 import os
+import heapq
 import logging
 import time
 import cPickle as pickle
 import task_history as history
+from task import id_to_name_and_params
 logger = logging.getLogger("luigi.server")
 
 from task_status import PENDING, FAILED, DONE, RUNNING, UNKNOWN
@@ -53,7 +55,9 @@ class Task(object):
         self.retry = None
         self.remove = None
         self.worker_running = None  # the worker that is currently running the task or None
+        self.prefetched = False  # handed to worker_running ahead of time, and not started yet
         self.expl = None
+        self.resources = None  # resources used by the last run, as reported by the worker
 
     def __repr__(self):
         return "Task(%r)" % vars(self)
@@ -124,7 +128,13 @@ class CentralPlannerScheduler(Scheduler):
                     logger.info("Task %r has stakeholders %r but none remain connected -> will remove task in %s seconds", task_id, task.stakeholders, self._remove_delay)
                     task.remove = time.time() + self._remove_delay
 
-            if task.status == RUNNING and task.worker_running and task.worker_running not in remaining_workers:
+            if task.status == RUNNING and task.worker_running and task.worker_running not in remaining_workers and task.prefetched:
+                # It never ran, so it can be run again right away
+                logger.info("Task %r was prefetched but not started by disconnected worker %r -> marking as PENDING", task_id, task.worker_running)
+                task.worker_running = None
+                task.status = PENDING
+                task.prefetched = False
+            elif task.status == RUNNING and task.worker_running and task.worker_running not in remaining_workers:
                 # If a running worker disconnects, tag all its jobs as FAILED and subject it to the same retry logic
                 logger.info("Task %r is marked as running by disconnected worker %r -> marking as FAILED with retry delay of %rs", task_id, task.worker_running, self._retry_delay)
                 task.worker_running = None
@@ -152,12 +162,13 @@ class CentralPlannerScheduler(Scheduler):
         # of whenever the worker was last active
         self._active_workers[worker] = time.time()
 
-    def add_task(self, worker, task_id, status=PENDING, runnable=True, deps=None, expl=None):
+    def add_task(self, worker, task_id, status=PENDING, runnable=True, deps=None, expl=None, resources=None):
         """
         * Add task identified by task_id if it doesn't exist
         * If deps is not None, update dependency list
         * Update status of task
         * Add additional workers/stakeholders
+        * Record resources (wall_time, cpu_time, max_rss) used by the worker, if any
         """
         self.update(worker)
 
@@ -182,20 +193,22 @@ class CentralPlannerScheduler(Scheduler):
 
         if expl is not None:
             task.expl = expl
-        self._update_task_history(task_id, status)
 
-    def get_work(self, worker, host=None):
+        if resources is not None:
+            task.resources = resources
+        self._update_task_history(task_id, status, resources=resources)
+
+    def get_work(self, worker, host=None, max_tasks=1):
         # TODO: remove any expired nodes
 
-        # Algo: iterate over all nodes, find first node with no dependencies
+        # Algo: iterate over all nodes, find the (up to max_tasks) oldest nodes with no dependencies
 
         # TODO: remove tasks that can't be done, figure out if the worker has absolutely
         # nothing it can wait for
 
         # Return remaining tasks that have no FAILED descendents
         self.update(worker)
-        best_t = float('inf')
-        best_task = None
+        runnable_tasks = []
         locally_pending_tasks = 0
         running_tasks = []
 
@@ -218,22 +231,45 @@ class CentralPlannerScheduler(Scheduler):
                     ok = False
 
             if ok:
-                if task.time < best_t:
-                    best_t = task.time
-                    best_task = task_id
+                runnable_tasks.append((task.time, task_id))
 
-        if best_task:
+        # nsmallest is stable, so ties are broken by iteration order
+        best_tasks = [task_id for t, task_id in heapq.nsmallest(max_tasks, runnable_tasks, key=lambda t: t[0])]
+        for i, best_task in enumerate(best_tasks):
             t = self._tasks[best_task]
             t.status = RUNNING
             t.worker_running = worker
+            t.prefetched = i > 0  # the worker starts the first one right away
             self._update_task_history(best_task, RUNNING, host=host)
 
         return {'n_pending_tasks': locally_pending_tasks,
-                'task_id': best_task,
+                'task_id': best_tasks[0] if best_tasks else None,
+                'task_ids': best_tasks,
                 'running_tasks': running_tasks}
 
+    def release_tasks(self, worker, task_ids):
+        """ Hand back tasks that the worker got from get_work but won't run """
+        self.update(worker)
+        for task_id in task_ids:
+            task = self._tasks.get(task_id)
+            if task is not None and task.status == RUNNING and task.worker_running == worker:
+                task.status = PENDING
+                task.worker_running = None
+                task.prefetched = False
+                self._update_task_history(task_id, PENDING)
+
+    def start_task(self, worker, task_id):
+        """ Tell that the worker started a task it got ahead of time from get_work """
+        self.update(worker)
+        task = self._tasks.get(task_id)
+        if task is not None and task.worker_running == worker:
+            task.prefetched = False
+
     def ping(self, worker):
         self.update(worker)
+        # Any call carrying the worker id counts as a heartbeat. Let the worker know how long it
+        # may stay quiet, so it doesn't have to ping more often than needed
+        return {'worker_disconnect_delay': self._worker_disconnect_delay}
 
     def _upstream_status(self, task_id, upstream_status_table):
         if task_id in upstream_status_table:
@@ -269,25 +305,15 @@ class CentralPlannerScheduler(Scheduler):
             'workers': list(task.workers),
             'start_time': task.time,
             'params': self._get_task_params(task_id),
-            'name': self._get_task_name(task_id)
+            'name': self._get_task_name(task_id),
+            'resources': task.resources
         }
 
     def _get_task_params(self, task_id):
-        params = {}
-        params_part = task_id.split('(')[1].strip(')')
-        params_strings = params_part.split(", ")
-
-        for param in params_strings:
-            if not param:
-                continue
-            split_param = param.split('=')
-            if len(split_param) != 2:
-                return {'<complex parameters>': params_part}
-            params[split_param[0]] = split_param[1]
-        return params
+        return id_to_name_and_params(task_id)[1]
 
     def _get_task_name(self, task_id):
-        return task_id.split('(')[0]
+        return id_to_name_and_params(task_id)[0]
 
     def graph(self):
         self.prune()
@@ -360,11 +386,13 @@ class CentralPlannerScheduler(Scheduler):
         else:
             return {"taskId": task_id, "error": ""}
 
-    def _update_task_history(self, task_id, status, host=None):
+    def _update_task_history(self, task_id, status, host=None, resources=None):
         try:
             if status == DONE or status == FAILED:
                 successful = (status == DONE)
                 self._task_history.task_finished(task_id, successful)
+                if resources is not None:
+                    self._task_history.task_resources(task_id, resources)
             elif status == PENDING:
                 self._task_history.task_scheduled(task_id)
             elif status == RUNNING:
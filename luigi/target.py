@@ -14,6 +14,7 @@
 
 import abc
 import logging
+import posixpath
 logger = logging.getLogger('luigi-interface')
 
 
@@ -78,6 +79,18 @@ class FileSystem(object):
         """
         pass
 
+    def exists_many(self, paths):
+        """ Return a list of booleans telling whether each of ``paths`` exist.
+
+        The default implementation calls :py:meth:`exists` once per path. Subclasses for which a
+        round trip is expensive should override this, e.g. by listing the directories the paths
+        live in once instead of checking each path separately.
+
+        :param paths: an iterable of paths within the FileSystem.
+        :return: a list with one boolean per path, in the order given.
+        """
+        return [self.exists(path) for path in paths]
+
     def mkdir(self, path):
         """ Create directory at location ``path``
 
@@ -142,7 +155,7 @@ class FileSystemTarget(Target):
         This method is implemented by using :py:meth:`fs`.
         """
         path = self.path
-        if '*' in path or '?' in path or '[' in path or '{' in path:
+        if has_wildcard(path):
             logger.warning("Using wildcards in path %s might lead to processing of an incomplete dataset; "
                            "override exists() to suppress the warning." % path)
         return self.fs.exists(path)
@@ -153,3 +166,42 @@ class FileSystemTarget(Target):
         This method is implemented by using :py:meth:`fs`.
         """
         self.fs.remove(self.path)
+
+    @staticmethod
+    def exists_many(targets):
+        """Returns a list of booleans telling whether each of ``targets`` exist.
+
+        Targets sharing a :py:class:`FileSystem` are checked together with a single call to
+        :py:meth:`FileSystem.exists_many`.
+
+        :param targets: a list of FileSystemTargets.
+        """
+        by_fs = {}
+        for i, target in enumerate(targets):
+            by_fs.setdefault(id(target.fs), (target.fs, []))[1].append(i)
+
+        result = [False] * len(targets)
+        for fs, indices in by_fs.itervalues():
+            for i, exists in zip(indices, fs.exists_many([targets[i].path for i in indices])):
+                result[i] = exists
+        return result
+
+
+def has_wildcard(path):
+    """Returns ``True`` if ``path`` contains glob characters."""
+    return '*' in path or '?' in path or '[' in path or '{' in path
+
+
+def group_by_parent(paths):
+    """Groups ``paths`` by their parent directory.
+
+    Trailing slashes are ignored, so ``/a/b/`` and ``/a/b`` are both the entry ``b`` of ``/a``.
+
+    :return: a ``dict`` of parent -> list of ``(index, name)`` tuples, where ``index`` is the
+             position of the path in ``paths``.
+    """
+    groups = {}
+    for i, path in enumerate(paths):
+        parent, name = posixpath.split(path.rstrip('/'))
+        groups.setdefault(parent, []).append((i, name))
+    return groups
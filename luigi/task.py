@@ -14,9 +14,13 @@
 
 import abc
 import logging
+import re
 import parameter
+import target
 import warnings
 import traceback
+import types
+import weakref
 
 Parameter = parameter.Parameter
 logger = logging.getLogger('luigi-interface')
@@ -33,23 +37,73 @@ def namespace(namespace=None):
     Register._default_namespace = namespace
 
 
+# Task ids look like ``Foo(bar=1, baz=2)``. Backslashes and commas in parameter values are
+# escaped with a backslash, so that ``, `` only ever separates parameters.
+_ID_TOKENS = re.compile(r'\\(.)|(, )|([^\\,]+|,)', re.DOTALL)
+_ID_CACHE_SIZE = 10000
+_id_cache = {}  # task_id -> (task_family, params), cleared when it gets too big
+
+
+def _escape_param_value(value):
+    if '\\' in value or ',' in value:
+        return value.replace('\\', '\\\\').replace(',', '\\,')
+    return value
+
+
+def name_and_params_to_id(task_family, params):
+    ''' Turn a task family and a list of ``(name, serialized value)`` tuples into a task_id.
+        This is the inverse of :py:func:`id_to_name_and_params`.
+    '''
+    return '%s(%s)' % (task_family, ', '.join('%s=%s' % (name, _escape_param_value(value)) for name, value in params))
+
+
+def _split_params(params):
+    # Fast path for values without escapes
+    if '\\' not in params:
+        return params.split(', ')
+
+    parts = []
+    part = []
+    for escaped, separator, text in _ID_TOKENS.findall(params):
+        if separator:
+            parts.append(''.join(part))
+            part = []
+        else:
+            part.append(escaped or text)
+    parts.append(''.join(part))
+    return parts
+
+
 def id_to_name_and_params(task_id):
     ''' Turn a task_id into a (task_family, {params}) tuple.
         E.g. calling with ``Foo(bar=bar, baz=baz)`` returns
         ``('Foo', {'bar': 'bar', 'baz': 'baz'})``
     '''
-    lparen = task_id.index('(')
+    try:
+        task_family, params = _id_cache[task_id]
+        return task_family, dict(params)
+    except KeyError:
+        pass
+
+    lparen = task_id.find('(')
+    if lparen == -1 or not task_id.endswith(')'):
+        return task_id, {}
     task_family = task_id[:lparen]
-    params = task_id[lparen + 1:-1]
+    params = {}
+    name = None
+    if lparen + 2 < len(task_id):
+        for part in _split_params(task_id[lparen + 1:-1]):
+            if '=' not in part and name is not None:
+                # Task ids from before values were escaped may contain unescaped ', '
+                params[name] += ', ' + part
+                continue
+            name, _, value = part.partition('=')
+            params[name] = value
 
-    def split_equals(x):
-        equals = x.index('=')
-        return x[:equals], x[equals + 1:]
-    if params:
-        param_list = map(split_equals, params.split(', '))  # TODO: param values with ', ' in them will break this
-    else:
-        param_list = []
-    return task_family, dict(param_list)
+    if len(_id_cache) >= _ID_CACHE_SIZE:
+        _id_cache.clear()
+    _id_cache[task_id] = task_family, params
+    return task_family, dict(params)
 
 
 
@@ -65,6 +119,7 @@ class Register(abc.ABCMeta):
     __instance_cache = {}
     _default_namespace = None
     _reg = {}
+    _params_cache = {}  # class -> parameter metadata, see Task._get_param_info
     AMBIGUOUS_CLASS = object()  # Placeholder denoting an error
     """If this value is returned by :py:meth:`get_reg` then there is an
     ambiguous task name (two :py:class:`Task` have the same name). This denotes
@@ -90,6 +145,22 @@ class Register(abc.ABCMeta):
 
         return cls
 
+    def __setattr__(cls, name, value):
+        """ Drop cached parameter metadata when parameters are added or replaced on a class """
+        if isinstance(value, Parameter) or isinstance(getattr(cls, name, None), Parameter):
+            cls._clear_params_cache()
+        super(Register, cls).__setattr__(name, value)
+
+    def __delattr__(cls, name):
+        if isinstance(getattr(cls, name, None), Parameter):
+            cls._clear_params_cache()
+        super(Register, cls).__delattr__(name)
+
+    def _clear_params_cache(cls):
+        # Subclasses inherit the parameter too
+        for cached_cls in [c for c in Register._params_cache if issubclass(c, cls)]:
+            del Register._params_cache[cached_cls]
+
     def __call__(cls, *args, **kwargs):
         """ Custom class instantiation utilizing instance cache.
 
@@ -100,10 +171,10 @@ class Register(abc.ABCMeta):
 
         h = Register.__instance_cache
 
-        if h == None:  # disabled
+        if h is None:  # disabled
             return instantiate()
 
-        params = cls.get_params()
+        params = cls._get_param_info()[0]
         param_values = cls.get_param_values(params, args, kwargs)
 
         k = (cls, tuple(param_values))
@@ -114,21 +185,37 @@ class Register(abc.ABCMeta):
             logger.debug("Not all parameter values are hashable so instance isn't coming from the cache")
             return instantiate()  # unhashable types in parameters
 
-        if k not in h:
-            h[k] = instantiate()
-
-        return h[k]
+        try:
+            return h[k]
+        except KeyError:
+            # Keep a reference until returned, a weak cache would drop the instance right away
+            instance = h[k] = instantiate()
+            return instance
 
     @classmethod
     def clear_instance_cache(self):
-        """Clear/Reset the instance cache."""
-        Register.__instance_cache = {}
+        """Clear/Reset the instance cache. A weak cache stays weak."""
+        if isinstance(Register.__instance_cache, weakref.WeakValueDictionary):
+            Register.__instance_cache = weakref.WeakValueDictionary()
+        else:
+            Register.__instance_cache = {}
 
     @classmethod
     def disable_instance_cache(self):
         """Disables the instance cache."""
         Register.__instance_cache = None
 
+    @classmethod
+    def enable_weak_instance_cache(self):
+        """Only keep instances in the cache while they are referenced elsewhere.
+
+        Instances are still shared within a live task graph, but long-lived processes
+        such as keep-alive workers don't hold on to every Task they ever created.
+        A disabled cache stays disabled.
+        """
+        if Register.__instance_cache is not None:
+            Register.__instance_cache = weakref.WeakValueDictionary(Register.__instance_cache)
+
     @property
     def task_family(cls):
         """The task family for the given class.
@@ -202,32 +289,51 @@ class Task(object):
     __metaclass__ = Register
     register_cls = True # Whether this class should be exposed
 
+    worker_timeout = None
+    """Seconds after which the worker kills this task if it's still running. ``None`` means the
+    ``worker-timeout`` setting in the ``core`` section of the config is used, ``0`` means no timeout."""
+
     _event_callbacks = {}
+    _event_dispatch = {}  # (class, event) -> callbacks, cleared whenever a handler is added
 
     @classmethod
     def event_handler(cls, event):
         """ Decorator for adding event handlers """
         def wrapped(callback):
             cls._event_callbacks.setdefault(cls, {}).setdefault(event, set()).add(callback)
+            cls._event_dispatch.clear()
             return callback
         return wrapped
 
+    @classmethod
+    def _get_event_callbacks(cls, event):
+        """Returns a tuple of all callbacks for the event on this class and its base classes."""
+        key = (cls, event)
+        try:
+            return cls._event_dispatch[key]
+        except KeyError:
+            pass
+
+        callbacks = []
+        for event_class, event_callbacks in cls._event_callbacks.iteritems():
+            if issubclass(cls, event_class):
+                callbacks.extend(event_callbacks.get(event, ()))
+        callbacks = cls._event_dispatch[key] = tuple(callbacks)
+        return callbacks
+
     def trigger_event(self, event, *args, **kwargs):
         """Trigger that calls all of the specified events associated with this
         class.
         """
-        for event_class, event_callbacks in self._event_callbacks.iteritems():
-            if not isinstance(self, event_class):
-                continue
-            for callback in event_callbacks.get(event, []):
-                try:
-                    # callbacks are protected
-                    callback(*args, **kwargs)
-                except KeyboardInterrupt:
-                    return
-                except:
-                    logger.exception("Error in event callback for %r", event)
-                    pass
+        for callback in self._get_event_callbacks(event):
+            try:
+                # callbacks are protected
+                callback(*args, **kwargs)
+            except KeyboardInterrupt:
+                return
+            except:
+                logger.exception("Error in event callback for %r", event)
+                pass
 
     @property
     def task_family(self):
@@ -237,8 +343,17 @@ class Task(object):
         return self.__class__.task_family
 
     @classmethod
-    def get_params(cls):
-        """Returns all of the Parameters for this Task."""
+    def _get_param_info(cls):
+        """Returns ``(params, params_dict, positional_params)`` for this Task.
+
+        Computed on first use and cached per class until a parameter is set on it or a base class.
+        Callers must not modify the returned lists and dict.
+        """
+        try:
+            return Register._params_cache[cls]
+        except KeyError:
+            pass
+
         # We want to do this here and not at class instantiation, or else there is no room to extend classes dynamically
         params = []
         for param_name in dir(cls):
@@ -250,17 +365,25 @@ class Task(object):
 
         # The order the parameters are created matters. See Parameter class
         params.sort(key=lambda t: t[1].counter)
-        return params
+        positional_params = [(param_name, param_obj) for param_name, param_obj in params if not param_obj.is_global]
+        info = (params, dict(params), positional_params)
+        Register._params_cache[cls] = info
+        return info
+
+    @classmethod
+    def get_params(cls):
+        """Returns all of the Parameters for this Task."""
+        return list(cls._get_param_info()[0])
 
     @classmethod
     def get_global_params(cls):
         """Return the global parameters for this Task."""
-        return [(param_name, param_obj) for param_name, param_obj in cls.get_params() if param_obj.is_global]
+        return [(param_name, param_obj) for param_name, param_obj in cls._get_param_info()[0] if param_obj.is_global]
 
     @classmethod
     def get_nonglobal_params(cls):
         """Return the non-global parameters for this Task."""
-        return [(param_name, param_obj) for param_name, param_obj in cls.get_params() if not param_obj.is_global]
+        return list(cls._get_param_info()[2])
 
     @classmethod
     def get_param_values(cls, params, args, kwargs):
@@ -273,14 +396,16 @@ class Task(object):
         """
         result = {}
 
-        params_dict = dict(params)
+        cached_params, params_dict, positional_params = cls._get_param_info()
+        if params != cached_params:
+            params_dict = dict(params)
+            positional_params = [(n, p) for n, p in params if not p.is_global]
 
         # In case any exceptions are thrown, create a helpful description of how the Task was invoked
         # TODO: should we detect non-reprable arguments? These will lead to mysterious errors
         exc_desc = '%s[args=%s, kwargs=%s]' % (cls.__name__, args, kwargs)
 
         # Fill in the positional arguments
-        positional_params = [(n, p) for n, p in params if not p.is_global]
         for i, arg in enumerate(args):
             if i >= len(positional_params):
                 raise parameter.UnknownParameterException('%s: takes at most %d parameters (%d given)' % (exc_desc, len(positional_params), len(args)))
@@ -330,7 +455,7 @@ class Task(object):
 
         can be instantiated as ``MyTask(count=10)``.
         """
-        params = self.get_params()
+        params, param_objs = self._get_param_info()[:2]
         param_values = self.get_param_values(params, args, kwargs)
 
         # Set all values on class instance
@@ -343,12 +468,12 @@ class Task(object):
 
         # Build up task id
         task_id_parts = []
-        param_objs = dict(params)
         for param_name, param_value in param_values:
-            if dict(params)[param_name].significant:
-                task_id_parts.append('%s=%s' % (param_name, param_objs[param_name].serialize(param_value)))
+            param_obj = param_objs[param_name]
+            if param_obj.significant:
+                task_id_parts.append((param_name, param_obj.serialize(param_value)))
 
-        self.task_id = '%s(%s)' % (self.task_family, ', '.join(task_id_parts))
+        self.task_id = name_and_params_to_id(self.task_family, task_id_parts)
         self.__hash = hash(self.task_id)
 
     def initialized(self):
@@ -524,6 +649,39 @@ class WrapperTask(Task):
         return all(r.complete() for r in flatten(self.requires()))
 
 
+def _checks_path(t):
+    """ Whether the target exists exactly when its path does, so that it can be checked in bulk """
+    return (isinstance(t, target.FileSystemTarget) and
+            getattr(t.exists, 'im_func', None) is target.FileSystemTarget.exists.im_func and
+            not target.has_wildcard(t.path))
+
+
+def bulk_complete(tasks):
+    """Checks the outputs of many tasks at once.
+
+    Only tasks relying on the default :py:meth:`Task.complete`, whose outputs are
+    FileSystemTargets relying on the default :py:meth:`~luigi.target.FileSystemTarget.exists`,
+    are considered. Their outputs are checked with
+    :py:meth:`~luigi.target.FileSystemTarget.exists_many`, so that e.g. thousands of daily
+    partitions on HDFS are found with one command.
+
+    :return: a ``dict`` of task_id -> whether the task is complete, for the tasks that could be checked.
+    """
+    outputs = {}
+    for task in tasks:
+        if getattr(task.complete, 'im_func', None) is not Task.complete.im_func:
+            continue  # custom complete(), we can't tell what it checks
+        targets = flatten(task.output())
+        if targets and all(_checks_path(t) for t in targets):
+            outputs[task.task_id] = targets
+
+    if not outputs:
+        return {}
+
+    exists = iter(target.FileSystemTarget.exists_many([t for targets in outputs.itervalues() for t in targets]))
+    return dict((task_id, all([exists.next() for t in targets])) for task_id, targets in outputs.iteritems())
+
+
 def getpaths(struct):
     """ Maps all Tasks in a structured data object to their .output()"""
     if isinstance(struct, Task):
@@ -533,10 +691,12 @@ def getpaths(struct):
         for k, v in struct.iteritems():
             r[k] = getpaths(v)
         return r
+    elif type(struct) is list or type(struct) is tuple:
+        return [getpaths(r) for r in struct]
     else:
         # Remaining case: assume r is iterable...
         try:
-            s = list(struct)
+            s = iter(struct)
         except TypeError:
             raise Exception('Cannot map %s to Task/dict/list' % str(struct))
 
@@ -555,20 +715,53 @@ def flatten(struct):
         [foo]
 
     """
-    if struct is None:
-        return []
-    flat = []
-    if isinstance(struct, dict):
-        for key, result in struct.iteritems():
-            flat += flatten(result)
-        return flat
+    return list(iter_flatten(struct))
+
+
+_SKIP, _ITEM, _DICT, _ITERABLE, _MAYBE_ITERABLE = range(1, 6)
+_flatten_kinds = {type(None): _SKIP, list: _ITERABLE, tuple: _ITERABLE, dict: _DICT}  # type -> how to flatten it
 
-    try:
-        # if iterable
-        for result in struct:
-            flat += flatten(result)
-        return flat
-    except TypeError:
-        pass
 
-    return [struct]
+def _flatten_kind(item_type):
+    # isinstance checks against Task and Target are slow since they are ABCs, so only do them once per type
+    if issubclass(item_type, (Task, target.Target, basestring)):
+        kind = _ITEM
+    elif issubclass(item_type, dict):
+        kind = _DICT
+    elif item_type is types.InstanceType or (hasattr(item_type, '__getitem__') and not hasattr(item_type, '__iter__')):
+        kind = _MAYBE_ITERABLE  # old-style classes and sequences with just __getitem__
+    elif hasattr(item_type, '__iter__'):
+        kind = _ITERABLE
+    else:
+        kind = _ITEM
+    _flatten_kinds[item_type] = kind
+    return kind
+
+
+def iter_flatten(struct):
+    """Generator version of :py:func:`flatten`
+
+    Walks the structure with an explicit stack, so deeply nested or very large
+    structures don't hit the recursion limit. Strings are treated as single items.
+    """
+    stack = [iter((struct,))]
+    while stack:
+        for item in stack[-1]:
+            item_type = type(item)
+            kind = _flatten_kinds.get(item_type) or _flatten_kind(item_type)
+            if kind == _ITEM:
+                yield item
+            elif kind == _ITERABLE:
+                stack.append(iter(item))
+                break
+            elif kind == _DICT:
+                stack.append(item.itervalues())
+                break
+            elif kind == _MAYBE_ITERABLE:
+                try:
+                    stack.append(iter(item))
+                    break
+                except TypeError:
+                    yield item
+        else:
+            stack.pop()
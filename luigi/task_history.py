@@ -47,6 +47,11 @@ class TaskHistory(object):
     def task_started(self, task_id, worker_host):
         pass
 
+    def task_resources(self, task_id, resources):
+        ''' Called after task_finished with the resources used by the run, a dict with
+        wall_time and cpu_time (seconds) and max_rss (as reported by getrusage). '''
+        pass
+
     # TODO(erikbern): should web method (find_latest_runs etc) be abstract?
 
 
@@ -1,14 +1,31 @@
 """
-Presents the ability to interact with HDFS over WebHDFS (or HttpFS) using
-the whoops library. Provides compatiblity with similar functionality in
-luigi.hdfs whenever possible.
+Presents the ability to interact with HDFS over WebHDFS (or HttpFS). Provides
+compatiblity with similar functionality in luigi.hdfs whenever possible.
+
+:py:class:`WebHdfsClient` talks the WebHDFS REST protocol directly over pooled
+keep-alive HTTP connections, so no JVM is needed on the worker hosts. Set
+``use_webhdfs: true`` in the ``[hdfs]`` section of the config to use it for
+:py:class:`~luigi.hdfs.HdfsTarget`, together with ``namenode_host`` and
+``namenode_port`` (the namenode's HTTP port).
 """
 import datetime
 import configuration
+import fnmatch
+import httplib
 import os
 import posixpath
+import socket
+import threading
+import urllib
 import urlparse
-import whoops
+import hdfs
+import luigi.format
+from luigi.target import FileSystem, FileSystemException, FileAlreadyExists, has_wildcard
+
+try:
+    import simplejson as json
+except ImportError:
+    import json
 
 
 def get_whoops_defaults(config=None):
@@ -22,24 +39,16 @@ def get_whoops_defaults(config=None):
     except:
         raise RuntimeError("You must specify namenode_host and namenode_port "
                            "in the [hdfs] section of your luigi config in "
-                           "order to use luigi's whoops support without a "
+                           "order to use luigi's webhdfs support without a "
                            "fully-qualified url")
 
 
-def get_whoops(path, config=None):
-    """gets an instance of whoops.WebHDFS for the given path. If path is not an absolute URI,
-       then it uses the host and port from the configuration."""
+def _split_url(path, config=None):
+    """Returns the host, port and path of ``path``, using the configured namenode if it has no host"""
     (scheme, netloc, path, query, fragment) = urlparse.urlsplit(path)
 
     if scheme and scheme != "hdfs" and scheme != "webhdfs":
         raise RuntimeError("only hdfs and webhdfs supported!")
-    host = None
-    port = None
-
-    def parse_netloc(netloc):
-        if ':' in netloc:
-            return netloc.split(":")
-        return (host, None)
 
     # If the path specifies a netloc (i.e. a host:port) then use it. Else, try
     # to use the defaults
@@ -51,82 +60,549 @@ def get_whoops(path, config=None):
         defaults = get_whoops_defaults(config)
         host = defaults['host']
         port = defaults['port']
+    return host, port, path
 
+
+def _tmppath(path):
+    """Like :py:func:`luigi.hdfs.tmppath`, keeping the scheme and namenode of a url"""
+    (scheme, netloc, path, query, fragment) = urlparse.urlsplit(path)
+    return urlparse.urlunsplit((scheme, netloc, hdfs.tmppath(path), '', ''))
+
+
+def get_whoops(path, config=None):
+    """gets an instance of whoops.WebHDFS for the given path. If path is not an absolute URI,
+       then it uses the host and port from the configuration."""
+    import whoops
+    host, port, _ = _split_url(path, config)
     return whoops.WebHDFS(host, port, user=os.environ['USER'] if 'USER' in os.environ else None)
 
 
-class WebHdfsClient(object):
-    """Hdfs Client that uses the `whoops` python library to communicate with webhdfs. In order to
+class WebHdfsError(FileSystemException):
+    """Raised for error responses, with the HTTP ``status`` and the name of the Java ``exception``"""
+
+    def __init__(self, status, exception, message):
+        super(WebHdfsError, self).__init__('%s %s: %s' % (status, exception, message))
+        self.status = status
+        self.exception = exception
+
+
+class ConnectionPool(object):
+    """Keeps idle keep-alive connections per host and port, so requests don't wait for new TCP connections.
+
+    A forked process starts with an empty pool instead of sharing sockets with its parent.
+    """
+
+    def __init__(self, max_idle=8, timeout=None):
+        self.max_idle = max_idle
+        self.timeout = timeout
+        self._idle = {}
+        self._pid = os.getpid()
+        self._lock = threading.Lock()
+
+    def _check_pid(self):
+        if self._pid != os.getpid():
+            self._idle = {}
+            self._pid = os.getpid()
+
+    def get(self, host, port):
+        """Returns a connection, and whether it was used before"""
+        with self._lock:
+            self._check_pid()
+            idle = self._idle.get((host, port))
+            if idle:
+                return idle.pop(), True
+        return httplib.HTTPConnection(host, port, timeout=self.timeout), False
+
+    def put(self, host, port, connection):
+        with self._lock:
+            self._check_pid()
+            idle = self._idle.setdefault((host, port), [])
+            if len(idle) < self.max_idle:
+                idle.append(connection)
+                return
+        connection.close()
+
+    def clear(self):
+        with self._lock:
+            for idle in self._idle.itervalues():
+                for connection in idle:
+                    connection.close()
+            self._idle = {}
+
+
+class _Response(object):
+    """A response whose connection goes back to the pool once the body has been read"""
+
+    def __init__(self, pool, host, port, connection, response):
+        self.status = response.status
+        self._pool = pool
+        self._address = (host, port)
+        self._connection = connection
+        self._response = response
+
+    def getheader(self, name):
+        return self._response.getheader(name)
+
+    def read(self, size=None):
+        if self._response is None:
+            return ''
+        data = self._response.read() if size is None else self._response.read(size)
+        if size is None or not data:
+            self._release()
+        return data
+
+    def _release(self):
+        if self._response is None:
+            return
+        if self._response.isclosed() and not self._response.will_close:
+            self._pool.put(self._address[0], self._address[1], self._connection)
+        else:
+            self._connection.close()
+        self._response = None
+
+    def close(self):
+        """Drops the connection, unless the body was read completely"""
+        if self._response is not None:
+            if not self._response.isclosed():
+                self._response.close()
+                self._response.will_close = True
+            self._release()
+
+
+class WebHdfsReadPipe(luigi.format.ChunkedReader):
+    """File like object streaming the concatenated contents of ``paths`` from WebHDFS"""
+
+    def __init__(self, client, paths):
+        super(WebHdfsReadPipe, self).__init__()
+        self._client = client
+        self._paths = list(paths)
+        self._response = None
+
+    def _read_chunk(self):
+        """Returns the next chunk of data, or '' after the end of the last file"""
+        while not self.closed:
+            if self._response is None:
+                if not self._paths:
+                    return ''
+                self._response = self._client._open(self._paths.pop(0))
+            data = self._response.read(self._client.chunk_size)
+            if data:
+                return data
+            self._response = None
+        return ''
+
+    def _close_source(self):
+        if self._response is not None:
+            self._response.close()
+            self._response = None
+
+
+class WebHdfsWritePipe(object):
+    """File like object uploading to ``path`` on WebHDFS with chunked transfer encoding.
+
+    Nothing is kept in memory apart from the current chunk.
+    """
+
+    def __init__(self, client, path, overwrite=True):
+        self._client = client
+        self.path = path
+        self._chunks = []
+        self._length = 0
+        self._fd = None
+        self._pump = None
+        self.closed = False
+        self._connection, self._address = client._start_upload(path, overwrite)
+
+    def _send(self, data):
+        self._connection.send('%x\r\n%s\r\n' % (len(data), data))
+
+    def write(self, data):
+        if not data:
+            return
+        self._chunks.append(data)
+        self._length += len(data)
+        if self._length >= self._client.chunk_size:
+            self.flush()
+
+    def writeLine(self, line):
+        assert '\n' not in line
+        self.write(line + '\n')
+
+    def writelines(self, lines):
+        for line in lines:
+            self.write(line)
+
+    def flush(self):
+        if self._chunks:
+            self._send(''.join(self._chunks))
+            self._chunks = []
+            self._length = 0
+
+    def fileno(self):
+        """Returns the write end of a pipe whose data is uploaded, e.g. for a compressing subprocess"""
+        if self._fd is None:
+            read_fd, self._fd = os.pipe()
+            read_file = os.fdopen(read_fd, 'rb')
+            self._pump = luigi.format.Pump(lambda: os.read(read_fd, self._client.chunk_size), self.write, read_file)
+            self._pump.start()
+        return self._fd
+
+    def _join_pump(self):
+        if self._fd is not None:
+            os.close(self._fd)
+            self._fd = None
+            self._pump.join()
+            if self._pump.error:
+                raise self._pump.error
+
+    def close(self):
+        if self.closed:
+            return
+        self.closed = True
+        self._join_pump()
+        self.flush()
+        self._connection.send('0\r\n\r\n')
+        response = _Response(self._client.pool, self._address[0], self._address[1],
+                             self._connection, self._connection.getresponse())
+        self._client._check(response)
+        response.read()
+
+    def abort(self):
+        if self.closed:
+            return
+        self.closed = True
+        try:
+            self._join_pump()
+        except (IOError, OSError):
+            pass
+        self._connection.close()
+        if self._client.exists(self.path):
+            self._client.remove(self.path, recursive=False)
+
+    def __del__(self):
+        if not getattr(self, 'closed', True):
+            self.abort()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, type, value, traceback):
+        if type is None:
+            self.close()
+        else:
+            self.abort()
+
+
+class WebHdfsAtomicWritePipe(WebHdfsWritePipe):
+    """ Writes to a temporary path that is renamed to ``path`` on close() """
+
+    def __init__(self, client, path):
+        self.final_path = path
+        super(WebHdfsAtomicWritePipe, self).__init__(client, _tmppath(path))
+
+    def close(self):
+        if not self.closed:
+            super(WebHdfsAtomicWritePipe, self).close()
+            self._client.rename(self.path, self.final_path)
+
+
+class WebHdfsAtomicWriteDirPipe(WebHdfsWritePipe):
+    """ Writes a data<data_extension> file to a temporary directory that is renamed to ``path`` on close() """
+
+    def __init__(self, client, path, data_extension=""):
+        self.final_path = path
+        self.tmppath = _tmppath(path)
+        super(WebHdfsAtomicWriteDirPipe, self).__init__(client, self.tmppath + "/data%s" % data_extension)
+
+    def close(self):
+        if not self.closed:
+            super(WebHdfsAtomicWriteDirPipe, self).close()
+            self._client.rename(self.tmppath, self.final_path)
+
+    def abort(self):
+        if not self.closed:
+            super(WebHdfsAtomicWriteDirPipe, self).abort()
+            if self._client.exists(self.tmppath):
+                self._client.remove(self.tmppath)
+
+
+class WebHdfsClient(FileSystem):
+    """Hdfs Client that talks to webhdfs over pooled HTTP connections. In order to
     use the client, you must specify `namenode_host` and `namenode_port` in the `hdfs` section of
-    your luigi configuration."""
+    your luigi configuration, or use fully-qualified ``webhdfs://host:port/path`` urls.
 
-    def __init__(self):
-        "Configures _homedir so that we can handle relative paths"
-        self._homedir = get_whoops("/").home()
+    Offers the same methods as :py:class:`luigi.hdfs.HdfsClient`, apart from skipping the trash,
+    which WebHDFS doesn't support.
+    """
 
-    def _make_absolute(self, inpath):
-        """Makes the given path absolute if it's not already. It is assumed that the path is
-        relative to self._homedir"""
-        (scheme, netloc, path, query, fragment) = urlparse.urlsplit(inpath)
+    chunk_size = 64 * 1024  # bytes per read from, and per chunk sent to, a datanode
 
-        if scheme or posixpath.isabs(path):
-            # if a scheme is specified, assume it's absolute.
+    def __init__(self, user=None, pool=None):
+        if user is None:
+            user = os.environ.get('USER')
+        self.user = user
+        self.pool = pool or ConnectionPool()
+        self._homedirs = {}
+
+    def _make_absolute(self, host, port, path):
+        """Makes the given path absolute if it's not already, relative to the home directory"""
+        if posixpath.isabs(path):
             return path
-        return posixpath.join(self._homedir, path)
+        if (host, port) not in self._homedirs:
+            response = self._request('GET', host, port, '/', 'GETHOMEDIRECTORY')
+            self._homedirs[host, port] = self._json(response)['Path']
+        return posixpath.join(self._homedirs[host, port], path)
+
+    def _url(self, path, op, params):
+        query = [('op', op)]
+        if self.user:
+            query.append(('user.name', self.user))
+        query.extend(sorted(params.iteritems()))
+        return '/webhdfs/v1%s?%s' % (urllib.quote(path), urllib.urlencode(query))
+
+    def _request(self, method, host, port, path, op, body=None, headers=None, url=None, **params):
+        """Sends a request, retrying once on a fresh connection if a pooled one went stale"""
+        if url is None:
+            url = self._url(path, op, params)
+        if body is None and method in ('PUT', 'POST'):
+            headers = dict(headers or {}, **{'Content-Length': '0'})
+        while True:
+            connection, reused = self.pool.get(host, port)
+            try:
+                connection.request(method, url, body, headers or {})
+                response = connection.getresponse()
+            except (httplib.HTTPException, socket.error):
+                connection.close()
+                if reused:
+                    continue
+                raise
+            return _Response(self.pool, host, port, connection, response)
+
+    def _check(self, response):
+        if response.status >= 400:
+            data = response.read()
+            try:
+                error = json.loads(data)['RemoteException']
+                exception, message = error['exception'], error['message']
+            except (ValueError, KeyError, TypeError):
+                exception, message = 'HTTPError', data
+            if exception == 'FileAlreadyExistsException':
+                raise FileAlreadyExists(message)
+            raise WebHdfsError(response.status, exception, message)
+
+    def _json(self, response):
+        self._check(response)
+        data = response.read()
+        return json.loads(data) if data else None
+
+    def _call(self, method, path, op, **params):
+        host, port, path = _split_url(path)
+        path = self._make_absolute(host, port, path)
+        return self._json(self._request(method, host, port, path, op, **params))
+
+    def _redirect(self, response):
+        """Returns the host, port and url of the datanode a 307 response redirects to"""
+        location = response.getheader('location')
+        response.read()
+        (scheme, netloc, path, query, fragment) = urlparse.urlsplit(location)
+        if ':' in netloc:
+            host, port = netloc.split(':')
+        else:
+            host, port = netloc, 80
+        return host, port, '%s?%s' % (path, query) if query else path
+
+    def _open(self, path):
+        """Returns the response streaming the contents of the file at ``path``"""
+        host, port, path = _split_url(path)
+        path = self._make_absolute(host, port, path)
+        response = self._request('GET', host, port, path, 'OPEN')
+        if response.status == httplib.TEMPORARY_REDIRECT:
+            host, port, url = self._redirect(response)
+            response = self._request('GET', host, port, None, None, url=url)
+        self._check(response)
+        return response
+
+    def _start_upload(self, path, overwrite=True):
+        """Creates the file at ``path`` and returns the datanode connection to send its contents with"""
+        host, port, path = _split_url(path)
+        path = self._make_absolute(host, port, path)
+        response = self._request('PUT', host, port, path, 'CREATE', overwrite=str(overwrite).lower())
+        self._check(response)
+        if response.status != httplib.TEMPORARY_REDIRECT:
+            raise WebHdfsError(response.status, 'HTTPError', 'Expected a redirect to a datanode')
+        host, port, url = self._redirect(response)
+        connection, _ = self.pool.get(host, port)
+        try:
+            connection.putrequest('PUT', url, skip_accept_encoding=True)
+            connection.putheader('Transfer-Encoding', 'chunked')
+            connection.putheader('Content-Type', 'application/octet-stream')
+            connection.endheaders()
+        except (httplib.HTTPException, socket.error):
+            connection.close()
+            raise
+        return connection, (host, port)
+
+    def _status(self, path):
+        """Returns the FileStatus of ``path``, or None if it doesn't exist"""
+        try:
+            return self._call('GET', path, 'GETFILESTATUS')['FileStatus']
+        except WebHdfsError, e:
+            if e.status == httplib.NOT_FOUND:
+                return None
+            raise
+
+    def _glob(self, path):
+        """Expands wildcards in the last component of ``path``"""
+        if not has_wildcard(path):
+            return [path]
+        parent, pattern = posixpath.split(path)
+        if has_wildcard(parent):
+            raise ValueError('Wildcards are only supported in the last part of a path: %s' % path)
+        # hadoop globs negate character classes with ^, fnmatch with !
+        pattern = pattern.replace('[^', '[!')
+        return sorted(p for p in self.listdir(parent) if fnmatch.fnmatchcase(posixpath.basename(p), pattern))
 
     def exists(self, path):
         """Returns true if the path exists and false otherwise"""
-        whdfs = get_whoops(path)
-        try:
-            whdfs.stat(self._make_absolute(path))
-            return True
-        except whoops.WebHDFSError, e:
-            if e.args[0] == "Not Found":
-                return False
-            raise e
+        if has_wildcard(path):
+            return bool(self._glob(path))
+        return self._status(path) is not None
+
+    def exists_many(self, paths):
+        return [self.exists(path) for path in paths]
+
+    def isdir(self, path):
+        status = self._status(path)
+        return status is not None and status['type'] == 'DIRECTORY'
 
     def rename(self, path, dest):
+        parent_dir = posixpath.dirname(dest)
+        if parent_dir != '' and not self.exists(parent_dir):
+            self.mkdir(parent_dir)
+        if type(path) in (list, tuple) or has_wildcard(path):
+            # moved into dest, like hadoop fs -mv does with several sources
+            paths = [p for pattern in hdfs.list_path(path) for p in self._glob(pattern)]
+            return all([self.rename(p, posixpath.join(dest, posixpath.basename(p))) for p in paths])
+
         (scheme, netloc, _, _, _) = urlparse.urlsplit(path)
-        (dest_scheme, dest_netloc, _, _, _) = urlparse.urlsplit(dest)
+        (dest_scheme, dest_netloc, dest_path, _, _) = urlparse.urlsplit(dest)
         if scheme != dest_scheme or netloc != dest_netloc:
-            raise RuntimeError("Filesystems don't match. source: %s dest: %s".format(path, dest))
-
-        return get_whoops(path).rename(self._make_absolute(path), self._make_absolute(dest))
+            raise RuntimeError("Filesystems don't match. source: {0} dest: {1}".format(path, dest))
+        host, port, _ = _split_url(dest)
+        destination = self._make_absolute(host, port, dest_path)
+        if not self._call('PUT', path, 'RENAME', destination=destination)['boolean']:
+            raise WebHdfsError(httplib.OK, 'RenameFailed', 'Could not rename %s to %s' % (path, dest))
+        return True
 
-    def remove(self, path, recursive=True):
+    def remove(self, path, recursive=True, skip_trash=False):
         """Note that skip trash option doesn't exist -- trash is always skipped"""
-        return get_whoops(path).delete(self._make_absolute(path), recursive)
+        return self._call('DELETE', path, 'DELETE', recursive=str(recursive).lower())['boolean']
+
+    def remove_many(self, paths, recursive=True, skip_trash=False):
+        return [self.remove(path, recursive, skip_trash) for path in paths]
 
     def mkdir(self, path):
-        return get_whoops(path).mkdir(self._make_absolute(path))
+        return self._call('PUT', path, 'MKDIRS')['boolean']
+
+    def mkdir_many(self, paths):
+        return [self.mkdir(path) for path in paths]
+
+    def touchz(self, path):
+        WebHdfsWritePipe(self, path, overwrite=False).close()
+
+    def chmod(self, path, permissions, recursive=False):
+        paths = [path] + (list(self.listdir(path, recursive=True)) if recursive else [])
+        for p in paths:
+            self._call('PUT', p, 'SETPERMISSION', permission=permissions)
+
+    def chown(self, path, owner, group, recursive=False):
+        params = {}
+        if owner:
+            params['owner'] = owner
+        if group:
+            params['group'] = group
+        paths = [path] + (list(self.listdir(path, recursive=True)) if recursive else [])
+        for p in paths:
+            self._call('PUT', p, 'SETOWNER', **params)
+
+    def count(self, path):
+        summary = self._call('GET', path, 'GETCONTENTSUMMARY')['ContentSummary']
+        # strings, like the output of hadoop fs -count parsed by HdfsClient
+        return {'content_size': str(summary['length']),
+                'dir_count': str(summary['directoryCount']),
+                'file_count': str(summary['fileCount'])}
+
+    def open_read(self, path):
+        return WebHdfsReadPipe(self, self._glob(path))
+
+    def open_write(self, path):
+        return WebHdfsAtomicWritePipe(self, path)
+
+    def open_write_dir(self, path, data_extension=""):
+        return WebHdfsAtomicWriteDirPipe(self, path, data_extension)
+
+    def _copy_stream(self, source, destination):
+        while True:
+            data = source.read(self.chunk_size)
+            if not data:
+                break
+            destination.write(data)
+
+    def copy(self, path, destination):
+        with WebHdfsWritePipe(self, destination) as output:
+            self._copy_stream(WebHdfsReadPipe(self, [path]), output)
+
+    def put(self, local_path, destination):
+        with open(local_path, 'rb') as input:
+            with WebHdfsWritePipe(self, destination) as output:
+                self._copy_stream(input, output)
+
+    def get(self, path, local_destination):
+        with open(local_destination, 'wb') as output:
+            self._copy_stream(WebHdfsReadPipe(self, [path]), output)
+
+    def getmerge(self, path, local_destination, new_line=False):
+        paths = self._glob(path)
+        if self.isdir(path):
+            paths = [p for p, t in self.listdir(path, include_type=True) if t == '-']
+        with open(local_destination, 'wb') as output:
+            for p in paths:
+                self._copy_stream(WebHdfsReadPipe(self, [p]), output)
+                if new_line:
+                    output.write('\n')
 
     def listdir(self, path, ignore_directories=False, ignore_files=False,
-                include_size=False, include_type=False, include_time=False):
+                include_size=False, include_type=False, include_time=False, recursive=False):
         if not path:
             path = "."  # default to current/home catalog
 
-        filestatuses = get_whoops(path).listdir(path)
+        filestatuses = self._call('GET', path, 'LISTSTATUS')['FileStatuses']['FileStatus']
         for fs in filestatuses:
-            if ignore_directories and fs['type'] == 'DIRECTORY':
-                continue
-            if ignore_files and fs['type'] == 'FILE':
-                continue
-            file = posixpath.join(path, fs['pathSuffix'])
-            extra_data = ()
-
-            if include_size:
-                extra_data += (fs['length'],)
-            if include_type:
-                # this is ugly but necessary to be compatible with hdfs.py
-                extra_data += ('d' if fs['type'] == 'DIRECTORY' else '-',)
-            if include_time:
-                modification_time = datetime.datetime.fromtimestamp(fs[u'modificationTime']/1000)
-                extra_data += (modification_time,)
-
-            if len(extra_data) > 0:
-                yield (file,) + extra_data
-            else:
-                yield file
+            # a file lists itself with an empty suffix
+            file = posixpath.join(path, fs['pathSuffix']) if fs['pathSuffix'] else path
+            is_dir = fs['type'] == 'DIRECTORY'
+            if not ((ignore_directories and is_dir) or (ignore_files and not is_dir)):
+                extra_data = ()
+
+                if include_size:
+                    extra_data += (fs['length'],)
+                if include_type:
+                    # this is ugly but necessary to be compatible with hdfs.py
+                    extra_data += ('d' if is_dir else '-',)
+                if include_time:
+                    modification_time = datetime.datetime.fromtimestamp(fs[u'modificationTime'] / 1000)
+                    extra_data += (modification_time,)
+
+                if len(extra_data) > 0:
+                    yield (file,) + extra_data
+                else:
+                    yield file
+
+            if recursive and is_dir:
+                for entry in self.listdir(file, ignore_directories, ignore_files,
+                                          include_size, include_type, include_time, recursive):
+                    yield entry
+
 
 client = WebHdfsClient()
 
@@ -12,19 +12,28 @@
 # License for the specific language governing permissions and limitations under
 # the License.
 
+import collections
+import contextlib
+import cProfile
+import errno
+import hashlib
 import random
+import re
+import resource
+import signal
 from scheduler import CentralPlannerScheduler, PENDING, FAILED, DONE
 import threading
 import time
 import os
 import socket
+import sys
 import configuration
 import traceback
 import logging
 import warnings
 import notifications
 from target import Target
-from task import Task
+from task import Task, bulk_complete
 
 try:
     import simplejson as json
@@ -38,6 +47,10 @@ class TaskException(Exception):
     pass
 
 
+class TaskTimeoutException(Exception):
+    pass
+
+
 class Event:
     # TODO nice descriptive subclasses of Event instead of strings? pass their instances to the callback instead of an undocumented arg list?
     DEPENDENCY_DISCOVERED = "event.core.dependency.discovered"  # triggered for every (task, upstream task) pair discovered in a jobflow
@@ -45,6 +58,11 @@ class Event:
     DEPENDENCY_PRESENT = "event.core.dependency.present"
     FAILURE = "event.core.failure"
     SUCCESS = "event.core.success"
+    # Timing spans of running a task, triggered with (task, seconds)
+    DEPENDENCY_RECHECK_TIME = "event.core.timing.dependency_recheck"  # checking that the dependencies are complete
+    RUN_TIME = "event.core.timing.run"
+    ON_SUCCESS_TIME = "event.core.timing.on_success"
+    STATUS_UPDATE_TIME = "event.core.timing.status_update"  # reporting the task's status to the scheduler
 
 
 class Worker(object):
@@ -55,9 +73,14 @@ class Worker(object):
     - Asks for stuff to do (pulls it in a loop and runs it)
     """
 
+    DISCOVERY_WAIT_INTERVAL = 1.0  # max seconds run() waits for new tasks while the graph is being discovered
+    TIMEOUT_POLL_INTERVAL = 0.1  # seconds between checks for exited children while several run or some have a timeout
+    PINGS_PER_DISCONNECT_DELAY = 4  # the ping interval may grow up to the scheduler's worker_disconnect_delay / this
+    MAX_PROFILE_NAME_LENGTH = 200  # longer task ids are truncated and suffixed with a hash in profile file names
+
     def __init__(self, scheduler=CentralPlannerScheduler(), worker_id=None,
                  worker_processes=1, ping_interval=None, keep_alive=None,
-                 wait_interval=None):
+                 wait_interval=None, prefetch=None, profile_dir=None):
         if not worker_id:
             worker_id = 'worker-%09d' % random.randrange(0, 999999999)
 
@@ -66,6 +89,22 @@ class Worker(object):
         if ping_interval is None:
             ping_interval = config.getfloat('core', 'worker-ping-interval', 1.0)
 
+        # seconds after which a task is killed, unless the task sets its own worker_timeout
+        self.__worker_timeout = config.getfloat('core', 'worker-timeout', 0.0) or None
+
+        # number of tasks to claim per get_work round-trip, extra ones are kept in a local run queue
+        if prefetch is None:
+            prefetch = config.getint('core', 'worker-prefetch', 1)
+        self.__prefetch = max(1, prefetch)
+        self.__run_queue = collections.deque()
+
+        # directory to write a cProfile dump of each task run to, optionally only for some task families
+        if profile_dir is None:
+            profile_dir = config.get('core', 'worker-profile-dir', None)
+        self.profile_dir = profile_dir
+        profile_families = config.get('core', 'worker-profile-tasks', None) or ''
+        self.__profile_families = set(f.strip() for f in profile_families.split(',') if f.strip())
+
         if keep_alive is None:
             keep_alive = config.getboolean('core', 'worker-keep-alive', False)
         self.__keep_alive = keep_alive
@@ -85,30 +124,64 @@ class Worker(object):
         self.worker_processes = worker_processes
         self.host = socket.gethostname()
         self.__scheduled_tasks = {}
+        self._scheduler_lock = threading.Lock()  # the discovery thread shares the scheduler with run()
+        self._discovery_thread = None
+        self._discovery_error = None
+        self._fork_lock = threading.Lock()  # held while adding tasks, so that run() only forks in between
+        self._tasks_added = threading.Event()
+        self.__complete_cache = {}  # results of bulk complete() checks, see _precheck_complete
 
         # store the previous tasks executed by the same worker
         # for debugging reasons
         self._previous_tasks = []
 
+        pings_per_disconnect_delay = self.PINGS_PER_DISCONNECT_DELAY
+
         class KeepAliveThread(threading.Thread):
-            """ Periodically tell the scheduler that the worker still lives """
+            """ Periodically tell the scheduler that the worker still lives
+
+            The scheduler treats every call from the worker as a heartbeat, so pings are only
+            sent when the worker didn't talk to the scheduler during the last interval.
+            """
             def __init__(self):
                 super(KeepAliveThread, self).__init__()
                 self._should_stop = threading.Event()
+                self._last_contact = time.time()
+                self.ping_interval = ping_interval
 
             def stop(self):
                 self._should_stop.set()
 
+            def touch(self):
+                """ Record that the scheduler just heard from this worker """
+                self._last_contact = time.time()
+
+            def _negotiate(self, response):
+                # Older schedulers don't return anything from ping
+                if isinstance(response, dict) and response.get('worker_disconnect_delay'):
+                    delay = float(response['worker_disconnect_delay'])
+                    self.ping_interval = max(ping_interval, delay / pings_per_disconnect_delay)
+
             def run(self):
+                wait = self.ping_interval
                 while True:
-                    self._should_stop.wait(ping_interval)
+                    self._should_stop.wait(wait)
                     if self._should_stop.is_set():
                         logger.info("Worker was stopped. Shutting down Keep-Alive thread")
                         break
+                    wait = self.ping_interval
                     try:
-                        scheduler.ping(worker=worker_id)
+                        idle = time.time() - self._last_contact
+                        if idle < self.ping_interval:
+                            wait = self.ping_interval - idle
+                            continue
+                        response = scheduler.ping(worker=worker_id)
                     except:  # httplib.BadStatusLine:
                         logger.warning('Failed pinging scheduler')
+                        continue
+                    self.touch()
+                    self._negotiate(response)
+                    wait = self.ping_interval
 
         self._keep_alive_thread = KeepAliveThread()
         self._keep_alive_thread.daemon = True
@@ -128,6 +201,13 @@ class Worker(object):
         self._keep_alive_thread.stop()
         self._keep_alive_thread.join()
 
+    @contextlib.contextmanager
+    def _scheduler_call(self):
+        """ Serialize calls to the scheduler, counting each successful one as a heartbeat """
+        with self._scheduler_lock:
+            yield
+        self._keep_alive_thread.touch()
+
     def _validate_task(self, task):
         if not isinstance(task, Task):
             raise TaskException('Can not schedule non-task %s' % task)
@@ -160,14 +240,52 @@ class Worker(object):
         try:
             while stack:
                 current = stack.pop()
-                for next in self._add(current):
-                    stack.append(next)
+                with self._fork_lock:
+                    stack.extend(self._add(current))
         except (KeyboardInterrupt, TaskException):
             raise
         except:
             formatted_traceback = traceback.format_exc()
-            self._log_unexpected_error(task)
-            self._email_unexpected_error(task, formatted_traceback)
+            with self._fork_lock:
+                self._log_unexpected_error(task)
+                self._email_unexpected_error(task, formatted_traceback)
+        finally:
+            self.__complete_cache.clear()
+
+    def add_in_background(self, tasks):
+        """ Add Tasks from a separate thread, so that run() can start executing the tasks
+        discovered so far while the rest of the dependency graph is still being discovered.
+
+        This is safe since a task is only handed out by the scheduler once all of its
+        dependencies have been added and are done. run() doesn't return before all
+        tasks have been added. With multiple worker processes, each fork waits for the
+        task being added (its complete() and requires()) to be done.
+        """
+        def discover():
+            try:
+                for task in tasks:
+                    self.add(task)
+                with self._fork_lock:
+                    logger.info('Done scheduling tasks')
+            except:
+                self._discovery_error = sys.exc_info()
+            finally:
+                self._tasks_added.set()  # wake up run() so that it notices we're done
+
+        self._discovery_thread = threading.Thread(target=discover, name='luigi-discovery')
+        self._discovery_thread.daemon = True
+        self._discovery_thread.start()
+
+    def _is_discovering(self):
+        return self._discovery_thread is not None and self._discovery_thread.is_alive()
+
+    def _join_discovery(self):
+        if self._discovery_thread is not None:
+            self._discovery_thread.join()
+            self._discovery_thread = None
+        if self._discovery_error is not None:
+            exc_info, self._discovery_error = self._discovery_error, None
+            raise exc_info[0], exc_info[1], exc_info[2]
 
     def _add(self, task):
         self._validate_task(task)
@@ -176,7 +294,10 @@ class Worker(object):
         logger.debug("Checking if %s is complete", task)
         is_complete = False
         try:
-            is_complete = task.complete()
+            if task.task_id in self.__complete_cache:
+                is_complete = self.__complete_cache.pop(task.task_id)
+            else:
+                is_complete = task.complete()
             self._check_complete_value(is_complete)
         except KeyboardInterrupt:
             raise
@@ -193,8 +314,9 @@ class Worker(object):
 
         if is_complete:
             # Not submitting dependencies of finished tasks
-            self.__scheduler.add_task(self.__id, task.task_id, status=DONE,
-                                      runnable=False)
+            with self._scheduler_call():
+                self.__scheduler.add_task(self.__id, task.task_id, status=DONE,
+                                          runnable=False)
             task.trigger_event(Event.DEPENDENCY_PRESENT, task)
         elif task.run == NotImplemented:
             self._add_external(task)
@@ -204,8 +326,9 @@ class Worker(object):
 
     def _add_external(self, external_task):
         self.__scheduled_tasks[external_task.task_id] = external_task
-        self.__scheduler.add_task(self.__id, external_task.task_id, status=PENDING,
-                                  runnable=False)
+        with self._scheduler_call():
+            self.__scheduler.add_task(self.__id, external_task.task_id, status=PENDING,
+                                      runnable=False)
         external_task.trigger_event(Event.DEPENDENCY_MISSING, external_task)
         logger.warning('Task %s is not complete and run() is not implemented. Probably a missing external dependency.', external_task.task_id)
 
@@ -221,36 +344,133 @@ class Worker(object):
         for d in deps:
             self._validate_dependency(d)
             task.trigger_event(Event.DEPENDENCY_DISCOVERED, task, d)
+        self._precheck_complete(deps)
 
         deps = [d.task_id for d in deps]
-        self.__scheduler.add_task(self.__id, task.task_id, status=PENDING,
-                                  deps=deps, runnable=True)
+        with self._scheduler_call():
+            self.__scheduler.add_task(self.__id, task.task_id, status=PENDING,
+                                      deps=deps, runnable=True)
+        self._tasks_added.set()
         logger.info('Scheduled %s', task.task_id)
 
         for d in task.deps():
             yield d  # return additional tasks to add
 
+    def _precheck_complete(self, tasks):
+        """ Check the outputs of many sibling tasks at once, see task.bulk_complete
+
+        The results are used by _add instead of calling complete() again.
+        """
+        tasks = [task for task in tasks
+                 if task.task_id not in self.__scheduled_tasks and task.task_id not in self.__complete_cache]
+        if len(tasks) < 2:
+            return
+
+        try:
+            self.__complete_cache.update(bulk_complete(tasks))
+        except KeyboardInterrupt:
+            raise
+        except:
+            # complete() will be called on each task as usual, reporting the error properly
+            logger.debug("Failed checking outputs in bulk, will check them one by one", exc_info=1)
+
     def _check_complete_value(self, is_complete):
         if is_complete not in (True, False):
             raise Exception("Return value of Task.complete() must be boolean (was %r)" % is_complete)
 
+    def _get_timeout(self, task):
+        if task.worker_timeout is not None:
+            return task.worker_timeout or None
+        return self.__worker_timeout
+
+    def _get_resources(self, start_time, start_usage):
+        """ Wall time, CPU time (including waited for subprocesses) and max RSS since start """
+        usage = resource.getrusage(resource.RUSAGE_SELF), resource.getrusage(resource.RUSAGE_CHILDREN)
+        cpu_time = sum(u.ru_utime + u.ru_stime for u in usage) - sum(u.ru_utime + u.ru_stime for u in start_usage)
+        return {'wall_time': time.time() - start_time,
+                'cpu_time': cpu_time,
+                'max_rss': max(u.ru_maxrss for u in usage)}
+
+    def _run_with_timeout(self, task, timeout):
+        """ Runs the task in this process, raising TaskTimeoutException after timeout seconds """
+        def handler(signum, frame):
+            raise TaskTimeoutException('Task timed out after %s seconds' % timeout)
+        try:
+            previous_handler = signal.signal(signal.SIGALRM, handler)
+        except ValueError:
+            logger.warning('Can only enforce worker timeout of %s seconds from the main thread', timeout)
+            return task.run()
+
+        signal.setitimer(signal.ITIMER_REAL, timeout)
+        try:
+            return task.run()
+        finally:
+            signal.setitimer(signal.ITIMER_REAL, 0)
+            signal.signal(signal.SIGALRM, previous_handler)
+
+    def _get_profile_file(self, task):
+        """ Returns the file to write the profile of running the task to, or None if it shouldn't be profiled """
+        if not self.profile_dir:
+            return None
+        if self.__profile_families and task.task_family not in self.__profile_families:
+            return None
+        name = re.sub(r'[^\w.,=()-]', '_', task.task_id)
+        if len(name) > self.MAX_PROFILE_NAME_LENGTH:
+            name = '%s-%s' % (name[:self.MAX_PROFILE_NAME_LENGTH], hashlib.md5(task.task_id).hexdigest())
+        return os.path.join(self.profile_dir, name + '.prof')
+
+    @contextlib.contextmanager
+    def _timed(self, task, event):
+        """ Triggers the timing event with the seconds spent in the block """
+        start_time = time.time()
+        try:
+            yield
+        finally:
+            task.trigger_event(event, task, time.time() - start_time)
+
     def _run_task(self, task_id):
         task = self.__scheduled_tasks[task_id]
+        profile_file = self._get_profile_file(task)
+        if profile_file is None:
+            return self._execute_task(task)
 
+        try:
+            os.makedirs(self.profile_dir)
+        except OSError:
+            pass  # already exists, or some other worker process just created it
+        profiler = cProfile.Profile()
+        try:
+            return profiler.runcall(self._execute_task, task)
+        finally:
+            profiler.dump_stats(profile_file)
+            logger.info('[pid %s] Wrote profile of %s to %s', os.getpid(), task_id, profile_file)
+
+    def _execute_task(self, task):
+        task_id = task.task_id
         logger.info('[pid %s] Running   %s', os.getpid(), task_id)
+        start_time = time.time()
+        start_usage = resource.getrusage(resource.RUSAGE_SELF), resource.getrusage(resource.RUSAGE_CHILDREN)
+        timeout = self._get_timeout(task)
         try:
             # Verify that all the tasks are fulfilled!
             ok = True
-            for task_2 in task.deps():
-                if not task_2.complete():
-                    ok = False
-                    missing_dep = task_2
+            with self._timed(task, Event.DEPENDENCY_RECHECK_TIME):
+                for task_2 in task.deps():
+                    if not task_2.complete():
+                        ok = False
+                        missing_dep = task_2
 
             if not ok:
                 # TODO: possibly try to re-add task again ad pending
                 raise RuntimeError('Unfulfilled dependency %r at run time!\nPrevious tasks: %r' % (missing_dep.task_id, self._previous_tasks))
-            task.run()
-            error_message = json.dumps(task.on_success())
+            with self._timed(task, Event.RUN_TIME):
+                if timeout and self.worker_processes == 1:
+                    self._run_with_timeout(task, timeout)
+                else:
+                    # forked children are killed by the parent on timeout
+                    task.run()
+            with self._timed(task, Event.ON_SUCCESS_TIME):
+                error_message = json.dumps(task.on_success())
             logger.info('[pid %s] Done      %s', os.getpid(), task_id)
             task.trigger_event(Event.SUCCESS, task)
             status = DONE
@@ -265,11 +485,44 @@ class Worker(object):
             subject = "Luigi: %s FAILED" % task
             notifications.send_error_email(subject, error_message)
 
-        self.__scheduler.add_task(self.__id, task_id, status=status,
-                                  expl=error_message, runnable=None)
+        resources = self._get_resources(start_time, start_usage)
+        logger.debug('[pid %s] Resources used by %s: %r', os.getpid(), task_id, resources)
+        with self._timed(task, Event.STATUS_UPDATE_TIME), self._scheduler_call():
+            self.__scheduler.add_task(self.__id, task_id, status=status,
+                                      expl=error_message, runnable=None, resources=resources)
 
         return status
 
+    def _kill_timed_out_children(self, children):
+        """ Kills children (and their subprocesses) running longer than the timeout of their task
+
+        :return: True if any child was killed
+        """
+        killed = False
+        for pid, (task_id, start_time, timeout) in children.items():
+            if not timeout or time.time() < start_time + timeout:
+                continue
+            try:
+                os.killpg(pid, signal.SIGKILL)
+            except OSError:
+                continue  # just exited, will be reaped as usual
+            _, _, rusage = os.wait4(pid, 0)
+            del children[pid]
+            killed = True
+
+            task = self.__scheduled_tasks[task_id]
+            error_message = "Task %s timed out after %s seconds and was killed" % (task_id, timeout)
+            logger.error("[pid %s] %s", pid, error_message)
+            task.trigger_event(Event.FAILURE, task, TaskTimeoutException(error_message))
+            notifications.send_error_email("Luigi: %s FAILED" % task, error_message)
+            resources = {'wall_time': time.time() - start_time,
+                         'cpu_time': rusage.ru_utime + rusage.ru_stime,
+                         'max_rss': rusage.ru_maxrss}
+            with self._scheduler_call():
+                self.__scheduler.add_task(self.__id, task_id, status=FAILED,
+                                          expl=error_message, runnable=None, resources=resources)
+        return killed
+
     def _log_remote_tasks(self, running_tasks, n_pending_tasks):
         logger.info("Done")
         logger.info("There are no more tasks to run at this time")
@@ -279,16 +532,57 @@ class Worker(object):
         elif n_pending_tasks:
             logger.info("There are %s pending tasks possibly being run by other workers", n_pending_tasks)
 
-    def _reap_children(self, children):
-        died_pid, status = os.wait()
-        if died_pid in children:
-            children.remove(died_pid)
-        else:
-            logger.warning("Some random process %s died", died_pid)
+    def _reap_children(self, children, block=True):
+        """ Reaps an exited child, waiting for one unless block=False
+
+        Only the pids in children are waited for. Other subprocesses of this process, e.g. those
+        started by complete() in the discovery thread, are left to whoever started them.
+        """
+        while True:
+            if self._kill_timed_out_children(children):
+                return
+            for pid in children.keys():
+                if self._wait_child(pid, os.WNOHANG):
+                    del children[pid]
+                    return
+            if not block or not children:
+                return
+            if len(children) == 1 and not any(timeout for _, _, timeout in children.itervalues()):
+                # Can only block in wait() if there's no other child and no timeout to enforce
+                pid, = children.keys()
+                while not self._wait_child(pid, 0):
+                    pass
+                del children[pid]
+                return
+            time.sleep(self.TIMEOUT_POLL_INTERVAL)
+
+    def _wait_child(self, pid, options):
+        """ Returns whether the child pid has exited, reaping it """
+        try:
+            died_pid, status = os.waitpid(pid, options)
+        except OSError, e:
+            if e.errno == errno.EINTR:
+                return False
+            if e.errno == errno.ECHILD:
+                return True  # already reaped
+            raise
+        return died_pid == pid
 
     def _get_work(self):
+        if self.__run_queue:
+            logger.debug("Taking prefetched task, %d left in run queue", len(self.__run_queue) - 1)
+            task_id = self.__run_queue.popleft()
+            # Until then the scheduler hands the task to other workers if this one disconnects
+            with self._scheduler_call():
+                self.__scheduler.start_task(worker=self.__id, task_id=task_id)
+            return task_id, [], len(self.__run_queue)
+
         logger.debug("Asking scheduler for work...")
-        r = self.__scheduler.get_work(worker=self.__id, host=self.host)
+        with self._scheduler_call():
+            if self.__prefetch > 1:
+                r = self.__scheduler.get_work(worker=self.__id, host=self.host, max_tasks=self.__prefetch)
+            else:
+                r = self.__scheduler.get_work(worker=self.__id, host=self.host)
         # Support old version of scheduler
         if isinstance(r, tuple) or isinstance(r, list):
             n_pending_tasks, task_id = r
@@ -297,12 +591,39 @@ class Worker(object):
             n_pending_tasks = r['n_pending_tasks']
             task_id = r['task_id']
             running_tasks = r['running_tasks']
+            # Schedulers without max_tasks support only return task_id
+            self.__run_queue.extend(r.get('task_ids', [])[1:])
         return task_id, running_tasks, n_pending_tasks
 
+    def _release_queued_tasks(self):
+        """ Give tasks claimed but not started back to the scheduler, so other workers can run them """
+        if not self.__run_queue:
+            return
+        task_ids = list(self.__run_queue)
+        self.__run_queue.clear()
+        logger.info("Releasing %d prefetched tasks that were never started", len(task_ids))
+        try:
+            with self._scheduler_call():
+                self.__scheduler.release_tasks(worker=self.__id, task_ids=task_ids)
+        except:
+            logger.exception("Failed releasing tasks %s", task_ids)
+
     def _fork_task(self, children, task_id):
-        child_pid = os.fork()
+        # Fork while holding the locks, so the child can't inherit the scheduler lock, or locks in
+        # logging, RPC or imports, held by the discovery thread. Python 2 doesn't reset them at fork.
+        timeout = self._get_timeout(self.__scheduled_tasks[task_id])
+        with self._fork_lock:
+            with self._scheduler_lock:
+                child_pid = os.fork()
+        if timeout:
+            # Run the child in its own process group, so that any subprocesses are killed along
+            # with it on timeout. Called in both processes since either one might run first.
+            try:
+                os.setpgid(child_pid, child_pid)
+            except OSError:
+                pass  # already done by the other process
         if child_pid:
-            children.add(child_pid)
+            children[child_pid] = (task_id, time.time(), timeout)
         else:
             # need to have different random seeds...
             random.seed((os.getpid(), time.time()))
@@ -318,35 +639,49 @@ class Worker(object):
             yield
 
     def run(self):
-        children = set()
+        children = {}  # pid -> (task_id, start time, timeout)
         sleeper  = self._sleeper()
 
-        while True:
-            while len(children) >= self.worker_processes:
-                self._reap_children(children)
+        try:
+            while True:
+                while len(children) >= self.worker_processes:
+                    self._reap_children(children)
 
-            task_id, running_tasks, n_pending_tasks = self._get_work()
+                self._tasks_added.clear()
+                task_id, running_tasks, n_pending_tasks = self._get_work()
 
-            if task_id is None:
-                self._log_remote_tasks(running_tasks, n_pending_tasks)
-                if not children:
-                    if self.__keep_alive and running_tasks and n_pending_tasks:
-                        sleeper.next()
-                        continue
-                    else:
-                        break
-                else:
-                    self._reap_children(children)
+                if task_id is None and self._is_discovering():
+                    # More tasks might become runnable as the graph is being discovered
+                    self._tasks_added.wait(self.DISCOVERY_WAIT_INTERVAL)
+                    if children:
+                        self._reap_children(children, block=False)
                     continue
 
-            # task_id is not None:
-            logger.debug("Pending tasks: %s", n_pending_tasks)
-            if self.worker_processes > 1:
-                self._fork_task(children, task_id)
-            else:
-                self._run_task(task_id)
+                if task_id is None:
+                    self._join_discovery()
+                    self._log_remote_tasks(running_tasks, n_pending_tasks)
+                    if not children:
+                        if self.__keep_alive and running_tasks and n_pending_tasks:
+                            sleeper.next()
+                            continue
+                        else:
+                            break
+                    else:
+                        self._reap_children(children)
+                        continue
+
+                # task_id is not None:
+                logger.debug("Pending tasks: %s", n_pending_tasks)
+                if self.worker_processes > 1:
+                    self._fork_task(children, task_id)
+                else:
+                    self._run_task(task_id)
 
-            self._previous_tasks.append(task_id)
+                self._previous_tasks.append(task_id)
+        finally:
+            self._release_queued_tasks()
 
         while children:
             self._reap_children(children)
+
+        self._join_discovery()
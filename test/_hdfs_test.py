@@ -612,6 +612,13 @@ class _HdfsClientTest(HdfsTestCase):
         self.assertEquals(4, len(entries[5]), msg="%r" % entries)
         self.assertEquals(path + '/sub2/file4.dat', entries[5][0], msg="%r" % entries)
 
+    def test_exists_many(self):
+        path = self._test_dir()
+        self.put_file(luigi.LocalTarget("test/data/file1.dat"), "file1.dat", path)
+        self.put_file(luigi.LocalTarget("test/data/file2.dat"), "file2.dat", path, delpath=False)
+        paths = [path + '/file1.dat', path + '/file2.dat', path + '/file3.dat', path + '/nope/file1.dat']
+        self.assertEquals([True, True, False, False], self.fs.exists_many(paths))
+
     @mock.patch('luigi.hdfs.call_check')
     def test_cdh3_client(self, call_check):
         cdh3_client = luigi.hdfs.HdfsClientCdh3()
@@ -201,6 +201,22 @@ class TestS3Client(unittest.TestCase):
         self.assertTrue(s3_client.exists('s3://mybucket/tempdir2'))
         self.assertFalse(s3_client.exists('s3://mybucket/tempdir'))
 
+    @mock_s3
+    def test_exists_many(self):
+        s3_client = S3Client(AWS_ACCESS_KEY, AWS_SECRET_KEY)
+        s3_client.s3.create_bucket('mybucket')
+
+        s3_client.put(self.tempFilePath, 's3://mybucket/tempfile')
+        s3_client.put(self.tempFilePath, 's3://mybucket/tempdir0_$folder$')
+        s3_client.put(self.tempFilePath, 's3://mybucket/tempdir1/')
+        s3_client.put(self.tempFilePath, 's3://mybucket/tempdir2/subdir')
+
+        paths = ['s3://mybucket/tempfile', 's3://mybucket/temp', 's3://mybucket/tempdir0',
+                 's3://mybucket/tempdir1', 's3://mybucket/tempdir2', 's3://mybucket/tempdir',
+                 's3://mybucket/', 's3://mybucket/tempdir2/subdir', 's3://mybucket/tempdir2/nope']
+        self.assertEquals([True, False, True, True, True, False, True, True, False],
+                          s3_client.exists_many(paths))
+
     @mock_s3
     def test_get_key(self):
         s3_client = S3Client(AWS_ACCESS_KEY, AWS_SECRET_KEY)
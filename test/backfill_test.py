@@ -0,0 +1,85 @@
+# Copyright (c) 2012 Spotify AB
+#
+# Licensed under the Apache License, Version 2.0 (the "License"); you may not
+# use this file except in compliance with the License. You may obtain a copy of
+# the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+# WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+# License for the specific language governing permissions and limitations under
+# the License.
+
+import datetime
+import os
+import shutil
+import tempfile
+import unittest
+import mock
+import luigi
+import luigi.backfill
+import luigi.date_interval
+import luigi.file
+import luigi.notifications
+luigi.notifications.DEBUG = True
+
+OUTPUT_DIR = None
+
+
+class DailyTask(luigi.Task):
+    date = luigi.DateParameter()
+
+    def output(self):
+        return luigi.LocalTarget(os.path.join(OUTPUT_DIR, self.date.strftime('%Y-%m-%d')))
+
+    def run(self):
+        open(self.output().path, 'w').close()
+
+
+class HourlyTask(luigi.Task):
+    hour = luigi.DateHourParameter()
+
+    def output(self):
+        return luigi.LocalTarget(os.path.join(OUTPUT_DIR, self.hour.strftime('%Y-%m-%dT%H')))
+
+    def run(self):
+        open(self.output().path, 'w').close()
+
+
+class BackfillTest(unittest.TestCase):
+    def setUp(self):
+        global OUTPUT_DIR
+        OUTPUT_DIR = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(OUTPUT_DIR)
+
+    def test_missing(self):
+        for day in ('2014-01-01', '2014-01-03'):
+            open(os.path.join(OUTPUT_DIR, day), 'w').close()
+
+        r = luigi.backfill.RangeDaily(of='DailyTask', interval=luigi.date_interval.Custom.parse('2014-01-01-2014-01-06'))
+        with mock.patch.object(luigi.file.LocalFileSystem, 'exists_many', autospec=True,
+                               side_effect=lambda fs, paths: [os.path.exists(p) for p in paths]) as exists_many:
+            missing = r.requires()
+        self.assertEqual(1, exists_many.call_count)  # one bulk check instead of one per day
+        self.assertEqual([datetime.date(2014, 1, 2)] + [datetime.date(2014, 1, d) for d in range(4, 6)],
+                         [t.date for t in missing])
+        self.assertFalse(r.complete())
+
+    def test_run(self):
+        r = luigi.backfill.RangeHourly(of='HourlyTask', interval=luigi.date_interval.Date(2014, 1, 1))
+        luigi.build([r], local_scheduler=True)
+        self.assertEqual(24, len(os.listdir(OUTPUT_DIR)))
+        self.assertTrue(r.complete())
+        self.assertEqual([], r.requires())
+
+    def test_unknown_task(self):
+        r = luigi.backfill.RangeDaily(of='NoSuchTask', interval=luigi.date_interval.Date(2014, 1, 1))
+        self.assertRaises(Exception, r.requires)
+
+
+if __name__ == '__main__':
+    unittest.main()
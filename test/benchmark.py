@@ -0,0 +1,279 @@
+# Copyright (c) 2012 Spotify AB
+#
+# Licensed under the Apache License, Version 2.0 (the "License"); you may not
+# use this file except in compliance with the License. You may obtain a copy of
+# the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+# WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+# License for the specific language governing permissions and limitations under
+# the License.
+
+""" Micro-benchmarks for hot code paths. Not run as part of the test suite.
+
+Usage: python test/benchmark.py [name ...]
+"""
+
+import io
+import os
+import random
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+import datetime
+import luigi
+import luigi.format
+import luigi.interface
+
+
+def timeit(name, n, f):
+    t0 = time.time()
+    f(n)
+    elapsed = time.time() - t0
+    print '%-30s %10d ops %8.3fs %12.0f ops/s' % (name, n, elapsed, n / elapsed)
+
+
+class BenchmarkTask(luigi.Task):
+    date = luigi.DateParameter()
+    name = luigi.Parameter(default='foo')
+    n = luigi.IntParameter(default=10)
+    flag = luigi.BooleanParameter(default=False)
+
+
+def bench_task_instantiation(n=100000):
+    """ Instantiating distinct tasks, as done when scheduling a large backfill """
+    d = datetime.date(2000, 1, 1)
+
+    def run(n):
+        luigi.task.Register.clear_instance_cache()
+        for i in xrange(n):
+            BenchmarkTask(date=d, n=i)
+    timeit('task_instantiation', n, run)
+
+    def run_cached(n):
+        for i in xrange(n):
+            BenchmarkTask(date=d, n=0)
+    timeit('task_instantiation_cached', n, run_cached)
+
+
+def bench_task_id_parsing(n=100000):
+    """ Parsing distinct task ids, as done when recording task history """
+    task_ids = [BenchmarkTask(date=datetime.date(2000, 1, 1), name='a, b', n=i).task_id for i in xrange(n)]
+
+    def run(n):
+        luigi.task._id_cache.clear()
+        for task_id in task_ids:
+            luigi.task.id_to_name_and_params(task_id)
+    timeit('task_id_parsing', n, run)
+
+
+def bench_flatten(n=100):
+    """ Flattening a large dependency structure """
+    struct = [{'a': [i, (i, i)], 'b': None} for i in xrange(10000)]
+
+    def run(n):
+        for i in xrange(n):
+            luigi.task.flatten(struct)
+    timeit('flatten', n, run)
+
+
+def bench_cli_startup(n=2000):
+    """ Importing luigi, and parsing the command line with a large task registry """
+    root = os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir)
+
+    def run_import(n):
+        subprocess.check_call([sys.executable, '-c', 'import luigi'], env=dict(os.environ, PYTHONPATH=root))
+    timeit('import_luigi', 1, run_import)
+
+    for i in xrange(n):
+        type('CliBenchmarkTask%d' % i, (luigi.Task,), {'x': luigi.IntParameter(default=1)})
+
+    def run_parse(n):
+        luigi.interface.ArgParseInterface().parse(['CliBenchmarkTask0', '--x', '3'])
+    timeit('parse_cmdline_%d_tasks' % n, 1, run_parse)
+
+
+def bench_date_parameters(n=100000):
+    """ Parsing and serializing date and interval parameters, as done for every task id """
+    values = ['2014-01-%02d' % (i % 28 + 1) for i in xrange(n)]
+    date_param = luigi.DateParameter()
+    interval_param = luigi.DateIntervalParameter()
+
+    def run_date(n):
+        for s in values:
+            date_param.parse(s)
+    timeit('date_parse', n, run_date)
+
+    def run_interval(n):
+        for s in values:
+            interval_param.serialize(interval_param.parse(s))
+    timeit('date_interval_parse_serialize', n, run_interval)
+
+
+def bench_codecs(n=64):
+    """ Compressing and decompressing n MB of text files, and many small files, with each codec """
+    line = 'a moderately compressible line of text, number %d\n'
+    data = ''.join(line % i for i in xrange(1024 * 1024 / len(line)))
+    tmp_dir = tempfile.mkdtemp()
+    path = os.path.join(tmp_dir, 'data')
+    try:
+        for format in (luigi.format.Gzip, luigi.format.GzipSubprocess, luigi.format.BlockGzip,
+                       luigi.format.Bzip2, luigi.format.Bzip2Subprocess):
+            name = format.__name__.lower()
+            mb = n / 8 if 'bzip2' in name else n  # bzip2 is slow
+
+            def run_write(n):
+                with luigi.File(path, format).open('w') as f:
+                    for i in xrange(n):
+                        f.write(data)
+            timeit('%s_write_mb' % name, mb, run_write)
+
+            def run_read(n):
+                with luigi.File(path, format).open('r') as f:
+                    while f.read(1024 * 1024):
+                        pass
+            timeit('%s_read_mb' % name, mb, run_read)
+
+            def run_small_files(n):
+                for i in xrange(n):
+                    with luigi.File(path, format).open('w') as f:
+                        f.write(line)
+                    with luigi.File(path, format).open('r') as f:
+                        f.read()
+            timeit('%s_small_files' % name, 100, run_small_files)
+    finally:
+        shutil.rmtree(tmp_dir)
+
+
+def bench_codec_shapes(n=16):
+    """ Compressing and decompressing n MB of differently shaped data with each in-process codec """
+    size = 1024 * 1024
+    random.seed(0)
+    shapes = {
+        'text': ''.join('%d\tuser%d\t/some/page/%d\n' % (i, random.randrange(1000), random.randrange(77))
+                        for i in xrange(n * size / 20))[:n * size],
+        'json': ''.join('{"id": %d, "score": %f, "tags": ["a", "b"]}\n' % (i, random.random())
+                        for i in xrange(n * size / 40))[:n * size],
+        'random': os.urandom(n * size),
+        'zeros': '\0' * (n * size),
+    }
+    for format in (luigi.format.Gzip, luigi.format.BlockGzip, luigi.format.Bzip2,
+                   luigi.format.LZ4, luigi.format.Zstd, luigi.format.Snappy):
+        for shape, data in sorted(shapes.items()):
+            name = '%s_%s' % (format.__name__.lower(), shape)
+            output = io.BytesIO()
+            output.close = lambda: None
+            try:
+                writer = format.pipe_writer(output)
+            except ImportError, e:
+                print '%-30s skipped: %s' % (name, e)
+                break
+
+            def run_write(n):
+                for i in xrange(n):
+                    writer.write(data[i * size:(i + 1) * size])
+                writer.close()
+            timeit('%s_write_mb' % name, n, run_write)
+
+            def run_read(n):
+                reader = format.pipe_reader(io.BytesIO(output.getvalue()))
+                while reader.read(size):
+                    pass
+            timeit('%s_read_mb' % name, n, run_read)
+            print '%-30s %10.1f%%' % ('%s_ratio' % name, 100.0 * len(output.getvalue()) / (n * size))
+
+
+def bench_pipes(n=1000000):
+    """ Writing and reading n small records through subprocess pipes, compared to plain cat """
+    tmp_dir = tempfile.mkdtemp()
+    path = os.path.join(tmp_dir, 'data')
+    records = ['record %d\n' % i for i in xrange(n)]
+    try:
+        def run_cat(n):
+            with open(path, 'w') as f:
+                f.writelines(records)
+            with open(os.devnull, 'w') as devnull:
+                subprocess.check_call(['cat', path], stdout=devnull)
+        timeit('cat', n, run_cat)
+
+        def run_write(n):
+            with luigi.format.OutputPipeProcessWrapper(['cat'], open(path, 'w')) as f:
+                for record in records:
+                    f.write(record)
+        timeit('pipe_write', n, run_write)
+
+        def run_writelines(n):
+            with luigi.format.OutputPipeProcessWrapper(['cat'], open(path, 'w')) as f:
+                f.writelines(records)
+        timeit('pipe_writelines', n, run_writelines)
+
+        def run_iter(n):
+            for line in luigi.format.InputPipeProcessWrapper(['cat', path]):
+                pass
+        timeit('pipe_iter', n, run_iter)
+
+        def run_readline(n):
+            f = luigi.format.InputPipeProcessWrapper(['cat', path])
+            while f.readline():
+                pass
+            f.close()
+        timeit('pipe_readline', n, run_readline)
+
+        def run_batches(n):
+            for batch in luigi.format.InputPipeProcessWrapper(['cat', path]).iter_batches():
+                pass
+        timeit('pipe_iter_batches', n, run_batches)
+    finally:
+        shutil.rmtree(tmp_dir)
+
+
+def bench_local_files(n=16):
+    """ Copying n 64 MB local files and reading records at random offsets in them """
+    tmp_dir = tempfile.mkdtemp()
+    path = os.path.join(tmp_dir, 'data')
+    with open(path, 'w') as f:
+        f.write(os.urandom(1024 * 1024) * 64)
+    try:
+        def run_shutil_copy(n):
+            for i in xrange(n):
+                shutil.copy(path, path + '.copy')
+        timeit('shutil_copy', n, run_shutil_copy)
+
+        def run_file_copy(n):
+            for i in xrange(n):
+                luigi.File(path).copy(path + '.copy')
+        timeit('file_copy', n, run_file_copy)
+
+        offsets = [random.randrange(0, 63 * 1024 * 1024) for i in xrange(1000)]
+
+        def run_seek(n):
+            for i in xrange(n):
+                with luigi.File(path).open('r') as f:
+                    for offset in offsets:
+                        f.seek(offset)
+                        f.read(100)
+        timeit('file_seek_read_1000', n, run_seek)
+
+        def run_mmap(n):
+            for i in xrange(n):
+                with luigi.File(path).open('r', use_mmap=True) as m:
+                    for offset in offsets:
+                        m[offset:offset + 100]
+        timeit('file_mmap_slice_1000', n, run_mmap)
+    finally:
+        shutil.rmtree(tmp_dir)
+
+
+def main(names):
+    benchmarks = dict((name[len('bench_'):], f) for name, f in globals().items() if name.startswith('bench_'))
+    for name in names or sorted(benchmarks):
+        benchmarks[name]()
+
+
+if __name__ == '__main__':
+    main(sys.argv[1:])
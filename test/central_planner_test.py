@@ -157,6 +157,43 @@ class CentralPlannerTest(unittest.TestCase):
         self.assertEqual(s['task_id'], 'A')
         self.assertEqual(s['worker'], 'X')
 
+    def test_ping_returns_disconnect_delay(self):
+        self.assertEqual(self.sch.ping(WORKER), {'worker_disconnect_delay': 10})
+
+    def test_get_multiple_tasks(self):
+        self.sch.add_task(WORKER, 'C', deps=('A',))
+        self.sch.add_task(WORKER, 'A')
+        self.sch.add_task(WORKER, 'B')
+        r = self.sch.get_work(WORKER, max_tasks=5)
+        self.assertEqual(r['task_id'], 'A')
+        self.assertEqual(r['task_ids'], ['A', 'B'])  # C isn't runnable yet
+        self.assertEqual(self.sch.get_work(WORKER)['task_id'], None)
+
+    def test_release_tasks(self):
+        self.sch.add_task(worker='X', task_id='A')
+        self.sch.add_task(worker='X', task_id='B')
+        self.sch.add_task(worker='Y', task_id='B')
+        self.assertEqual(self.sch.get_work(worker='X', max_tasks=2)['task_ids'], ['A', 'B'])
+        self.assertEqual(self.sch.get_work(worker='Y')['task_id'], None)
+        self.sch.release_tasks(worker='Y', task_ids=['B'])  # not Y's to release
+        self.assertEqual(self.sch.get_work(worker='Y')['task_id'], None)
+        self.sch.release_tasks(worker='X', task_ids=['B'])
+        self.assertEqual(self.sch.get_work(worker='Y')['task_id'], 'B')
+
+    def test_prune_prefetched_tasks(self):
+        self.setTime(0)
+        for task_id in 'ABC':
+            self.sch.add_task(worker='X', task_id=task_id)
+        task_ids = self.sch.get_work(worker='X', max_tasks=3)['task_ids']
+        self.assertEqual(['A', 'B', 'C'], sorted(task_ids))
+        self.sch.start_task(worker='X', task_id=task_ids[1])
+        self.setTime(100)  # X disconnects, having started two of the tasks but not the last one
+        self.sch.prune()
+        self.assertEqual(['FAILED', 'FAILED', 'PENDING'], [self.sch._tasks[task_id].status for task_id in task_ids])
+        self.assertEqual(self.sch.get_work(worker='Y')['task_id'], None)  # not Y's
+        self.sch.add_task(worker='Y', task_id=task_ids[2])
+        self.assertEqual(self.sch.get_work(worker='Y')['task_id'], task_ids[2])
+
 class TestParameterSplit(unittest.TestCase):
     task_id_examples = [
         "TrackIsrcs()",
@@ -172,5 +209,9 @@ class TestParameterSplit(unittest.TestCase):
         for task_id in self.task_id_examples:
             self.sch._get_task_params(task_id)
 
+    def test_escaped_parameter_split(self):
+        self.assertEqual({'foo': 'a, b', 'bar': 'c'}, self.sch._get_task_params('Foo(foo=a\\, b, bar=c)'))
+        self.assertEqual('Foo', self.sch._get_task_name('Foo(foo=a\\, b, bar=c)'))
+
 if __name__ == '__main__':
     unittest.main()
@@ -131,6 +131,12 @@ class CmdlineTest(unittest.TestCase):
     def test_not_registered_class(self, print_usage):
         self.assertRaises(SystemExit, luigi.run, ['--local-scheduler', 'DontRegisterThisOne'])
 
+    def test_only_named_task_parsed(self):
+        with mock.patch.object(NonAmbiguousClass, 'get_nonglobal_params') as get_params:
+            tasks = luigi.interface.ArgParseInterface().parse(['SomeTask', '--n', '5'])
+        self.assertEqual([SomeTask(5)], tasks)
+        self.assertFalse(get_params.called)
+
     def test_unregistered_class(self):
         luigi.run(['--local-scheduler', 'TaskWithSameName'])
         self.assertEqual(TaskWithSameName().x, 43)
@@ -0,0 +1,91 @@
+# Copyright (c) 2012 Spotify AB
+#
+# Licensed under the Apache License, Version 2.0 (the "License"); you may not
+# use this file except in compliance with the License. You may obtain a copy of
+# the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+# WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+# License for the specific language governing permissions and limitations under
+# the License.
+
+import os
+import tempfile
+import unittest
+from ConfigParser import ConfigParser, NoOptionError, NoSectionError
+from luigi.configuration import LuigiConfigParser
+
+
+class ConfigParserTest(unittest.TestCase):
+    def setUp(self):
+        self.config = LuigiConfigParser()
+        self.config.set('foo', 'bar', '3')
+
+    def test_typed_get(self):
+        self.assertEqual(self.config.get('foo', 'bar'), '3')
+        self.assertEqual(self.config.getint('foo', 'bar'), 3)
+        self.assertEqual(self.config.getfloat('foo', 'bar'), 3.0)
+        self.assertEqual(self.config.get('foo', 'bar'), '3')
+
+    def test_default(self):
+        for i in xrange(2):
+            self.assertEqual(self.config.get('foo', 'baz', 'x'), 'x')
+            self.assertEqual(self.config.get('foo', 'baz', None), None)
+            self.assertEqual(self.config.getint('nope', 'baz', 4), 4)
+            self.assertRaises(NoOptionError, self.config.get, 'foo', 'baz')
+            self.assertRaises(NoSectionError, self.config.get, 'nope', 'baz')
+            self.assertRaises(NoOptionError, self.config.getint, 'foo', 'baz', 'x')
+
+    def test_cached(self):
+        calls = []
+
+        def get(config, section, option):
+            calls.append((section, option))
+            return ConfigParser.get(config, section, option)
+        self.assertEqual(self.config._get_with_default(get, 'foo', 'bar', None), '3')
+        self.assertEqual(self.config._get_with_default(get, 'foo', 'bar', None), '3')
+        self.assertEqual(self.config._get_with_default(get, 'foo', 'baz', None), None)
+        self.assertEqual(self.config._get_with_default(get, 'foo', 'baz', None), None)
+        self.assertEqual(calls, [('foo', 'bar'), ('foo', 'baz')])
+
+    def test_invalidated_on_set(self):
+        self.assertEqual(self.config.getint('foo', 'bar'), 3)
+        self.assertEqual(self.config.getint('foo', 'baz', 1), 1)
+        self.config.set('foo', 'bar', '4')
+        self.config.set('foo', 'baz', '5')
+        self.assertEqual(self.config.getint('foo', 'bar'), 4)
+        self.assertEqual(self.config.getint('foo', 'baz', 1), 5)
+        self.config.remove_option('foo', 'baz')
+        self.assertEqual(self.config.getint('foo', 'baz', 1), 1)
+        self.config.remove_section('foo')
+        self.assertEqual(self.config.getint('foo', 'bar', 1), 1)
+
+    def test_invalidated_on_read(self):
+        self.assertEqual(self.config.get('foo', 'baz', None), None)
+        fd, fn = tempfile.mkstemp()
+        try:
+            os.write(fd, '[foo]\nbaz: qux\n')
+            os.close(fd)
+            self.config.read([fn])
+        finally:
+            os.remove(fn)
+        self.assertEqual(self.config.get('foo', 'baz', None), 'qux')
+
+    def test_change_listener(self):
+        changes = []
+        listener = lambda section, option: changes.append((section, option))
+        LuigiConfigParser.add_change_listener(listener)
+        try:
+            self.config.set('foo', 'bar', '4')
+            self.config.read([])
+        finally:
+            LuigiConfigParser.remove_change_listener(listener)
+        self.config.set('foo', 'bar', '5')
+        self.assertEqual(changes, [('foo', 'bar'), (None, None)])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -16,6 +16,7 @@ import luigi
 from luigi.parameter import DateIntervalParameter as DI
 import unittest
 import datetime
+import pickle
 
 
 class DateIntervalTest(unittest.TestCase):
@@ -113,3 +114,52 @@ class DateIntervalTest(unittest.TestCase):
 
         task = luigi.interface.ArgParseInterface().parse(["MyTaskNoDefault", "--di", "2012-10"])[0]
         self.assertEquals(task.di, other)
+
+    def test_hash(self):
+        intervals = set([DI().parse('2012-01'), luigi.date_interval.Month(2012, 1), DI().parse('2012-01-01')])
+        self.assertEqual(len(intervals), 2)
+        self.assertTrue(luigi.date_interval.Date(2012, 1, 1) in intervals)
+
+    def test_slots(self):
+        di = luigi.date_interval.Week(2012, 3)
+        self.assertFalse(hasattr(di, '__dict__'))
+        self.assertRaises(AttributeError, setattr, di, 'foo', 1)
+
+    def test_pickle(self):
+        for s in ['2012', '2012-03', '2012-W03', '2012-03-04', '2012-03-04-2012-03-08']:
+            di = DI().parse(s)
+            for protocol in xrange(pickle.HIGHEST_PROTOCOL + 1):
+                other = pickle.loads(pickle.dumps(di, protocol))
+                self.assertEqual(other, di)
+                self.assertEqual(type(other), type(di))
+                self.assertEqual(str(other), s)
+
+    def test_parse_memoized(self):
+        self.assertTrue(DI().parse('2012-03') is DI().parse('2012-03'))
+        self.assertEqual(DI().serialize(DI().parse('2012-03')), '2012-03')
+        self.assertRaises(ValueError, DI().parse, 'foo')
+        self.assertRaises(ValueError, DI().parse, 'foo')
+
+    def test_parsed_immutable(self):
+        di = DI().parse('2012-03')
+        self.assertRaises(AttributeError, setattr, di, 'date_a', datetime.date(2000, 1, 1))
+        self.assertRaises(AttributeError, setattr, di, 'date_b', datetime.date(2000, 1, 1))
+        self.assertEqual(datetime.date(2012, 3, 1), DI().parse('2012-03').date_a)
+
+    def test_parse_memo_bounded(self):
+        memo = DI.parse.im_func.memo
+        size = luigi.parameter._MEMO_SIZE
+        luigi.parameter._MEMO_SIZE = 10
+        try:
+            for y in xrange(2000, 2020):
+                self.assertEqual(str(DI().parse(str(y))), str(y))
+                self.assertTrue(len(memo) <= 10)
+        finally:
+            luigi.parameter._MEMO_SIZE = size
+
+    def test_parse_memo_per_class(self):
+        class SubDI(DI):
+            def parse(self, s):
+                return super(SubDI, self).parse(s).next()
+        self.assertEqual(str(DI().parse('2012-05')), '2012-05')
+        self.assertEqual(str(SubDI().parse('2012-05')), '2012-06')
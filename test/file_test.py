@@ -14,8 +14,13 @@
 
 from luigi import File
 from luigi.file import LocalFileSystem 
+import luigi.file
 import unittest
+import ctypes
+import errno
+import mock
 import os
+import re
 import gzip
 import bz2
 import luigi.format
@@ -161,6 +166,38 @@ class FileTest(unittest.TestCase):
         self.assertTrue(os.path.exists(self.copy))
 
 
+    def test_move_across_file_systems(self):
+        rename = os.rename
+
+        def cross_device_rename(src, dst):
+            if src == self.path:
+                raise OSError(errno.EXDEV, 'Invalid cross-device link')
+            rename(src, dst)
+
+        t = File(self.path)
+        with t.open('w') as f:
+            f.write('test')
+        with mock.patch('os.rename', cross_device_rename):
+            t.move(self.copy)
+        self.assertFalse(os.path.exists(self.path))
+        self.assertEqual('test', open(self.copy).read())
+        self.assertEqual([os.path.basename(self.copy)],
+                         [n for n in os.listdir(os.path.dirname(os.path.abspath(self.copy))) if n.startswith(os.path.basename(self.copy))])
+
+    def test_mmap(self):
+        t = File(self.path)
+        with t.open('w') as f:
+            f.write('foo 123\nbar 456\n')
+        with t.open('r', use_mmap=True) as m:
+            self.assertEqual(16, len(m))
+            self.assertEqual('bar', m[8:11])
+            self.assertEqual(['123', '456'], re.findall('[0-9]+', m))
+            self.assertRaises(TypeError, m.write, 'x')
+        self.assertRaises(ValueError, File(self.path, format=luigi.format.Gzip).open, 'r', use_mmap=True)
+        open(self.path, 'w').close()
+        self.assertRaises(ValueError, t.open, 'r', use_mmap=True)
+
+
 class FileCreateDirectoriesTest(FileTest):
     path = '/tmp/%s/xyz/test.txt' % random.randint(0, 999999999)
     copy = '/tmp/%s/xyz_2/copy.txt' % random.randint(0, 999999999)
@@ -172,6 +209,82 @@ class FileRelativeTest(FileTest):
     copy = 'copy.txt'
 
 
+class CopyFileTest(unittest.TestCase):
+    src = '/tmp/luigi-copy-file-test'
+    dst = '/tmp/luigi-copy-file-test.copy'
+    data = ''.join('line %d\n' % i for i in xrange(300000))
+
+    def setUp(self):
+        with open(self.src, 'w') as f:
+            f.write(self.data)
+        os.chmod(self.src, 0640)
+
+    def tearDown(self):
+        for path in (self.src, self.dst):
+            if os.path.exists(path):
+                os.remove(path)
+
+    def check(self):
+        luigi.file.copy_file(self.src, self.dst)
+        self.assertEqual(self.data, open(self.dst).read())
+        self.assertEqual(0640, os.stat(self.dst).st_mode & 0777)
+
+    def test_copy(self):
+        self.check()
+        with open(self.dst, 'w') as f:
+            f.write(self.data * 2)
+        self.check()  # truncates
+
+    def test_without_kernel_copy(self):
+        with mock.patch('luigi.file._kernel_copy_functions', lambda: []):
+            self.check()
+
+    def test_kernel_copy_not_supported(self):
+        def unsupported(in_fd, out_fd, count):
+            ctypes.set_errno(errno.ENOSYS)
+            return -1
+        with mock.patch('luigi.file._kernel_copy_functions', lambda: [unsupported]):
+            self.check()
+
+    def test_kernel_copy_error(self):
+        def failing(in_fd, out_fd, count):
+            ctypes.set_errno(errno.EIO)
+            return -1
+        with mock.patch('luigi.file._kernel_copy_functions', lambda: [failing]):
+            self.assertRaises(OSError, luigi.file.copy_file, self.src, self.dst)
+
+
+class ExistsManyTest(unittest.TestCase):
+    path = '/tmp/luigi-exists-many-test'
+
+    def setUp(self):
+        if os.path.exists(self.path):
+            shutil.rmtree(self.path)
+        os.makedirs(self.path)
+        for name in ('a', 'c'):
+            open(os.path.join(self.path, name), 'w').close()
+
+    def tearDown(self):
+        shutil.rmtree(self.path)
+
+    def test_exists_many(self):
+        fs = LocalFileSystem()
+        paths = [os.path.join(self.path, name) for name in ('a', 'b', 'c')]
+        paths += [self.path + '/', '/tmp/luigi-exists-many-missing/a', '/tmp/luigi-exists-many-missing/b']
+        self.assertEquals([True, False, True, True, False, False], fs.exists_many(paths))
+
+    def test_exists_many_broken_symlink(self):
+        fs = LocalFileSystem()
+        os.symlink(os.path.join(self.path, 'missing'), os.path.join(self.path, 'b'))
+        paths = [os.path.join(self.path, name) for name in ('a', 'b', 'c')]
+        self.assertEquals([fs.exists(path) for path in paths], fs.exists_many(paths))
+        self.assertEquals([True, False, True], fs.exists_many(paths))
+
+    def test_exists_many_targets(self):
+        targets = [File(os.path.join(self.path, name)) for name in ('a', 'b', 'c')]
+        self.assertEquals([True, False, True], File.exists_many(targets))
+
+
 class TmpFileTest(unittest.TestCase):
     def test_tmp(self):
         t = File(is_tmp=True)
@@ -0,0 +1,299 @@
+# Copyright (c) 2012 Spotify AB
+#
+# Licensed under the Apache License, Version 2.0 (the "License"); you may not
+# use this file except in compliance with the License. You may obtain a copy of
+# the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+# WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+# License for the specific language governing permissions and limitations under
+# the License.
+
+import bz2
+import io
+import os
+import struct
+import subprocess
+import tempfile
+import unittest
+import zlib
+import luigi.format
+from luigi import File
+from luigi.format import InputPipeProcessWrapper, OutputPipeProcessWrapper
+
+DATA = ''.join('line %d\n' % i for i in xrange(10000))
+
+
+def installed(module):
+    try:
+        __import__(module)
+        return True
+    except ImportError:
+        return False
+
+
+def gzip_compress(data):
+    compressor = zlib.compressobj(6, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+    return compressor.compress(data) + compressor.flush()
+
+
+class PipeTest(unittest.TestCase):
+    def setUp(self):
+        fd, self.path = tempfile.mkstemp()
+        os.close(fd)
+
+    def tearDown(self):
+        os.remove(self.path)
+
+    def test_buffered_write(self):
+        output = OutputPipeProcessWrapper(['cat'], open(self.path, 'w'), buffer_size=100)
+        output.write('a' * 50)
+        output.writelines(['b' * 30, 'c' * 30])
+        output.close()
+        self.assertEquals('a' * 50 + 'b' * 30 + 'c' * 30, open(self.path).read())
+
+    def test_iter_batches(self):
+        with open(self.path, 'w') as f:
+            f.write(DATA + 'last')
+        batches = list(InputPipeProcessWrapper(['cat', self.path]).iter_batches(1000))
+        self.assertTrue(len(batches) > 10)
+        self.assertEquals((DATA + 'last').split('\n'), sum(batches, []))
+        self.assertEquals([['foo'], ['bar']],
+                          list(luigi.format.Gzip.pipe_reader(io.BytesIO(gzip_compress('foo\nbar'))).iter_batches(4)))
+
+    def test_readinto(self):
+        with open(self.path, 'w') as f:
+            f.write(DATA)
+        for reader in (InputPipeProcessWrapper(['cat', self.path]),
+                       luigi.format.Gzip.pipe_reader(io.BytesIO(gzip_compress(DATA)))):
+            b = bytearray(10)
+            self.assertEquals(10, reader.readinto(b))
+            self.assertEquals(DATA[:10], str(b))
+            self.assertEquals(DATA[10:], reader.read())
+            reader.close()
+
+
+class CodecTest(unittest.TestCase):
+    formats = [(luigi.format.Gzip, luigi.format.GzipSubprocess),
+               (luigi.format.Bzip2, luigi.format.Bzip2Subprocess)]
+
+    def setUp(self):
+        fd, self.path = tempfile.mkstemp()
+        os.close(fd)
+        os.remove(self.path)
+
+    def tearDown(self):
+        if os.path.exists(self.path):
+            os.remove(self.path)
+
+    def test_fileno(self):
+        "Tests that subprocesses can write to the in-process codecs, like to the subprocess ones"
+        for format in (luigi.format.Gzip, luigi.format.Bzip2, luigi.format.BlockGzip):
+            with File(self.path, format).open('w') as f:
+                f.write('head\n')
+                self.assertTrue(f.name.startswith(self.path))
+                p = subprocess.Popen(['cat'], stdin=subprocess.PIPE, stdout=f)
+                p.communicate(DATA)
+                self.assertEquals(0, p.returncode)
+                os.fstat(f.fileno())
+            self.assertEquals('head\n' + DATA, File(self.path, format).open('r').read())
+            os.remove(self.path)
+
+    def test_compatible_with_subprocesses(self):
+        for format, subprocess_format in self.formats:
+            with File(self.path, format).open('w') as f:
+                f.write(DATA)
+            self.assertEquals(DATA, File(self.path, subprocess_format).open('r').read())
+            os.remove(self.path)
+
+            with File(self.path, subprocess_format).open('w') as f:
+                f.write(DATA)
+            self.assertEquals(DATA.splitlines(True), list(File(self.path, format).open('r')))
+            os.remove(self.path)
+
+    def test_concatenated_streams(self):
+        for format, compress in [(luigi.format.Gzip, gzip_compress), (luigi.format.Bzip2, bz2.compress)]:
+            data = ''.join(compress(part) for part in ['foo\n', 'bar\n', ''])
+            for chunk_size in (1, 7, len(data) / 3, len(data)):
+                reader = format.pipe_reader(io.BytesIO(data))
+                reader.chunk_size = chunk_size
+                self.assertEquals('foo\nbar\n', reader.read())
+
+    def test_truncated(self):
+        for format, compress in [(luigi.format.Gzip, gzip_compress), (luigi.format.Bzip2, bz2.compress)]:
+            compressed = compress(DATA)
+            for end in (1, 8, len(compressed) / 2, len(compressed) - 1):
+                for data in (compressed[:end], compressed + compressed[:end]):
+                    self.assertRaises(IOError, format.pipe_reader(io.BytesIO(data)).read)
+
+    def test_buffered_writes(self):
+        output = io.BytesIO()
+        output.close = lambda: None
+        writer = luigi.format.Gzip.pipe_writer(output)
+        writer.buffer_size = 100
+        writer.write('a' * 10)
+        self.assertEquals('', output.getvalue())
+        writer.writelines(['a' * 50] * 2)
+        self.assertNotEquals('', output.getvalue())
+        writer.writeLine('')
+        writer.close()
+        self.assertEquals('a' * 110 + '\n', luigi.format.Gzip.pipe_reader(io.BytesIO(output.getvalue())).read())
+
+    def test_abort(self):
+        try:
+            with File(self.path, luigi.format.Gzip).open('w') as f:
+                f.write('foo')
+                raise ValueError
+        except ValueError:
+            pass
+        self.assertFalse(os.path.exists(self.path))
+
+    def test_fileno(self):
+        with File(self.path, luigi.format.Bzip2).open('w') as f:
+            f.write(DATA)
+        reader = File(self.path, luigi.format.Bzip2).open('r')
+        self.assertEquals(DATA, InputPipeProcessWrapper(['cat'], reader).read())
+
+
+class BlockGzipTest(unittest.TestCase):
+    def write(self, data, workers=2, buffer_size=None):
+        output = io.BytesIO()
+        output.close = lambda: None
+        writer = luigi.format.BlockGzipWriter(output, workers)
+        if buffer_size:
+            writer.buffer_size = buffer_size
+        for i in xrange(0, len(data), 1000):
+            writer.write(data[i:i + 1000])
+        writer.close()
+        return output.getvalue(), writer
+
+    def read(self, compressed, chunk_size=None):
+        reader = luigi.format.BlockGzipReader(io.BytesIO(compressed), 2)
+        if chunk_size:
+            reader.chunk_size = chunk_size
+        return reader.read()
+
+    def test_round_trip(self):
+        for buffer_size in (1, 100000, None):
+            compressed, writer = self.write(DATA, buffer_size=buffer_size)
+            self.assertTrue(compressed.endswith(luigi.format.BGZF_EOF))
+            self.assertEquals(DATA, self.read(compressed))
+            self.assertEquals(DATA, self.read(compressed, chunk_size=1000))
+            gunzip = subprocess.Popen(['gunzip'], stdin=subprocess.PIPE, stdout=subprocess.PIPE)
+            self.assertEquals(DATA, gunzip.communicate(compressed)[0])
+
+    def test_full_blocks(self):
+        data = DATA * 3
+        compressed, writer = self.write(data, buffer_size=100000)
+        self.assertEquals([i * luigi.format.BGZF_BLOCK_SIZE for i in xrange(len(data) / luigi.format.BGZF_BLOCK_SIZE + 1)],
+                          [offset for compressed_offset, offset in writer.index])
+
+    def test_index(self):
+        data = DATA * 3
+        compressed, writer = self.write(data)
+        for compressed_offset, offset in writer.index:
+            self.assertEquals(data[offset:], self.read(compressed[compressed_offset:]))
+        gzi = io.BytesIO()
+        writer.write_gzi(gzi)
+        self.assertEquals(struct.pack('<Q', len(writer.index) - 1), gzi.getvalue()[:8])
+        self.assertEquals(8 + 16 * (len(writer.index) - 1), len(gzi.getvalue()))
+
+    def test_other_gzip(self):
+        compressed, writer = self.write('foo\n')
+        self.assertEquals(DATA, self.read(gzip_compress(DATA)))
+        self.assertEquals('foo\n' + DATA + 'bar\n', self.read(compressed + gzip_compress(DATA) + gzip_compress('bar\n')))
+
+    def test_truncated(self):
+        compressed, writer = self.write(DATA)
+        self.assertRaises(IOError, self.read, compressed[:-40])
+        self.assertRaises(IOError, self.read, compressed[:-len(luigi.format.BGZF_EOF)])
+        self.assertRaises(IOError, self.read, gzip_compress(DATA)[:-10])
+        self.assertRaises(IOError, self.read, compressed + gzip_compress(DATA)[:-10])
+
+    def test_file(self):
+        fd, path = tempfile.mkstemp()
+        os.close(fd)
+        try:
+            with File(path, luigi.format.BlockGzip).open('w') as f:
+                f.write(DATA)
+            self.assertEquals(DATA.splitlines(True), list(File(path, luigi.format.BlockGzip).open('r')))
+            self.assertEquals(DATA, File(path, luigi.format.Gzip).open('r').read())
+        finally:
+            os.remove(path)
+
+
+class FastCodecTest(unittest.TestCase):
+    def compress(self, format, data):
+        output = io.BytesIO()
+        output.close = lambda: None
+        with format.pipe_writer(output) as writer:
+            for i in xrange(0, len(data), 1000):
+                writer.write(data[i:i + 1000])
+        return output.getvalue()
+
+    def check(self, format):
+        compressed = self.compress(format, DATA)
+        self.assertTrue(len(compressed) < len(DATA) / 2)
+        self.assertEquals(format, luigi.format.detect_format(compressed))
+        for chunk_size in (100, 1024 * 1024):
+            reader = format.pipe_reader(io.BytesIO(compressed + self.compress(format, 'foo\n')))
+            reader.chunk_size = chunk_size
+            self.assertEquals(DATA + 'foo\n', reader.read())
+        self.assertEquals(DATA, luigi.format.AutoDetect.pipe_reader(io.BytesIO(compressed)).read())
+        for end in (1, len(compressed) / 2, len(compressed) - 1):
+            self.assertRaises(IOError, format.pipe_reader(io.BytesIO(compressed[:end])).read)
+
+    @unittest.skipIf(not installed('lz4.frame'), 'lz4 not installed')
+    def test_lz4(self):
+        self.check(luigi.format.LZ4)
+
+    @unittest.skipIf(not installed('zstandard'), 'zstandard not installed')
+    def test_zstd(self):
+        self.check(luigi.format.Zstd)
+
+    @unittest.skipIf(not installed('snappy'), 'python-snappy not installed')
+    def test_snappy(self):
+        self.check(luigi.format.Snappy)
+
+
+class AutoDetectTest(unittest.TestCase):
+    def read(self, data):
+        return luigi.format.AutoDetect.pipe_reader(io.BytesIO(data)).read()
+
+    def test_detect(self):
+        self.assertEquals(luigi.format.BlockGzip, luigi.format.detect_format(gzip_compress(DATA)))
+        self.assertEquals(luigi.format.Bzip2, luigi.format.detect_format(bz2.compress(DATA)))
+        self.assertEquals(None, luigi.format.detect_format(DATA))
+        self.assertEquals(None, luigi.format.detect_format(''))
+
+    def test_read(self):
+        self.assertEquals(DATA, self.read(gzip_compress(DATA)))
+        self.assertEquals(DATA, self.read(bz2.compress(DATA)))
+        self.assertEquals(DATA, self.read(DATA))
+        self.assertEquals('a', self.read('a'))
+        self.assertEquals('', self.read(''))
+
+    def test_file(self):
+        class GzipAutoDetect(luigi.format.AutoDetect):
+            writer = luigi.format.Gzip
+
+        fd, path = tempfile.mkstemp()
+        os.close(fd)
+        try:
+            with File(path, GzipAutoDetect).open('w') as f:
+                f.write(DATA)
+            self.assertEquals(DATA, File(path, luigi.format.Gzip).open('r').read())
+            self.assertEquals(DATA.splitlines(True), list(File(path, GzipAutoDetect).open('r')))
+            with File(path, luigi.format.AutoDetect).open('w') as f:
+                f.write(DATA)
+            self.assertEquals(DATA, open(path).read())
+            self.assertEquals(DATA, File(path, luigi.format.AutoDetect).open('r').read())
+        finally:
+            os.remove(path)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,443 @@
+# Copyright (c) 2012 Spotify AB
+#
+# Licensed under the Apache License, Version 2.0 (the "License"); you may not
+# use this file except in compliance with the License. You may obtain a copy of
+# the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+# WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+# License for the specific language governing permissions and limitations under
+# the License.
+
+import datetime
+import gzip
+import io
+import os
+import shutil
+import sys
+import tempfile
+import threading
+import time
+import unittest
+import mock
+from helpers import with_config
+import luigi.format
+import luigi.target
+from luigi import hdfs
+
+# Stand-in for a command daemon, answering for a file system with just /data and /data/a
+DAEMON = r'''
+import json, sys, time
+log = open(sys.argv[1], 'a')
+ls = 'Found 1 items\n-rw-r--r--   3 luigi supergroup          7 2014-01-01 00:00 /data/a\n'
+for line in iter(sys.stdin.readline, ''):
+    args = json.loads(line)
+    log.write(' '.join(args) + '\n')
+    log.flush()
+    if args[:2] == ['fs', '-stat'] and args[2] in ('/data', '/data/a'):
+        response = {'returncode': 0, 'stdout': '2014-01-01 00:00:00\n', 'stderr': ''}
+    elif args[:2] == ['fs', '-stat']:
+        response = {'returncode': 1, 'stdout': '', 'stderr': 'stat: `%s\': No such file or directory\n' % args[2]}
+    elif args[:2] == ['fs', '-ls']:
+        response = {'returncode': 0, 'stdout': ls, 'stderr': ''}
+    elif args[:2] == ['fs', '-mv']:
+        time.sleep(60)
+    else:
+        sys.exit(1)
+    sys.stdout.write(json.dumps(response) + '\n')
+    sys.stdout.flush()
+'''
+
+# Stand-in for the hadoop command line, where everything exists
+HADOOP = r'''
+import sys
+open(sys.argv[1], 'a').write(' '.join(sys.argv[2:]) + '\n')
+'''
+
+
+class HdfsCommandDaemonTest(unittest.TestCase):
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        self.daemon_log = os.path.join(self.tmp_dir, 'daemon.log')
+        self.hadoop_log = os.path.join(self.tmp_dir, 'hadoop.log')
+        daemon = os.path.join(self.tmp_dir, 'daemon.py')
+        open(daemon, 'w').write(DAEMON)
+        hadoop = os.path.join(self.tmp_dir, 'hadoop')
+        open(hadoop, 'w').write('#!/bin/sh\nexec %s %s %s "$@"\n' % (
+            sys.executable, os.path.join(self.tmp_dir, 'hadoop.py'), self.hadoop_log))
+        os.chmod(hadoop, 0755)
+        open(os.path.join(self.tmp_dir, 'hadoop.py'), 'w').write(HADOOP)
+        self.daemon_command = '%s %s %s' % (sys.executable, daemon, self.daemon_log)
+        self.hadoop = hadoop
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp_dir)
+
+    def read_log(self, fn):
+        if not os.path.exists(fn):
+            return []
+        return open(fn).read().splitlines()
+
+    def test_commands(self):
+        client = hdfs.HdfsClient(daemon_command=self.daemon_command)
+        try:
+            self.assertTrue(client.exists('/data'))
+            self.assertFalse(client.exists('/nope'))
+            self.assertEquals(['/data/a'], list(client.listdir('/data')))
+            self.assertEquals([(7, '-')], [x[1:] for x in client.listdir('/data', include_size=True, include_type=True)])
+            self.assertTrue(isinstance(list(client.listdir('/data'))[0], str))
+        finally:
+            client.daemon.close()
+        self.assertEquals(['fs -stat /data', 'fs -stat /nope', 'fs -ls /data', 'fs -ls /data', 'fs -ls /data'],
+                          self.read_log(self.daemon_log))
+
+    def test_failure(self):
+        @with_config({'hadoop': {'command': self.hadoop}})
+        def run():
+            client = hdfs.HdfsClient(daemon_command=self.daemon_command)
+            self.assertTrue(client.exists('/data'))
+            # Not supported by the daemon, so it exits. It might have been run, so it isn't run again
+            self.assertRaises(hdfs.HDFSCliError, client.remove, '/data')
+            self.assertTrue(client.daemon.failed)
+            self.assertTrue(client.exists('/nope'))
+        run()
+        self.assertEquals(['fs -stat /data', 'fs -rm -r /data'], self.read_log(self.daemon_log))
+        self.assertEquals(['fs -stat /nope'], self.read_log(self.hadoop_log))
+
+    def test_fallback(self):
+        @with_config({'hadoop': {'command': self.hadoop}})
+        def run():
+            client = hdfs.HdfsClient(daemon_command=os.path.join(self.tmp_dir, 'missing'))
+            self.assertTrue(client.exists('/nope'))  # the daemon can't be started, so the command line is used
+            self.assertTrue(client.daemon.failed)
+        run()
+        self.assertEquals(['fs -stat /nope'], self.read_log(self.hadoop_log))
+
+    def test_timeout(self):
+        @with_config({'hadoop': {'command': self.hadoop}, 'hdfs': {'daemon_timeout': '1'}})
+        def run():
+            client = hdfs.HdfsClient(daemon_command=self.daemon_command)
+            t0 = time.time()
+            self.assertRaises(hdfs.HDFSCliError, client.rename, '/data/a', '/data/b')
+            self.assertTrue(time.time() - t0 < 10)
+            self.assertTrue(client.daemon.failed)
+            self.assertTrue(client.exists('/nope'))
+        run()
+        self.assertEquals(['fs -stat /data', 'fs -mv /data/a /data/b'], self.read_log(self.daemon_log))
+        self.assertEquals(['fs -stat /nope'], self.read_log(self.hadoop_log))
+
+    def test_no_daemon(self):
+        @with_config({'hadoop': {'command': self.hadoop}})
+        def run():
+            client = hdfs.HdfsClient()
+            self.assertEquals(None, client.daemon)
+            self.assertTrue(client.exists('/nope'))
+        run()
+        self.assertEquals(['fs -stat /nope'], self.read_log(self.hadoop_log))
+
+    def test_config(self):
+        @with_config({'hdfs': {'daemon_command': self.daemon_command}})
+        def run():
+            return hdfs.HdfsClient()
+        client = run()
+        try:
+            self.assertTrue(client.exists('/data/a'))
+        finally:
+            client.daemon.close()
+        self.assertEquals(['fs -stat /data/a'], self.read_log(self.daemon_log))
+
+    def test_config_change(self):
+        @with_config({'hdfs': {'daemon_command': self.daemon_command}})
+        def run():
+            client = hdfs.get_autoconfig_client()
+            self.assertTrue(client.exists('/data/a'))
+            process = client.daemon._process
+            luigi.configuration.get_config().set('hdfs', 'read_workers', '2')
+            self.assertFalse(hdfs.get_autoconfig_client() is client)
+            self.assertEquals(0, process.poll())  # closed instead of left running
+        try:
+            run()
+        finally:
+            hdfs._autoconfig_client = None
+
+
+class BatchedCommandsTest(unittest.TestCase):
+    def setUp(self):
+        self.client = hdfs.HdfsClient(daemon_command='')
+
+    def test_exists_many(self):
+        stderr = ("stat: `/a/c': No such file or directory\n"
+                  "stat: `/b/*': No such file or directory\n")
+        with mock.patch.object(self.client, '_call', return_value=(1, '', stderr)) as call:
+            self.assertEquals([True, False, True, False], self.client.exists_many(['/a/b', '/a/c', '/a/d', '/b/*']))
+        call.assert_called_once_with(['hadoop', 'fs', '-stat', '/a/b', '/a/c', '/a/d', '/b/*'])
+
+    def test_exists_many_all_exist(self):
+        with mock.patch.object(self.client, '_call', return_value=(0, '', '')) as call:
+            self.assertEquals([True, True], self.client.exists_many(['/a', '/b']))
+        self.assertEquals(1, call.call_count)
+
+    def test_exists_many_batches(self):
+        self.client.max_batch_length = 12
+        with mock.patch.object(self.client, '_call', return_value=(0, '', '')) as call:
+            self.assertEquals([True] * 5, self.client.exists_many(['/aa', '/bb', '/cc', '/dd', '/ee']))
+        self.assertEquals([mock.call(['hadoop', 'fs', '-stat', '/aa', '/bb', '/cc']),
+                           mock.call(['hadoop', 'fs', '-stat', '/dd', '/ee'])], call.call_args_list)
+
+    def test_exists_many_other_error(self):
+        def call(cmd):
+            if len(cmd) > 4:
+                return 1, '', "stat: `/b': No such file or directory\nstat: Permission denied: /c\n"
+            elif cmd[3] == '/c':
+                return 1, '', "stat: Permission denied: /c\n"
+            return {'/a': (0, '', ''), '/b': (1, '', "stat: `/b': No such file or directory\n")}[cmd[3]]
+        with mock.patch.object(self.client, '_call', side_effect=call):
+            self.assertEquals([True, False], self.client.exists_many(['/a', '/b']))
+            self.assertRaises(hdfs.HDFSCliError, self.client.exists_many, ['/a', '/b', '/c'])
+
+    def test_exists_many_empty(self):
+        with mock.patch.object(self.client, '_call') as call:
+            self.assertEquals([], self.client.exists_many([]))
+        self.assertFalse(call.called)
+
+    def test_exists_many_hadoop1(self):
+        def call(cmd):
+            return (0, '', '') if cmd[-1] == '/a' else (1, '', "stat: `/b': No such file or directory\n")
+        client = hdfs.HdfsClientCdh3(daemon_command='')
+        with mock.patch.object(client, '_call', side_effect=call) as cdh3_call:
+            self.assertEquals([True, False], client.exists_many(['/a', '/b']))
+        self.assertEquals([mock.call(['hadoop', 'fs', '-stat', '/a']),
+                           mock.call(['hadoop', 'fs', '-stat', '/b'])], cdh3_call.call_args_list)
+
+        client = hdfs.HdfsClientApache1(daemon_command='')
+        with mock.patch.object(client, '_call', side_effect=lambda cmd: (0 if cmd[-1] == '/a' else 1, '', '')) as apache1_call:
+            self.assertEquals([True, False], client.exists_many(['/a', '/b']))
+        self.assertEquals([mock.call(['hadoop', 'fs', '-test', '-e', '/a']),
+                           mock.call(['hadoop', 'fs', '-test', '-e', '/b'])], apache1_call.call_args_list)
+
+    @mock.patch('luigi.hdfs.call_check')
+    def test_remove_many(self, call_check):
+        self.client.remove_many(['/a', '/b'])
+        self.client.remove_many(['/c'], recursive=False, skip_trash=True)
+        hdfs.HdfsClientCdh3(daemon_command='').remove_many(['/a', '/b'])
+        self.assertEquals([mock.call(['hadoop', 'fs', '-rm', '-r', '/a', '/b']),
+                           mock.call(['hadoop', 'fs', '-rm', '-skipTrash', '/c']),
+                           mock.call(['hadoop', 'fs', '-rmr', '/a', '/b'])], call_check.call_args_list)
+
+    @mock.patch('luigi.hdfs.call_check')
+    def test_mkdir_many(self, call_check):
+        self.client.mkdir_many(['/a', '/b'])
+        hdfs.HdfsClientApache1(daemon_command='').mkdir_many(['/a', '/b'])
+        self.assertEquals([mock.call(['hadoop', 'fs', '-mkdir', '-p', '/a', '/b']),
+                           mock.call(['hadoop', 'fs', '-mkdir', '/a', '/b'])], call_check.call_args_list)
+
+    @mock.patch('luigi.hdfs.call_check')
+    def test_mkdir_many_file_exists(self, call_check):
+        call_check.side_effect = hdfs.HDFSCliError([], 1, '', 'mkdir: `/a\': File exists')
+        self.assertRaises(luigi.target.FileAlreadyExists, self.client.mkdir_many, ['/a', '/b'])
+
+    def test_is_writable(self):
+        target = hdfs.HdfsTarget('/a/b/c')
+        with mock.patch('luigi.hdfs.exists_many', return_value=[False, False, True, True]) as exists_many:
+            with mock.patch.object(target, '_is_writable', return_value=True) as is_writable:
+                self.assertTrue(target.is_writable())
+        exists_many.assert_called_once_with(['/a/b/c/', '/a/b/', '/a/', '/'])
+        is_writable.assert_called_once_with('/a/')
+
+    def test_listdir_parsing(self):
+        ls = ('Found 3 items\n'
+              'drwxr-xr-x   - luigi supergroup          0 2014-01-01 00:00 /data/2014-01-01\n'
+              '-rw-r--r--   3 luigi 1234         1234567890 2014-01-02 03:04 /data/a file\n'
+              '-rw-r--r--   3 luigi supergroup          7 2014-01-02 03:04 /data/b\n')
+        with mock.patch.object(self.client, '_call_check', return_value=ls):
+            self.assertEquals([('/data/2014-01-01', 0, 'd', datetime.datetime(2014, 1, 1, 0, 0)),
+                               ('/data/a file', 1234567890, '-', datetime.datetime(2014, 1, 2, 3, 4)),
+                               ('/data/b', 7, '-', datetime.datetime(2014, 1, 2, 3, 4))],
+                              list(self.client.listdir('/data', include_size=True, include_type=True,
+                                                       include_time=True)))
+            self.assertEquals(['/data/a file', '/data/b'], list(self.client.listdir('/data', ignore_directories=True)))
+
+
+class FakeClient(object):
+    """Lists a tree given as a dict from paths to sizes, or to dicts for directories"""
+
+    def __init__(self, tree):
+        self.tree = tree
+        self.listed = []
+        self.delay = 0
+        self.concurrent = 0
+        self.max_concurrent = 0
+        self.lock = threading.Lock()
+
+    def listdir(self, path, include_size, include_type, include_time):
+        with self.lock:
+            self.listed.append(path)
+            self.concurrent += 1
+            self.max_concurrent = max(self.max_concurrent, self.concurrent)
+        time.sleep(self.delay)
+        with self.lock:
+            self.concurrent -= 1
+        node = self.tree
+        for part in path.strip('/').split('/'):
+            node = node[part]
+        for name, child in sorted(node.items()):
+            is_dir = isinstance(child, dict)
+            yield (path + '/' + name, 0 if is_dir else child, 'd' if is_dir else '-', datetime.datetime(2014, 1, 1))
+
+
+class WalkTest(unittest.TestCase):
+    def setUp(self):
+        self.client = FakeClient({'logs': {
+            'date=2014-01-01': {'part-0': 10, 'part-1': 20},
+            'date=2014-01-02': {'hour=00': {'part-0': 5}, 'hour=01': {}},
+            '_SUCCESS': 0}})
+
+    def test_walk(self):
+        entries = list(hdfs.walk('/logs', client=self.client))
+        self.assertEquals(sorted(['/logs/_SUCCESS', '/logs/date=2014-01-01', '/logs/date=2014-01-01/part-0',
+                                  '/logs/date=2014-01-01/part-1', '/logs/date=2014-01-02',
+                                  '/logs/date=2014-01-02/hour=00', '/logs/date=2014-01-02/hour=00/part-0',
+                                  '/logs/date=2014-01-02/hour=01']),
+                          sorted(e.path for e in entries))
+        self.assertEquals(hdfs.HdfsEntry('/logs/date=2014-01-01/part-1', 20, 'f', datetime.datetime(2014, 1, 1)),
+                          [e for e in entries if e.path.endswith('01/part-1')][0])
+        self.assertEquals('d', [e for e in entries if e.path.endswith('hour=01')][0].type)
+        for i, entry in enumerate(entries):
+            if entry.type == 'd':
+                self.assertFalse([e for e in entries[:i] if e.path.startswith(entry.path + '/')])
+
+    def test_parallel(self):
+        self.client.delay = 0.05
+        self.assertEquals(8, len(list(hdfs.walk('/logs', max_workers=2, client=self.client))))
+        self.assertEquals(2, self.client.max_concurrent)
+        self.assertEquals(5, len(self.client.listed))
+
+    def test_close_early(self):
+        entries = hdfs.walk('/logs', max_workers=1, client=self.client)
+        entries.next()
+        entries.close()
+        self.assertEquals(['/logs'], self.client.listed)
+
+    def test_error(self):
+        self.assertRaises(KeyError, list, hdfs.walk('/nope', client=self.client))
+
+    def test_summarize(self):
+        entries = list(hdfs.walk('/logs', client=self.client))
+        self.assertEquals({'/logs/_SUCCESS': (0, 1, 0),
+                           '/logs/date=2014-01-01': (30, 2, 1),
+                           '/logs/date=2014-01-02': (5, 1, 3)},
+                          hdfs.summarize(entries, '/logs/'))
+        self.assertEquals({'/logs': hdfs.ContentSummary(size=35, file_count=4, directory_count=4)},
+                          hdfs.summarize(entries, '/logs', depth=0))
+        self.assertEquals((5, 1, 1), hdfs.summarize(entries, '/logs', depth=2)['/logs/date=2014-01-02/hour=00'])
+        self.assertRaises(ValueError, hdfs.summarize, entries, '/other')
+
+    def test_summarize_qualified_paths(self):
+        entries = [e._replace(path='hdfs://namenode:8020' + e.path) for e in hdfs.walk('/logs', client=self.client)]
+        expected = {'/logs/_SUCCESS': (0, 1, 0), '/logs/date=2014-01-01': (30, 2, 1), '/logs/date=2014-01-02': (5, 1, 3)}
+        self.assertEquals(expected, hdfs.summarize(entries, '/logs'))
+        self.assertEquals(dict(('hdfs://namenode:8020' + path, summary) for path, summary in expected.items()),
+                          hdfs.summarize(entries, 'hdfs://namenode:8020/logs'))
+        self.assertEquals((35, 4, 4), hdfs.summarize(entries, '/logs', depth=0)['/logs'])
+        self.assertRaises(ValueError, hdfs.summarize, entries, 'hdfs://namenode:8020/other')
+
+
+class FakeReadClient(object):
+    """Serves files from a dict, the first one slower than the rest"""
+
+    def __init__(self, files):
+        self.files = files
+        self.opened = []
+
+    def open_read(self, path):
+        if path == sorted(self.files)[0]:
+            time.sleep(0.05)
+        self.opened.append(path)
+        if self.files[path] is None:
+            raise IOError('No such file %s' % path)
+        return io.BytesIO(self.files[path])
+
+
+class FakeCliReadClient(FakeReadClient):
+    """Also reads many files in one stream, like hadoop fs -cat"""
+    max_batch_length = 1000
+
+    def open_read_many(self, paths):
+        self.opened.append(paths)
+        return io.BytesIO(''.join(self.files[path] for path in paths))
+
+
+class MultiReadTest(unittest.TestCase):
+    def setUp(self):
+        self.client = FakeReadClient(dict(('/out/part-%05d' % i, 'line %d\n' % i * 1000) for i in xrange(10)))
+        self.paths = sorted(self.client.files)
+
+    def test_ordered(self):
+        pipe = hdfs.HdfsMultiReadPipe(self.paths, workers=3, read_ahead=2, client=self.client)
+        pipe.chunk_size = 100
+        self.assertEquals(''.join(self.client.files[p] for p in self.paths), pipe.read())
+        self.assertEquals(self.paths, sorted(self.client.opened))
+        self.assertNotEquals(self.paths[0], self.client.opened[0])
+
+    def test_lines(self):
+        pipe = hdfs.HdfsMultiReadPipe(self.paths, workers=4, client=self.client)
+        lines = list(pipe)
+        self.assertEquals(10000, len(lines))
+        self.assertEquals(['line 0\n', 'line 1\n'], [lines[0], lines[1000]])
+        self.assertTrue(pipe.closed)
+
+    def test_empty(self):
+        self.assertEquals('', hdfs.HdfsMultiReadPipe([], client=self.client).read())
+
+    def test_error(self):
+        self.client.files['/out/part-00003'] = None
+        pipe = hdfs.HdfsMultiReadPipe(self.paths, client=self.client)
+        self.assertEquals('line 0\n', pipe.readline())
+        self.assertEquals(2999 * 7, len(pipe.read(2999 * 7)))
+        self.assertRaises(IOError, pipe.read)
+        pipe.close()
+
+    def test_close(self):
+        pipe = hdfs.HdfsMultiReadPipe(self.paths, workers=2, read_ahead=1, client=self.client)
+        pipe.chunk_size = 10
+        self.assertEquals('line 0\n', pipe.readline())
+        pipe.close()
+        time.sleep(0.3)
+        self.assertEquals(2, len(self.client.opened))
+
+    def test_gzip(self):
+        data = io.BytesIO()
+        with gzip.GzipFile(fileobj=data, mode='w') as f:
+            f.write('foo\n')
+        self.client.files = {'/out/part-0': data.getvalue(), '/out/part-1': data.getvalue()}
+        pipe = hdfs.HdfsMultiReadPipe(sorted(self.client.files), client=self.client)
+        self.assertEquals(['foo\n', 'foo\n'], list(luigi.format.Gzip.pipe_reader(pipe)))
+
+    def test_groups(self):
+        client = FakeCliReadClient(self.client.files)
+        pipe = hdfs.HdfsMultiReadPipe(self.paths, workers=3, client=client)
+        self.assertEquals(''.join(client.files[p] for p in self.paths), pipe.read())
+        self.assertEquals([self.paths[:4], self.paths[4:8], self.paths[8:]], sorted(client.opened))
+
+    def test_groups_max_length(self):
+        client = FakeCliReadClient(self.client.files)
+        client.max_batch_length = 40  # room for two paths
+        pipe = hdfs.HdfsMultiReadPipe(self.paths, workers=2, client=client)
+        self.assertEquals(''.join(client.files[p] for p in self.paths), pipe.read())
+        p = self.paths
+        self.assertEquals([p[0:2], p[2:4], p[4:5], p[5:7], p[7:9], p[9:]], sorted(client.opened))
+
+    def test_plain_dir(self):
+        listing = ['/out/_SUCCESS', '/out/part-00000', '/out/part-00001']
+        with mock.patch('luigi.hdfs.listdir', return_value=listing) as listdir:
+            with mock.patch('luigi.hdfs.get_autoconfig_client', return_value=self.client):
+                self.assertEquals(1000 * 2 * 7, len(hdfs.PlainDir.hdfs_reader('/out').read()))
+        listdir.assert_called_once_with('/out', ignore_directories=True)
+        self.assertEquals(['/out/part-00000', '/out/part-00001'], sorted(self.client.opened))
+
+
+if __name__ == '__main__':
+    unittest.main()
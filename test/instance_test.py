@@ -15,6 +15,7 @@
 import luigi
 import luigi.date_interval
 import unittest
+import weakref
 import luigi.notifications
 luigi.notifications.DEBUG = True
 
@@ -80,5 +81,77 @@ class InstanceTest(unittest.TestCase):
         self.assertNotEqual(dummy_1, dummy_2)
         self.assertEqual(dummy_1, dummy_1b)
 
+    def test_params_cache_invalidated(self):
+        class A(luigi.Task):
+            x = luigi.IntParameter()
+
+        class B(A):
+            pass
+
+        self.assertEqual(['x'], [name for name, param in B.get_params()])
+        A.y = luigi.IntParameter(default=3)  # classes can be extended after first use
+        self.assertEqual(['x', 'y'], [name for name, param in B.get_params()])
+        self.assertEqual('B(x=1, y=3)', B(1).task_id)
+        del A.y
+        self.assertEqual('B(x=2)', B(2).task_id)
+
+    def test_params_cache_kept(self):
+        class A(luigi.Task):
+            x = luigi.IntParameter()
+
+        class B(luigi.Task):
+            pass
+
+        A.get_params()
+        B.get_params()
+        A.foo = 'bar'  # not a parameter
+        del A.foo
+        self.assertTrue(A in luigi.task.Register._params_cache)
+        B.y = luigi.IntParameter()  # not on A or its bases
+        self.assertTrue(A in luigi.task.Register._params_cache)
+        self.assertFalse(B in luigi.task.Register._params_cache)
+        A.x = 3  # replaces a parameter
+        self.assertFalse(A in luigi.task.Register._params_cache)
+        self.assertEqual([], A.get_params())
+
+    def test_params_cache_copies(self):
+        class A(luigi.Task):
+            x = luigi.IntParameter()
+
+        A.get_params().pop()
+        A.get_nonglobal_params().pop()
+        self.assertEqual('A(x=1)', A(1).task_id)
+
+
+class WeakInstanceCacheTest(unittest.TestCase):
+    def setUp(self):
+        luigi.task.Register.enable_weak_instance_cache()
+
+    def tearDown(self):
+        luigi.task.Register._Register__instance_cache = {}  # back to the default, strong cache
+
+    def test_weak_cache(self):
+        class A(luigi.Task):
+            x = luigi.IntParameter()
+
+        a = A(1)
+        self.assertTrue(a is A(1))
+        a.foo = 'bar'
+        del a
+        self.assertFalse(hasattr(A(1), 'foo'))  # the old instance is gone
+
+    def test_clear_keeps_weak(self):
+        luigi.task.Register.clear_instance_cache()
+        self.assertTrue(isinstance(luigi.task.Register._Register__instance_cache, weakref.WeakValueDictionary))
+
+    def test_disabled_stays_disabled(self):
+        class A(luigi.Task):
+            x = luigi.IntParameter()
+
+        luigi.task.Register.disable_instance_cache()
+        luigi.task.Register.enable_weak_instance_cache()
+        self.assertEqual(None, luigi.task.Register._Register__instance_cache)
+        self.assertFalse(A(1) is A(1))
+
 if __name__ == '__main__':
     unittest.main()
@@ -0,0 +1,138 @@
+# Copyright (c) 2012 Spotify AB
+#
+# Licensed under the Apache License, Version 2.0 (the "License"); you may not
+# use this file except in compliance with the License. You may obtain a copy of
+# the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+# WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+# License for the specific language governing permissions and limitations under
+# the License.
+
+import os
+import shutil
+import tempfile
+import unittest
+import luigi
+from luigi.task import id_to_name_and_params, name_and_params_to_id
+import luigi.notifications
+luigi.notifications.DEBUG = True
+
+
+class TaskIdTest(unittest.TestCase):
+    def test_round_trip(self):
+        examples = [
+            [],
+            [('a', '1')],
+            [('a', '2013-07-21 11:00:00'), ('b', 'x=y')],
+            [('a', 'foo, bar'), ('b', '(1, 2)'), ('c', '')],
+            [('a', 'C:\\tmp\\'), ('b', '\\, ,\\')],
+        ]
+        for params in examples:
+            task_id = name_and_params_to_id('Foo', params)
+            self.assertEqual(('Foo', dict(params)), id_to_name_and_params(task_id))
+
+    def test_unchanged_format(self):
+        self.assertEqual('Foo(a=1, b=bar)', name_and_params_to_id('Foo', [('a', '1'), ('b', 'bar')]))
+
+    def test_task_round_trip(self):
+        class TupleTask(luigi.Task):
+            x = luigi.Parameter()
+            y = luigi.IntParameter()
+
+        t = TupleTask(x='a, b=c\\', y=3)
+        self.assertEqual(('TupleTask', {'x': 'a, b=c\\', 'y': '3'}), id_to_name_and_params(t.task_id))
+
+    def test_unescaped_ids(self):
+        # Ids from before values were escaped should still parse as well as possible
+        task_id = "CrazyTask(foo=foo_table_id, bar={'keyName': 'com.my.org'}, what_is_dis=foo bar, oh hippo)"
+        self.assertEqual(('CrazyTask', {'foo': 'foo_table_id', 'bar': "{'keyName': 'com.my.org'}",
+                                        'what_is_dis': 'foo bar, oh hippo'}),
+                         id_to_name_and_params(task_id))
+
+    def test_not_a_task_id(self):
+        self.assertEqual(('A', {}), id_to_name_and_params('A'))
+
+    def test_cached_result_not_shared(self):
+        id_to_name_and_params('Foo(a=1)')[1]['a'] = '2'
+        self.assertEqual({'a': '1'}, id_to_name_and_params('Foo(a=1)')[1])
+
+    def test_many_ids(self):
+        for i in xrange(20000):
+            params = [('a', str(i)), ('b', 'x, %d' % i)]
+            self.assertEqual(dict(params), id_to_name_and_params(name_and_params_to_id('Foo', params))[1])
+
+
+
+class BulkCompleteTest(unittest.TestCase):
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp_dir)
+
+    def test_bulk_complete(self):
+        tmp_dir = self.tmp_dir
+
+        class Day(luigi.Task):
+            day = luigi.IntParameter()
+
+            def output(self):
+                return luigi.File(os.path.join(tmp_dir, str(self.day)))
+
+        days = [Day(day) for day in xrange(3)]
+        days[1].output().open('w').close()
+        self.assertEqual(dict((d.task_id, d.complete()) for d in days), luigi.task.bulk_complete(days))
+        self.assertEqual([False, True, False], [d.complete() for d in days])
+
+    def test_overridden_exists(self):
+        tmp_dir = self.tmp_dir
+
+        class MarkerFile(luigi.File):
+            def exists(self):
+                return os.path.exists(self.path + '.done')
+
+        class Day(luigi.Task):
+            day = luigi.IntParameter()
+
+            def output(self):
+                return MarkerFile(os.path.join(tmp_dir, str(self.day)))
+
+        days = [Day(day) for day in xrange(3)]
+        for d in days:
+            d.output().open('w').close()
+        self.assertEqual([False] * 3, [d.complete() for d in days])
+        self.assertEqual({}, luigi.task.bulk_complete(days))  # left to complete()
+
+
+class FlattenTest(unittest.TestCase):
+    def test_flatten(self):
+        flatten = luigi.task.flatten
+        self.assertEqual([], flatten(None))
+        self.assertEqual([1], flatten(1))
+        self.assertEqual(['foo'], flatten('foo'))
+        self.assertEqual([1, 2, 3, 4], flatten([1, (2, [3]), None, [], 4]))
+        self.assertEqual([1], flatten({'a': 1}))
+        self.assertEqual([1, 2], sorted(flatten({'a': [1], 'b': {'c': 2}})))
+        self.assertEqual([0, 1, 2], flatten(i for i in range(3)))
+
+    def test_flatten_deep(self):
+        struct = 1
+        for i in xrange(10000):
+            struct = [struct, i]
+        flat = luigi.task.flatten(struct)
+        self.assertEqual([1] + range(10000), flat)
+
+    def test_flatten_tasks_and_targets(self):
+        class A(luigi.Task):
+            pass
+
+        target = luigi.LocalTarget('/tmp/foo')
+        self.assertEqual([A(), target], luigi.task.flatten([A(), {'x': target}]))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -46,6 +46,21 @@ class TestEventCallbacks(TestCase):
         build([t], local_scheduler=True)
         self.assertEquals(type(exceptions[0]), DummyException)
 
+    def test_timing_handlers(self):
+        timings = []
+
+        class TimedTask(EmptyTask):
+            pass
+
+        for event in [Event.DEPENDENCY_RECHECK_TIME, Event.RUN_TIME, Event.ON_SUCCESS_TIME, Event.STATUS_UPDATE_TIME]:
+            TimedTask.event_handler(event)(lambda task, seconds, event=event: timings.append((event, task, seconds)))
+
+        t = TimedTask(False)
+        build([t], local_scheduler=True)
+        self.assertEquals([Event.DEPENDENCY_RECHECK_TIME, Event.RUN_TIME, Event.ON_SUCCESS_TIME, Event.STATUS_UPDATE_TIME],
+                          [event for event, _, _ in timings])
+        self.assertTrue(all(task == t and seconds >= 0 for _, task, seconds in timings))
+
     def test_custom_handler(self):
         dummies = []
 
@@ -57,6 +72,24 @@ class TestEventCallbacks(TestCase):
         build([t], local_scheduler=True)
         self.assertEquals(dummies[0], "foo")
 
+    def test_handler_added_after_trigger(self):
+        class BaseTask(Task):
+            pass
+
+        class SubTask(BaseTask):
+            pass
+
+        events = []
+        t = SubTask()
+        t.trigger_event("bar event")  # caches that there are no handlers
+
+        @BaseTask.event_handler("bar event")
+        def save_event():
+            events.append("bar")
+
+        t.trigger_event("bar event")
+        self.assertEquals(events, ["bar"])
+
 
 #        A
 #      /   \
@@ -0,0 +1,340 @@
+# Copyright (c) 2012 Spotify AB
+#
+# Licensed under the Apache License, Version 2.0 (the "License"); you may not
+# use this file except in compliance with the License. You may obtain a copy of
+# the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+# WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+# License for the specific language governing permissions and limitations under
+# the License.
+
+import BaseHTTPServer
+import json
+import os
+import posixpath
+import SocketServer
+import tempfile
+import threading
+import unittest
+import urllib
+import urlparse
+import luigi.format
+from helpers import with_config
+from luigi import hdfs, webhdfs
+from luigi.target import FileAlreadyExists
+
+
+class FakeWebHdfsServer(SocketServer.ThreadingMixIn, BaseHTTPServer.HTTPServer):
+    """In-memory stand-in for a namenode (and datanode) speaking WebHDFS"""
+    daemon_threads = True
+
+    def __init__(self):
+        BaseHTTPServer.HTTPServer.__init__(self, ('localhost', 0), FakeWebHdfsHandler)
+        self.files = {'/': None, '/user': None, '/user/luigi': None}  # path -> contents, None for directories
+        self.connections = 0
+        self.requests = []
+        self.lock = threading.Lock()
+
+    def handle_error(self, request, client_address):
+        pass  # clients hanging up early is expected, e.g. when closing a partly read file
+
+
+class FakeWebHdfsHandler(BaseHTTPServer.BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+
+    def log_message(self, *args):
+        pass
+
+    def setup(self):
+        BaseHTTPServer.BaseHTTPRequestHandler.setup(self)
+        self.server.connections += 1
+
+    def do_GET(self):
+        self.handle_op()
+
+    do_PUT = do_DELETE = do_GET
+
+    def body(self):
+        if self.headers.get('Transfer-Encoding') == 'chunked':
+            chunks = []
+            while True:
+                line = self.rfile.readline()
+                if not line:
+                    return None  # the client aborted the upload
+                size = int(line.strip(), 16)
+                chunk = self.rfile.read(size)
+                self.rfile.readline()
+                if not size:
+                    return ''.join(chunks)
+                chunks.append(chunk)
+        return self.rfile.read(int(self.headers.get('Content-Length', 0)))
+
+    def reply(self, status, body=None, headers={}):
+        data = json.dumps(body) if body is not None else ''
+        self.send_response(status)
+        for name, value in headers.items():
+            self.send_header(name, value)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def reply_data(self, data):
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/octet-stream')
+        self.send_header('Content-Length', str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def error(self, status, exception, message):
+        self.reply(status, {'RemoteException': {'exception': exception, 'message': message}})
+
+    def status(self, path, suffix):
+        data = self.server.files[path]
+        return {'pathSuffix': suffix, 'type': 'DIRECTORY' if data is None else 'FILE',
+                'length': len(data or ''), 'modificationTime': 1388534400000}
+
+    def children(self, path):
+        return sorted(p for p in self.server.files if p != path and posixpath.dirname(p) == path)
+
+    def mkdirs(self, path):
+        while path not in self.server.files:
+            self.server.files[path] = None
+            path = posixpath.dirname(path)
+
+    def handle_op(self):
+        url = urlparse.urlsplit(self.path)
+        path = urllib.unquote(url.path[len('/webhdfs/v1'):])
+        params = dict(urlparse.parse_qsl(url.query))
+        op = params['op']
+        body = self.body()
+        if body is None:
+            self.close_connection = 1
+            return
+        files = self.server.files
+        with self.server.lock:
+            self.server.requests.append((self.command, op, path))
+            if op == 'GETHOMEDIRECTORY':
+                self.reply(200, {'Path': '/user/luigi'})
+            elif path not in files and op not in ('MKDIRS', 'CREATE', 'DELETE'):
+                self.error(404, 'FileNotFoundException', 'File does not exist: %s' % path)
+            elif op == 'GETFILESTATUS':
+                self.reply(200, {'FileStatus': self.status(path, '')})
+            elif op == 'LISTSTATUS':
+                if files[path] is None:
+                    statuses = [self.status(p, posixpath.basename(p)) for p in self.children(path)]
+                else:
+                    statuses = [self.status(path, '')]
+                self.reply(200, {'FileStatuses': {'FileStatus': statuses}})
+            elif op == 'GETCONTENTSUMMARY':
+                under = [p for p in files if p == path or p.startswith(path.rstrip('/') + '/')]
+                self.reply(200, {'ContentSummary': {
+                    'length': sum(len(files[p] or '') for p in under),
+                    'directoryCount': len([p for p in under if files[p] is None]),
+                    'fileCount': len([p for p in under if files[p] is not None])}})
+            elif op == 'MKDIRS':
+                if files.get(path, None) is not None:
+                    self.error(403, 'FileAlreadyExistsException', 'Path is not a directory: %s' % path)
+                else:
+                    self.mkdirs(path)
+                    self.reply(200, {'boolean': True})
+            elif op == 'DELETE':
+                if path not in files:
+                    self.reply(200, {'boolean': False})
+                elif self.children(path) and params['recursive'] != 'true':
+                    self.error(403, 'IOException', '%s is non empty' % path)
+                else:
+                    for p in list(files):
+                        if p == path or p.startswith(path + '/'):
+                            del files[p]
+                    self.reply(200, {'boolean': True})
+            elif op == 'RENAME':
+                dest = params['destination']
+                if files.get(dest, 0) is None:
+                    dest = posixpath.join(dest, posixpath.basename(path))
+                if dest in files or posixpath.dirname(dest) not in files:
+                    self.reply(200, {'boolean': False})
+                else:
+                    for p in list(files):
+                        if p == path or p.startswith(path + '/'):
+                            files[dest + p[len(path):]] = files.pop(p)
+                    self.reply(200, {'boolean': True})
+            elif op in ('SETPERMISSION', 'SETOWNER'):
+                self.reply(200)
+            elif op in ('OPEN', 'CREATE') and 'datanode' not in params:
+                if op == 'CREATE' and path in files and params['overwrite'] != 'true':
+                    self.error(403, 'FileAlreadyExistsException', '%s already exists' % path)
+                else:
+                    location = 'http://localhost:%d%s&datanode=true' % (self.server.server_port, self.path)
+                    self.reply(307, headers={'Location': location})
+            elif op == 'OPEN':
+                self.reply_data(files[path])
+            elif op == 'CREATE':
+                self.mkdirs(posixpath.dirname(path))
+                files[path] = body
+                self.reply(201)
+            else:
+                self.error(400, 'IllegalArgumentException', 'Unsupported op %s' % op)
+
+
+class WebHdfsClientTest(unittest.TestCase):
+    def setUp(self):
+        self.server = FakeWebHdfsServer()
+        thread = threading.Thread(target=self.server.serve_forever, args=(0.05,))
+        thread.daemon = True
+        thread.start()
+        self.url = 'webhdfs://localhost:%d' % self.server.server_port
+        self.client = webhdfs.WebHdfsClient(user='luigi')
+
+    def tearDown(self):
+        self.client.pool.clear()
+        self.server.shutdown()
+        self.server.server_close()
+
+    def put(self, path, data):
+        self.server.files[path] = data
+
+    def test_exists(self):
+        self.put('/data', None)
+        self.put('/data/a', 'foo')
+        self.assertTrue(self.client.exists(self.url + '/data/a'))
+        self.assertFalse(self.client.exists(self.url + '/data/b'))
+        self.assertEquals([True, False, True], self.client.exists_many([self.url + p for p in ['/data', '/nope', '/data/a']]))
+        self.assertTrue(self.client.isdir(self.url + '/data'))
+        self.assertFalse(self.client.isdir(self.url + '/data/a'))
+
+    def test_connection_pooling(self):
+        for i in xrange(20):
+            self.client.exists(self.url + '/user')
+        self.assertEquals(1, self.server.connections)
+
+    def test_relative_path(self):
+        @with_config({'hdfs': {'namenode_host': 'localhost', 'namenode_port': str(self.server.server_port)}})
+        def run():
+            self.client.mkdir('foo')
+            self.assertTrue(self.client.exists('/user/luigi/foo'))
+        run()
+        self.assertTrue('/user/luigi/foo' in self.server.files)
+
+    def test_mkdir_remove(self):
+        self.assertTrue(self.client.mkdir(self.url + '/a/b'))
+        self.assertTrue(self.client.exists(self.url + '/a/b'))
+        self.assertRaises(webhdfs.WebHdfsError, self.client.remove, self.url + '/a', recursive=False)
+        self.assertTrue(self.client.remove(self.url + '/a'))
+        self.assertFalse(self.client.exists(self.url + '/a'))
+
+        self.put('/f', 'data')
+        self.assertRaises(FileAlreadyExists, self.client.mkdir, self.url + '/f')
+        self.client.mkdir_many([self.url + '/x', self.url + '/y'])
+        self.client.remove_many([self.url + '/x', self.url + '/y'])
+        self.assertEquals([False, False], self.client.exists_many([self.url + '/x', self.url + '/y']))
+
+    def test_listdir(self):
+        self.put('/data', None)
+        self.put('/data/a', 'foo')
+        self.put('/data/b', None)
+        self.put('/data/b/c', 'quux')
+        data = self.url + '/data'
+        self.assertEquals([data + '/a', data + '/b'], list(self.client.listdir(data)))
+        self.assertEquals([data + '/a', data + '/b', data + '/b/c'], list(self.client.listdir(data, recursive=True)))
+        self.assertEquals([(data + '/a', 3, '-')], list(self.client.listdir(data, ignore_directories=True,
+                                                                               include_size=True, include_type=True)))
+        self.assertEquals([data + '/b'], list(self.client.listdir(data, ignore_files=True)))
+        self.assertEquals({'content_size': '7', 'dir_count': '2', 'file_count': '2'}, self.client.count(data))
+
+    def test_rename(self):
+        self.put('/a', 'foo')
+        self.client.rename(self.url + '/a', self.url + '/x/b')
+        self.assertEquals('foo', self.server.files['/x/b'])
+        self.assertFalse('/a' in self.server.files)
+
+        self.put('/d', None)
+        self.put('/d/1', 'one')
+        self.put('/d/2', 'two')
+        self.client.rename(self.url + '/d/*', self.url + '/x')
+        self.assertEquals(('one', 'two'), (self.server.files['/x/1'], self.server.files['/x/2']))
+
+    def test_read_write(self):
+        self.client.chunk_size = 5
+        path = self.url + '/data/out'
+        with self.client.open_write(path) as f:
+            for i in xrange(100):
+                f.write('line %d\n' % i)
+        self.assertEquals(''.join('line %d\n' % i for i in xrange(100)), self.server.files['/data/out'])
+        self.assertEquals([], [p for p in self.server.files if 'luigitemp' in p])
+
+        lines = list(self.client.open_read(path))
+        self.assertEquals(['line %d\n' % i for i in xrange(100)], lines)
+        f = self.client.open_read(path)
+        self.assertEquals('line 0\n', f.readline())
+        self.assertEquals('line', f.read(4))
+        self.assertEquals(' 1\nline 2\n', f.readline() + f.readline())
+        f.close()
+
+    def test_write_abort(self):
+        path = self.url + '/data/out'
+        try:
+            with self.client.open_write(path) as f:
+                f.write('foo')
+                raise ValueError
+        except ValueError:
+            pass
+        self.assertEquals([], [p for p in self.server.files if p.startswith('/data')])
+
+    def test_read_glob(self):
+        self.put('/d', None)
+        self.put('/d/_SUCCESS', '')
+        self.put('/d/part-00000', 'a\nb')
+        self.put('/d/part-00001', '\nc\n')
+        self.assertEquals(['a\n', 'b\n', 'c\n'], list(self.client.open_read(self.url + '/d/[^_]*')))
+
+    def test_put_get(self):
+        fd, fn = tempfile.mkstemp()
+        try:
+            os.write(fd, 'hello')
+            os.close(fd)
+            self.client.put(fn, self.url + '/hello')
+            self.client.copy(self.url + '/hello', self.url + '/hello2')
+            os.remove(fn)
+            self.client.get(self.url + '/hello2', fn)
+            self.assertEquals('hello', open(fn).read())
+        finally:
+            if os.path.exists(fn):
+                os.remove(fn)
+
+    def test_target(self):
+        @with_config({'hdfs': {'use_webhdfs': 'true', 'namenode_host': 'localhost',
+                               'namenode_port': str(self.server.server_port)}})
+        def run():
+            self.assertEquals('webhdfs', hdfs.get_hdfs_syntax())
+            self.assertTrue(isinstance(hdfs.get_autoconfig_client(), webhdfs.WebHdfsClient))
+            target = hdfs.HdfsTarget('/data/plain')
+            with target.open('w') as f:
+                f.write('foo\nbar\n')
+            self.assertTrue(target.exists())
+            self.assertEquals(['foo\n', 'bar\n'], list(target.open('r')))
+
+            target = hdfs.HdfsTarget('/data/gzip', format=luigi.format.Gzip)
+            with target.open('w') as f:
+                f.write('foo\nbar\n')
+            self.assertEquals('\x1f\x8b', self.server.files['/data/gzip'][:2])
+            self.assertEquals(['foo\n', 'bar\n'], list(target.open('r')))
+
+            target = hdfs.HdfsTarget('/data/dir', format=hdfs.PlainDir)
+            with target.open('w') as f:
+                f.write('foo\n')
+            self.assertEquals('foo\n', self.server.files['/data/dir/data'])
+            self.assertEquals(['foo\n'], list(target.open('r')))
+            self.assertTrue(target.is_writable())
+        try:
+            run()
+        finally:
+            hdfs._autoconfig_client = None
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -12,7 +12,13 @@
 # License for the specific language governing permissions and limitations under
 # the License.
 
+import os
+import shutil
+import subprocess
+import tempfile
 import time
+import mock
+import luigi
 from luigi.scheduler import CentralPlannerScheduler
 import luigi.worker
 from luigi.worker import Worker
@@ -311,6 +317,242 @@ class WorkerTest(unittest.TestCase):
         w.stop()
 
 
+    def test_bulk_complete(self):
+        "Tests that outputs of sibling tasks are checked with a single exists_many call"
+        tmp_dir = tempfile.mkdtemp()
+
+        class Day(Task):
+            day = luigi.IntParameter()
+
+            def output(self):
+                return luigi.File(os.path.join(tmp_dir, str(self.day)))
+
+            def run(self):
+                self.output().open('w').close()
+
+        class Backfill(DummyTask):
+            def requires(self):
+                return [Day(day) for day in xrange(5)]
+
+        for day in (1, 3):
+            Day(day).output().open('w').close()
+
+        fs = luigi.File.fs
+        w = Worker(scheduler=self.sch, worker_id='Z')
+        try:
+            with mock.patch.object(fs, 'exists', wraps=fs.exists) as exists:
+                with mock.patch.object(fs, 'exists_many', wraps=fs.exists_many) as exists_many:
+                    w.add(Backfill())
+            self.assertEquals(1, exists_many.call_count)
+            self.assertEquals(5, exists.call_count)  # only by exists_many, complete() isn't called again
+            w.run()
+            self.assertEquals(['0', '1', '2', '3', '4'], sorted(os.listdir(tmp_dir)))
+        finally:
+            w.stop()
+            shutil.rmtree(tmp_dir)
+
+
+    def test_add_in_background(self):
+        "Tests that discovered tasks start running while the rest of the graph is being discovered"
+        leaf_done = threading.Event()
+        ran_during_discovery = []
+
+        class Leaf(DummyTask):
+            def run(self):
+                super(Leaf, self).run()
+                leaf_done.set()
+
+        class Slow(DummyTask):
+            def requires(self):
+                leaf_done.wait(5)
+                ran_during_discovery.append(leaf_done.is_set())
+                return []
+
+        class Root(DummyTask):
+            def requires(self):
+                return [Slow(), Leaf()]
+
+        root = Root()
+        self.w.add_in_background([root])
+        self.w.run()
+        self.assertTrue(ran_during_discovery[0])
+        self.assertTrue(Leaf().has_run)
+        self.assertTrue(Slow().has_run)
+        self.assertTrue(root.has_run)
+
+    def test_fork_during_add_in_background(self):
+        "Tests that with multiple worker processes, tasks are only forked in between adding tasks"
+        adding = threading.Event()
+        added = threading.Event()
+
+        class Slow(DummyTask):
+            def complete(self):
+                adding.set()
+                added.wait(5)
+                return False
+
+        class A(DummyTask):
+            pass
+
+        self.w.add(A())
+        self.w.add_in_background([Slow()])
+        adding.wait(5)
+        threading.Timer(0.1, added.set).start()
+        forked_after_add = []
+
+        def fork():
+            forked_after_add.append(added.is_set())
+            return 1234  # the parent's side of it
+        with mock.patch('os.fork', fork):
+            self.w._fork_task({}, A().task_id)
+        self.w._join_discovery()
+        self.assertEquals([True], forked_after_add)
+
+    def test_reap_children_leaves_other_processes(self):
+        "Tests that only forked tasks are reaped, not subprocesses started elsewhere, e.g. in complete()"
+        other = subprocess.Popen(['sh', '-c', 'exit 3'])
+        child = subprocess.Popen(['sleep', '0.5'])
+        time.sleep(0.1)
+        children = {child.pid: ('A()', time.time(), None)}
+        self.w._reap_children(children)
+        self.assertEquals({}, children)
+        self.assertEquals(3, other.wait())
+
+    def test_add_in_background_error(self):
+        self.w.add_in_background(['not a task'])
+        self.assertRaises(luigi.worker.TaskException, self.w.run)
+
+
+    def test_resources(self):
+        class A(DummyTask):
+            pass
+
+        a = A()
+        self.w.add(a)
+        self.w.run()
+        resources = self.sch._tasks[a.task_id].resources
+        self.assertEquals(set(['wall_time', 'cpu_time', 'max_rss']), set(resources))
+        self.assertTrue(resources['wall_time'] >= 0)
+
+    def test_timeout(self):
+        class A(DummyTask):
+            worker_timeout = 0.1
+
+            def run(self):
+                time.sleep(5)
+
+        a = A()
+        t0 = time.time()
+        self.w.add(a)
+        self.w.run()
+        self.assertTrue(time.time() - t0 < 5)
+        self.assertEquals('FAILED', self.sch._tasks[a.task_id].status)
+        self.assertTrue('timed out' in self.sch._tasks[a.task_id].expl)
+
+    def test_timeout_forked(self):
+        class A(DummyTask):
+            worker_timeout = 0.1
+
+            def run(self):
+                time.sleep(5)
+
+        a = A()
+        t0 = time.time()
+        self.w.add(a)
+        self.w.worker_processes = 2  # forking with a local scheduler only works since the child gets killed
+        self.w.run()
+        self.assertTrue(time.time() - t0 < 5)
+        task = self.sch._tasks[a.task_id]
+        self.assertEquals('FAILED', task.status)
+        self.assertTrue('timed out' in task.expl)
+        self.assertTrue(task.resources['wall_time'] >= 0.1)
+
+    def test_profile(self):
+        class A(DummyTask):
+            x = luigi.Parameter()
+
+        class B(DummyTask):
+            pass
+
+        profile_dir = tempfile.mkdtemp()
+        try:
+            w = Worker(scheduler=self.sch, worker_id='X', profile_dir=os.path.join(profile_dir, 'x'))
+            a, b = A(x='a/b' * 200), B()
+            try:
+                w.add(a)
+                w.add(b)
+                w.run()
+            finally:
+                w.stop()
+            self.assertTrue(a.complete() and b.complete())
+            files = sorted(os.listdir(os.path.join(profile_dir, 'x')))
+            self.assertEquals(2, len(files))
+            self.assertTrue(files[0].startswith('A(x=a_b') and files[0].endswith('.prof'))
+            self.assertTrue(len(files[0]) < 255)
+            self.assertEquals('B().prof', files[1])
+        finally:
+            shutil.rmtree(profile_dir)
+
+    @with_config({'core': {'worker-profile-tasks': 'B, C'}})
+    def test_profile_families(self):
+        class A(DummyTask):
+            pass
+
+        class B(DummyTask):
+            pass
+
+        profile_dir = tempfile.mkdtemp()
+        try:
+            w = Worker(scheduler=self.sch, worker_id='X', profile_dir=profile_dir)
+            try:
+                w.add(A())
+                w.add(B())
+                w.run()
+            finally:
+                w.stop()
+            self.assertEquals(['B().prof'], os.listdir(profile_dir))
+        finally:
+            shutil.rmtree(profile_dir)
+
+    def test_prefetch(self):
+        class A(DummyTask):
+            x = luigi.IntParameter()
+
+        w = Worker(scheduler=self.sch, worker_id='X', prefetch=3)
+        get_work = mock.Mock(wraps=self.sch.get_work)
+        start_task = mock.Mock(wraps=self.sch.start_task)
+        try:
+            with mock.patch.multiple(self.sch, get_work=get_work, start_task=start_task):
+                tasks = [A(x=i) for i in range(4)]
+                for t in tasks:
+                    w.add(t)
+                w.run()
+        finally:
+            w.stop()
+        self.assertTrue(all(t.complete() for t in tasks))
+        self.assertEquals(3, get_work.call_count)  # 3 + 1 tasks, then nothing left
+        self.assertEquals(2, start_task.call_count)  # the prefetched ones
+
+    def test_prefetch_release_on_error(self):
+        class A(DummyTask):
+            x = luigi.IntParameter()
+
+            def run(self):
+                raise KeyboardInterrupt
+
+        w = Worker(scheduler=self.sch, worker_id='X', prefetch=2)
+        a, b = A(x=1), A(x=2)
+        try:
+            w.add(a)
+            w.add(b)
+            self.assertRaises(KeyboardInterrupt, w.run)
+        finally:
+            w.stop()
+        # one task was claimed but never started, it should be up for grabs again
+        statuses = sorted(self.sch._tasks[t.task_id].status for t in [a, b])
+        self.assertEquals(['PENDING', 'RUNNING'], statuses)
+
+
 class WorkerPingThreadTests(unittest.TestCase):
     def test_ping_retry(self):
         """ Worker ping fails once. Ping continues to try to connect to scheduler
@@ -346,6 +588,34 @@ class WorkerPingThreadTests(unittest.TestCase):
             msg="Didn't retry pings (%d pings performed)" % (self._total_pings,)
         )
 
+    def test_ping_skipped_after_other_calls(self):
+        sch = CentralPlannerScheduler(retry_delay=100, remove_delay=1000, worker_disconnect_delay=10)
+        sch.ping = mock.Mock()
+        class A(DummyTask):
+            x = luigi.IntParameter()
+
+        w = Worker(scheduler=sch, worker_id="foo", ping_interval=0.05)
+        for i in range(10):
+            w.add(A(x=i))  # each add_task call counts as a heartbeat
+            time.sleep(0.02)
+        w.stop()
+        self.assertEqual(0, sch.ping.call_count)
+
+    def test_ping_thread_survives_errors(self):
+        sch = CentralPlannerScheduler(retry_delay=100, remove_delay=1000, worker_disconnect_delay=10)
+        w = Worker(scheduler=sch, worker_id="foo", ping_interval=0.01)
+        w._keep_alive_thread._last_contact = None  # breaks the idle time computation
+        time.sleep(0.05)
+        self.assertTrue(w._keep_alive_thread.is_alive())
+        w.stop()
+
+    def test_ping_interval_negotiated(self):
+        sch = CentralPlannerScheduler(retry_delay=100, remove_delay=1000, worker_disconnect_delay=10)
+        w = Worker(scheduler=sch, worker_id="foo", ping_interval=0.01)
+        time.sleep(0.1)
+        w.stop()
+        self.assertEqual(2.5, w._keep_alive_thread.ping_interval)
+
     def test_ping_thread_shutdown(self):
         w = Worker(ping_interval=0.01)
         self.assertTrue(w._keep_alive_thread.is_alive())